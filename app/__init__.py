@@ -1,14 +1,24 @@
 from flask import Flask
 from flask.ext.bootstrap import Bootstrap
-from flask.ext.sqlalchemy import SQLAlchemy
 from dmutils import apiclient, init_app, flask_featureflags
 
 from config import configs
+from .caches import SerializedServiceCache, FrameworkRegistry, \
+    ArchivedDataCache
+from .encryption import PasswordHasher
+from .authentication import auth_tokens, rate_limiter
+from .replicas import RoutingSQLAlchemy
+from .instrumentation import RequestInstrumentation
 
 bootstrap = Bootstrap()
-db = SQLAlchemy()
+db = RoutingSQLAlchemy()
 search_api_client = apiclient.SearchAPIClient()
 feature_flags = flask_featureflags.FeatureFlag()
+service_cache = SerializedServiceCache()
+framework_registry = FrameworkRegistry()
+archived_data_cache = ArchivedDataCache()
+password_hasher = PasswordHasher()
+request_instrumentation = RequestInstrumentation()
 
 
 def create_app(config_name):
@@ -23,6 +33,14 @@ def create_app(config_name):
         feature_flags=feature_flags,
         search_api_client=search_api_client
     )
+    service_cache.init_app(application)
+    framework_registry.init_app(application)
+    archived_data_cache.init_app(application)
+    password_hasher.init_app(application)
+    auth_tokens.init_app(application)
+    rate_limiter.init_app(application)
+    db.replicas.init_app(application)
+    request_instrumentation.init_app(application)
 
     from .main import main as main_blueprint
     application.register_blueprint(main_blueprint)
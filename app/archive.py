@@ -0,0 +1,119 @@
+"""
+Delta encoded storage for archived versions of services
+
+The first archived version of a service is stored in full. Later versions
+are stored as a `json_diff` against the version archived before them
+(`previous_id`), with a full snapshot every
+`DM_API_ARCHIVE_SNAPSHOT_INTERVAL` versions so no version needs more than
+that many diffs applied to rebuild it. Versions archived before delta
+encoding was introduced are all snapshots.
+
+Rebuilt data is kept in `archived_data_cache`, so paging through the
+history of a service only reads each chain of diffs once.
+"""
+
+from flask import current_app
+from sqlalchemy import desc, select
+from sqlalchemy.orm import noload
+
+from . import db, archived_data_cache
+from .models import ArchivedService, Service
+from .utils import json_diff, apply_json_diff
+
+
+def archive_service(service):
+    """
+    :return: an `ArchivedService` for the current state of `service`
+    """
+    archived = ArchivedService.from_service(service)
+
+    previous = _versions().filter(
+        ArchivedService.service_id == service.service_id
+    ).order_by(
+        desc(ArchivedService.id)
+    ).first()
+    if previous is None or previous.snapshot_distance + 1 >= \
+            current_app.config['DM_API_ARCHIVE_SNAPSHOT_INTERVAL']:
+        return archived
+
+    archived.delta = json_diff(archived_data([previous])[0], service.data)
+    archived.data = None
+    archived.previous_id = previous.id
+    archived.snapshot_distance = previous.snapshot_distance + 1
+    return archived
+
+
+def archive_services(ids):
+    """
+    Archive the current state of many services with a single
+    INSERT ... SELECT. The versions are stored as snapshots, as diffing
+    them against the versions archived before would mean reading every
+    service into the application.
+    :param ids: the `Service.id`s of the services
+    """
+    columns = ['framework_id', 'service_id', 'supplier_id', 'created_at',
+               'updated_at', 'updated_by', 'updated_reason', 'data',
+               'status']
+    services = Service.__table__
+
+    db.session.execute(ArchivedService.__table__.insert().from_select(
+        columns,
+        select(
+            [services.c[column] for column in columns]
+        ).where(
+            services.c.id.in_(ids)
+        )
+    ))
+
+
+def archived_data(archived_services):
+    """
+    Rebuild the data of archived versions of services
+    :return: a list with the data of each of `archived_services`. The dicts
+             may be shared with the cache and mustn't be modified.
+    """
+    loaded = {}
+    return [_rebuild(archived, loaded) for archived in archived_services]
+
+
+def _rebuild(archived, loaded):
+    chain = []
+    version = archived
+    data = version.data
+    while data is None:
+        data = archived_data_cache.get(version.id)
+        if data is None:
+            chain.append(version)
+            version = loaded.get(version.previous_id) or \
+                _load_previous(version, loaded)
+            data = version.data
+
+    for version in reversed(chain):
+        data = apply_json_diff(data, version.delta)
+        archived_data_cache.set(version.id, data)
+    return data
+
+
+def _load_previous(version, loaded):
+    """
+    Load the versions archived before `version` back to its snapshot, in
+    one query unless versions were archived concurrently
+    """
+    for previous in _versions().filter(
+        ArchivedService.service_id == version.service_id,
+        ArchivedService.id < version.id
+    ).order_by(
+        desc(ArchivedService.id)
+    ).limit(version.snapshot_distance):
+        loaded[previous.id] = previous
+
+    if version.previous_id not in loaded:
+        loaded[version.previous_id] = _versions().get(version.previous_id)
+    return loaded[version.previous_id]
+
+
+def _versions():
+    return ArchivedService.query.options(
+        noload(ArchivedService.supplier),
+        noload(ArchivedService.framework)
+    )
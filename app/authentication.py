@@ -1,6 +1,14 @@
+import hashlib
+import hmac
+import math
 import os
+import signal
+import time
+from threading import Lock
 
-from flask import current_app, abort, request
+from flask import current_app, abort, request, g
+from werkzeug.exceptions import TooManyRequests
+from werkzeug.utils import import_string
 
 
 def requires_authentication():
@@ -12,9 +20,18 @@ def requires_authentication():
         if not token_is_valid(incoming_token):
             abort(403, incoming_token)
 
+        g.rate_limit_key = rate_limiter.acquire(incoming_token)
+
+
+def release_rate_limit(exception=None):
+    key = getattr(g, 'rate_limit_key', None)
+    if key is not None:
+        del g.rate_limit_key
+        rate_limiter.release(key)
+
 
 def token_is_valid(incoming_token):
-    return incoming_token in get_allowed_tokens_from_environment()
+    return auth_tokens.is_valid(incoming_token)
 
 
 def get_allowed_tokens_from_environment():
@@ -39,3 +56,190 @@ def get_token_from_headers(headers):
     if auth_header[:7] != 'Bearer ':
         return None
     return auth_header[7:]
+
+
+def _as_bytes(value):
+    return value if isinstance(value, bytes) else value.encode('utf-8')
+
+
+def get_allowed_tokens_from_file(path):
+    """Return a list of allowed auth tokens from the file at `path`, one
+       token per line or separated by colons as in DM_API_AUTH_TOKENS
+    """
+    with open(path) as tokens_file:
+        return tokens_file.read().replace(':', '\n').split()
+
+
+class TokenRegistry(object):
+    """The allowed auth tokens
+
+    The tokens are read from the DM_API_AUTH_TOKENS_FILE file, or the
+    DM_API_AUTH_TOKENS environment variable if no file is configured, the
+    first time they're needed. They're kept until `reload`, which also
+    runs when the process gets DM_API_AUTH_TOKENS_RELOAD_SIGNAL, so
+    tokens can be changed by rewriting the file and signalling the
+    process. Incoming tokens are compared against every allowed token in
+    constant time, so response times don't give away how much of a token
+    was right.
+    """
+
+    def __init__(self, tokens_file=None):
+        self.tokens_file = tokens_file
+        self._tokens = None
+        self._stale = True
+        self._lock = Lock()
+
+    def init_app(self, app):
+        self.tokens_file = app.config['DM_API_AUTH_TOKENS_FILE']
+        with self._lock:
+            self._tokens = None
+            self._stale = True
+        signal_name = app.config['DM_API_AUTH_TOKENS_RELOAD_SIGNAL']
+        if signal_name and hasattr(signal, signal_name):
+            try:
+                signal.signal(getattr(signal, signal_name),
+                              lambda signum, frame: self.reload())
+            except ValueError:
+                # Signal handlers can only be set from the main thread
+                pass
+
+    def reload(self):
+        """Read the tokens again the next time they're needed
+
+        This runs in the signal handler, which can interrupt a thread
+        holding the lock, so it only flags the tokens as stale.
+        """
+        self._stale = True
+
+    def tokens(self):
+        if self._stale:
+            with self._lock:
+                if self._stale:
+                    # Cleared first, so a reload while the tokens are
+                    # being read isn't lost
+                    self._stale = False
+                    try:
+                        self._tokens = self._load()
+                    except (IOError, OSError):
+                        # Keep the current tokens if the file can't be read
+                        if self._tokens is None:
+                            self._stale = True
+                            raise
+                        current_app.logger.exception(
+                            "Failed to reload auth tokens from {}".format(
+                                self.tokens_file))
+        return self._tokens
+
+    def _load(self):
+        if self.tokens_file:
+            tokens = get_allowed_tokens_from_file(self.tokens_file)
+        else:
+            tokens = get_allowed_tokens_from_environment()
+        return [_as_bytes(token) for token in tokens]
+
+    def is_valid(self, incoming_token):
+        incoming_token = _as_bytes(incoming_token)
+        valid = False
+        for token in self.tokens():
+            valid |= hmac.compare_digest(token, incoming_token)
+        return valid
+
+
+class LocalTokenBuckets(object):
+    """In-process token buckets for `RateLimiter`
+
+    Each process keeps its own buckets, so with several processes the
+    effective limit is multiplied by the number of processes. A backend
+    shared between processes can be used instead by setting
+    DM_API_RATE_LIMIT_BACKEND to the import path of a class with the
+    same `take` method.
+    """
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = Lock()
+
+    def take(self, key, rate, burst):
+        """Take a token from the bucket for `key`, which holds up to
+        `burst` tokens and is refilled with `rate` tokens a second
+        :return: 0 if a token was taken, otherwise the number of seconds
+                 until one will be available
+        """
+        now = time.time()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated_at) * rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                return 0
+            self._buckets[key] = (tokens, now)
+            return (1 - tokens) / rate
+
+
+class RateLimiter(object):
+    """Per token rate and concurrency limits
+
+    Each token gets a bucket of `burst` requests that refills at `rate`
+    requests a second, and can have at most `concurrency` requests in
+    progress in this process at once. A limit of 0 turns it off.
+    Requests over either limit raise a 429 with a Retry-After header.
+
+    Buckets are keyed on a hash of the token, so a shared backend never
+    sees the tokens themselves.
+    """
+
+    def __init__(self, rate=0, burst=0, concurrency=0, backend=None):
+        self.rate = rate
+        self.burst = burst
+        self.concurrency = concurrency
+        self.backend = backend or LocalTokenBuckets()
+        self._in_flight = {}
+        self._lock = Lock()
+
+    def init_app(self, app):
+        self.rate = app.config['DM_API_TOKEN_RATE_LIMIT']
+        self.burst = app.config['DM_API_TOKEN_RATE_LIMIT_BURST']
+        self.concurrency = app.config['DM_API_TOKEN_CONCURRENCY_LIMIT']
+        backend = app.config['DM_API_RATE_LIMIT_BACKEND']
+        self.backend = import_string(backend)() if backend \
+            else LocalTokenBuckets()
+        with self._lock:
+            self._in_flight = {}
+
+    def acquire(self, token):
+        """Start a request made with `token`
+        :return: the key to pass to `release` once the request is done
+        """
+        key = hashlib.sha256(_as_bytes(token)).hexdigest()
+
+        with self._lock:
+            in_flight = self._in_flight.get(key, 0)
+            if self.concurrency and in_flight >= self.concurrency:
+                raise too_many_requests(
+                    "Too many concurrent requests for this token", 1)
+            self._in_flight[key] = in_flight + 1
+
+        if self.rate:
+            wait = self.backend.take(key, self.rate, self.burst)
+            if wait:
+                self.release(key)
+                raise too_many_requests(
+                    "Rate limit exceeded for this token", wait)
+
+        return key
+
+    def release(self, key):
+        with self._lock:
+            in_flight = self._in_flight.pop(key, 0) - 1
+            if in_flight > 0:
+                self._in_flight[key] = in_flight
+
+
+def too_many_requests(description, retry_after):
+    error = TooManyRequests(description)
+    error.retry_after = int(math.ceil(retry_after))
+    return error
+
+
+auth_tokens = TokenRegistry()
+rate_limiter = RateLimiter()
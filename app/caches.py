@@ -0,0 +1,192 @@
+import time
+from collections import OrderedDict, namedtuple
+from threading import Lock
+
+from flask import json, request
+
+
+class SerializedServiceCache(object):
+    """Bounded LRU cache of JSON-encoded `Service.serialize()` output
+
+    Entries are stored per service id along with the version they were
+    built from: the service's `updated_at`, the supplier and framework
+    details it embeds and the host its links point at. A stale entry is
+    never served; it is replaced on the next lookup. Write paths should
+    still `invalidate` services they change so memory is released
+    straight away.
+    """
+
+    def __init__(self, maxsize=0):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def init_app(self, app):
+        self.maxsize = app.config['DM_API_SERVICE_CACHE_SIZE']
+        self.clear()
+
+    def serialize(self, service):
+        """
+        :return: the JSON encoded serialization of `service`
+        """
+        version = (
+            service.updated_at,
+            service.supplier.name,
+            service.framework.name,
+            service.framework.expired,
+            request.host_url,
+        )
+
+        with self._lock:
+            entry = self._entries.pop(service.service_id, None)
+            if entry is not None and entry[0] == version:
+                self.hits += 1
+                self._entries[service.service_id] = entry
+                return entry[1]
+            self.misses += 1
+
+        encoded = json.dumps(service.serialize())
+
+        with self._lock:
+            self._entries[service.service_id] = (version, encoded)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+        return encoded
+
+    def invalidate(self, service_id):
+        with self._lock:
+            self._entries.pop(service_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+class ArchivedDataCache(object):
+    """Bounded LRU cache of the rebuilt data of archived service versions
+
+    Archived versions never change, so entries can't go stale; the least
+    recently used are dropped once there are more than `maxsize`. The
+    cached dicts are shared between requests and mustn't be modified.
+    """
+
+    def __init__(self, maxsize=0):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def init_app(self, app):
+        self.maxsize = app.config['DM_API_ARCHIVE_CACHE_SIZE']
+        self.clear()
+
+    def get(self, archived_service_id):
+        with self._lock:
+            data = self._entries.pop(archived_service_id, None)
+            if data is not None:
+                self._entries[archived_service_id] = data
+            return data
+
+    def set(self, archived_service_id, data):
+        with self._lock:
+            self._entries[archived_service_id] = data
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+FrameworkDetails = namedtuple('FrameworkDetails', ['id', 'name', 'expired'])
+
+
+class FrameworkRegistry(object):
+    """In-process copy of the frameworks table
+
+    There are only a handful of frameworks and they rarely change, so
+    they're loaded in one query the first time they're needed and then
+    reloaded once `ttl` seconds have passed, or after `invalidate`. A
+    lookup that misses reloads them once, in case the framework was
+    added since they were loaded.
+    Frameworks are returned as `FrameworkDetails` tuples rather than
+    model instances, so they can be shared between sessions.
+    """
+
+    def __init__(self, ttl=0):
+        self.ttl = ttl
+        self._frameworks = None
+        self._loaded_at = None
+        self._lock = Lock()
+
+    def init_app(self, app):
+        self.ttl = app.config['DM_API_FRAMEWORK_CACHE_TTL']
+        self.invalidate()
+
+    def frameworks(self):
+        """
+        :return: a list of `FrameworkDetails` for every framework
+        """
+        with self._lock:
+            if self._frameworks is None or \
+                    time.time() - self._loaded_at >= self.ttl:
+                self._frameworks = self._load()
+                self._loaded_at = time.time()
+            return self._frameworks
+
+    def _load(self):
+        from . import db
+        from .models import Framework
+
+        # Lookups can happen while the caller's changes are pending
+        with db.session.no_autoflush:
+            return [
+                FrameworkDetails(*row)
+                for row in Framework.query.with_entities(
+                    Framework.id, Framework.name, Framework.expired
+                ).order_by(Framework.id)
+            ]
+
+    def live_ids(self):
+        """
+        :return: the ids of frameworks that haven't expired
+        """
+        return [framework.id for framework in self.frameworks()
+                if not framework.expired]
+
+    def get(self, framework_id):
+        return self._find(lambda framework: framework.id == framework_id)
+
+    def get_by_name(self, name):
+        return self._find(lambda framework: framework.name == name)
+
+    def _find(self, matches):
+        for framework in self.frameworks():
+            if matches(framework):
+                return framework
+
+        self.invalidate()
+        for framework in self.frameworks():
+            if matches(framework):
+                return framework
+
+    def invalidate(self):
+        with self._lock:
+            self._frameworks = None
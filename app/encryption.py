@@ -1,5 +1,8 @@
-from flask.ext.bcrypt import generate_password_hash, \
-    check_password_hash
+import time
+from multiprocessing import Pool, TimeoutError as WorkerTimeout
+from threading import Lock
+
+from flask.ext.bcrypt import generate_password_hash, check_password_hash
 
 
 def hashpw(password):
@@ -8,3 +11,117 @@ def hashpw(password):
 
 def checkpw(password, hashed_password):
     return check_password_hash(hashed_password, password)
+
+
+def _timed(func, *args):
+    """Run `func` in a pool worker, timing it there so the time spent
+    waiting for a worker isn't counted"""
+    start = time.time()
+    return func(*args), time.time() - start
+
+
+class PasswordHasherBusy(Exception):
+    pass
+
+
+class PasswordHasher(object):
+    """Runs bcrypt hashing and checking in a pool of worker processes
+
+    bcrypt is deliberately slow, so running it in the request thread lets
+    a burst of logins hold up every other request. Here at most
+    `queue_size` calls can be running or waiting for one of the
+    `processes` workers at once; any more raise `PasswordHasherBusy`
+    straight away rather than queueing behind them. Calls that get no
+    result from a worker within `timeout` seconds also raise
+    `PasswordHasherBusy`. With no processes the calls run in the calling
+    thread, still subject to `queue_size`.
+
+    The pool is started on first use, so processes that never check a
+    password don't fork any workers.
+    """
+
+    def __init__(self, processes=0, queue_size=0, timeout=None):
+        self.processes = processes
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self._pool = None
+        self._lock = Lock()
+        self._reset_stats()
+
+    def init_app(self, app):
+        self.close()
+        self.processes = app.config['DM_API_PASSWORD_HASH_PROCESSES']
+        self.queue_size = app.config['DM_API_PASSWORD_HASH_QUEUE_SIZE']
+        self.timeout = app.config['DM_API_PASSWORD_HASH_TIMEOUT']
+        with self._lock:
+            self._reset_stats()
+
+    def _reset_stats(self):
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.hash_time = 0.0
+        self.max_hash_time = 0.0
+        self.wait_time = 0.0
+
+    def hashpw(self, password):
+        return self._run(hashpw, password)
+
+    def checkpw(self, password, hashed_password):
+        return self._run(checkpw, password, hashed_password)
+
+    def _run(self, func, *args):
+        with self._lock:
+            if self.in_flight >= self.queue_size:
+                self.rejected += 1
+                raise PasswordHasherBusy()
+            self.in_flight += 1
+            if self._pool is None and self.processes:
+                self._pool = Pool(self.processes)
+            pool = self._pool
+
+        start = time.time()
+        hash_time = 0.0
+        try:
+            if pool is None:
+                result, hash_time = _timed(func, *args)
+            else:
+                result, hash_time = pool.apply_async(
+                    _timed, (func,) + args).get(self.timeout)
+            return result
+        except WorkerTimeout:
+            with self._lock:
+                self.timed_out += 1
+            raise PasswordHasherBusy()
+        finally:
+            elapsed = time.time() - start
+            with self._lock:
+                self.in_flight -= 1
+                self.completed += 1
+                self.hash_time += hash_time
+                self.max_hash_time = max(self.max_hash_time, hash_time)
+                self.wait_time += max(elapsed - hash_time, 0)
+
+    def close(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'processes': self.processes,
+                'queue_size': self.queue_size,
+                'in_flight': self.in_flight,
+                'utilisation': (float(self.in_flight) / self.queue_size
+                                if self.queue_size else 0.0),
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'timed_out': self.timed_out,
+                'hash_seconds': self.hash_time,
+                'max_hash_seconds': self.max_hash_time,
+                'wait_seconds': self.wait_time,
+            }
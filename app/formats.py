@@ -1 +1,2 @@
 DATE_FORMAT = "%Y-%m-%dT%H:%M:%S%Z"
+DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ"
@@ -0,0 +1,140 @@
+"""
+Per request timings
+
+For every request `RequestInstrumentation` logs the number of database
+queries and the time spent running them, along with the time spent in
+blocks and functions marked with `timed`: validation and serialization.
+Outside Live the timings are also sent back in a `Server-Timing` header.
+Queries that take longer than DM_API_SLOW_QUERY_THRESHOLD seconds are
+logged with their parameters and the endpoint that ran them.
+
+Query timings come from Flask-SQLAlchemy's recorded queries, so they are
+only available while SQLALCHEMY_RECORD_QUERIES is on.
+"""
+
+import time
+from functools import wraps
+
+from flask import current_app, request, has_request_context
+from flask.json import JSONEncoder
+from flask.ext.sqlalchemy import get_debug_queries
+
+TIMINGS_ENVIRON_KEY = 'dm.timings'
+TIMING_NAMES = ['validation', 'serialization']
+
+
+class timed(object):
+    """Add the time spent in a block or function to the `name` timing of
+    the current request. Time spent in a nested block with the same name
+    is only counted once.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._start = None
+
+    def __enter__(self):
+        if has_request_context():
+            timings = request.environ.setdefault(TIMINGS_ENVIRON_KEY, {})
+            depth = timings.setdefault('depth', {})
+            depth[self.name] = depth.get(self.name, 0) + 1
+            if depth[self.name] == 1:
+                self._start = time.time()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if has_request_context() and \
+                TIMINGS_ENVIRON_KEY in request.environ:
+            timings = request.environ[TIMINGS_ENVIRON_KEY]
+            timings['depth'][self.name] -= 1
+            if self._start is not None:
+                timings[self.name] = timings.get(self.name, 0) + \
+                    time.time() - self._start
+
+    def __call__(self, func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(self.name):
+                return func(*args, **kwargs)
+        return wrapper
+
+
+class TimedJSONEncoder(JSONEncoder):
+    @timed('serialization')
+    def encode(self, o):
+        return super(TimedJSONEncoder, self).encode(o)
+
+
+class RequestInstrumentation(object):
+    def __init__(self):
+        self.slow_query_threshold = None
+        self.server_timing = False
+
+    def init_app(self, app):
+        self.slow_query_threshold = \
+            app.config['DM_API_SLOW_QUERY_THRESHOLD']
+        self.server_timing = app.config['DM_API_SERVER_TIMING_HEADER']
+        app.json_encoder = TimedJSONEncoder
+        app.before_request(self.start_request)
+        app.after_request(self.finish_request)
+
+    def start_request(self):
+        # Recorded queries are kept for the whole app context, which can
+        # outlive a single request
+        request.environ[TIMINGS_ENVIRON_KEY] = {
+            'depth': {},
+            'started': time.time(),
+            'queries_before': len(get_debug_queries()),
+        }
+
+    def finish_request(self, response):
+        timings = request.environ.get(TIMINGS_ENVIRON_KEY)
+        if timings is None:
+            return response
+
+        queries = get_debug_queries()[timings['queries_before']:]
+        metrics = {
+            'db_queries': len(queries),
+            'db_time': sum(query.duration for query in queries),
+            'total_time': time.time() - timings['started'],
+        }
+        for name in TIMING_NAMES:
+            metrics['{}_time'.format(name)] = timings.get(name, 0)
+
+        current_app.logger.info(
+            '{} {} {}: {}'.format(
+                request.method, request.path, response.status_code,
+                ' '.join('{}={}'.format(key, value if key == 'db_queries'
+                                        else round(value, 4))
+                         for key, value in sorted(metrics.items()))),
+            extra=dict(metrics, endpoint=request.endpoint))
+
+        if self.slow_query_threshold is not None:
+            for query in queries:
+                if query.duration >= self.slow_query_threshold:
+                    current_app.logger.warning(
+                        'Slow query in {} ({:.3f}s): {} {!r}'.format(
+                            request.endpoint, query.duration,
+                            query.statement, query.parameters),
+                        extra={'endpoint': request.endpoint,
+                               'duration': query.duration})
+
+        if self.server_timing:
+            response.headers['Server-Timing'] = server_timing(metrics)
+        return response
+
+
+def server_timing(metrics):
+    """
+    :return: a Server-Timing header value with durations in milliseconds
+
+    >>> server_timing({'db_queries': 2, 'db_time': 0.0125})
+    'db;dur=12.5;desc="2 queries"'
+    """
+    entries = []
+    for key, value in sorted(metrics.items()):
+        if key.endswith('_time'):
+            entry = '{};dur={}'.format(key[:-5], round(value * 1000, 2))
+            if key == 'db_time':
+                entry += ';desc="{} queries"'.format(metrics['db_queries'])
+            entries.append(entry)
+    return ', '.join(entries)
@@ -0,0 +1,179 @@
+"""
+Apply RFC 6902 JSON Patch documents
+
+Patches are applied copy-on-write: only the objects and arrays on the path
+of each operation are copied, so the cost of applying a patch depends on
+the size of the change rather than of the document, and the original
+document is left untouched. Either every operation applies or a
+`JsonPatchError` is raised and nothing changes.
+
+>>> apply_patch({'a': [1, 2]}, [{'op': 'add', 'path': '/a/-', 'value': 3}])
+{'a': [1, 2, 3]}
+>>> apply_patch({'a': 1}, [{'op': 'move', 'from': '/a', 'path': '/b'}])
+{'b': 1}
+"""
+
+try:
+    string_types = basestring
+except NameError:  # Python 3
+    string_types = str
+
+JSON_PATCH_MIMETYPE = 'application/json-patch+json'
+
+
+class JsonPatchError(ValueError):
+    pass
+
+
+def apply_patch(document, operations):
+    """
+    :param operations: a list of JSON Patch operations
+    :return: a patched copy of `document`
+    """
+    if not isinstance(operations, list):
+        raise JsonPatchError("A JSON Patch must be a list of operations")
+
+    for operation in operations:
+        if not isinstance(operation, dict) or \
+                not isinstance(operation.get('path'), string_types):
+            raise JsonPatchError(
+                "Each operation must be an object with a 'path'")
+        op = operation.get('op')
+        path = parse_pointer(operation['path'])
+
+        if op in ('add', 'replace', 'test'):
+            if 'value' not in operation:
+                raise JsonPatchError(
+                    "Missing 'value' for '{}' operation".format(op))
+            value = operation['value']
+        elif op in ('move', 'copy'):
+            if not isinstance(operation.get('from'), string_types):
+                raise JsonPatchError(
+                    "Missing 'from' for '{}' operation".format(op))
+            from_path = parse_pointer(operation['from'])
+            value = resolve(document, from_path, operation['from'])
+        elif op != 'remove':
+            raise JsonPatchError("Unknown operation '{}'".format(op))
+
+        if op == 'add':
+            document = update(document, path, operation['path'], add, value)
+        elif op == 'remove':
+            document = update(document, path, operation['path'], remove)
+        elif op == 'replace':
+            document = update(document, path, operation['path'], replace,
+                              value)
+        elif op == 'move':
+            if path[:len(from_path)] == from_path and path != from_path:
+                raise JsonPatchError(
+                    "Cannot move '{}' into one of its children".format(
+                        operation['from']))
+            document = update(document, from_path, operation['from'],
+                              remove)
+            document = update(document, path, operation['path'], add, value)
+        elif op == 'copy':
+            document = update(document, path, operation['path'], add, value)
+        elif resolve(document, path, operation['path']) != value:
+            raise JsonPatchError(
+                "Test failed for path '{}'".format(operation['path']))
+
+    return document
+
+
+def parse_pointer(pointer):
+    """
+    :return: the reference tokens of an RFC 6901 JSON Pointer
+
+    >>> parse_pointer('/a~1b/c~0d/0')
+    ['a/b', 'c~d', '0']
+    """
+    if pointer == '':
+        return []
+    if not pointer.startswith('/'):
+        raise JsonPatchError("Invalid JSON Pointer '{}'".format(pointer))
+    return [token.replace('~1', '/').replace('~0', '~')
+            for token in pointer[1:].split('/')]
+
+
+def resolve(document, path, pointer):
+    for token in path:
+        document = child(document, token, pointer)
+    return document
+
+
+def child(container, token, pointer):
+    if isinstance(container, dict):
+        if token in container:
+            return container[token]
+    elif isinstance(container, list):
+        index = array_index(container, token, pointer)
+        if index < len(container):
+            return container[index]
+    raise JsonPatchError("Path '{}' does not exist".format(pointer))
+
+
+def array_index(array, token, pointer, allow_end=False):
+    if token == '-' and allow_end:
+        return len(array)
+    if not token.isdigit() or (token.startswith('0') and token != '0'):
+        raise JsonPatchError("Invalid array index in '{}'".format(pointer))
+    index = int(token)
+    if index > len(array) or (index == len(array) and not allow_end):
+        raise JsonPatchError("Path '{}' does not exist".format(pointer))
+    return index
+
+
+def update(document, path, pointer, change, *args):
+    """
+    :return: a copy of `document` with `change` applied to the container
+             `path` points into, copying only the containers on the path
+    """
+    if not path:
+        return change(None, None, pointer, *args)
+
+    container = copy_container(document, pointer)
+    if len(path) == 1:
+        change(container, path[0], pointer, *args)
+    else:
+        token = path[0]
+        value = child(container, token, pointer)
+        key = token if isinstance(container, dict) else int(token)
+        container[key] = update(value, path[1:], pointer, change, *args)
+    return container
+
+
+def copy_container(value, pointer):
+    if isinstance(value, dict):
+        return dict(value)
+    if isinstance(value, list):
+        return list(value)
+    raise JsonPatchError("Path '{}' does not exist".format(pointer))
+
+
+def add(container, token, pointer, value):
+    if container is None:
+        return value
+    if isinstance(container, dict):
+        container[token] = value
+    else:
+        container.insert(
+            array_index(container, token, pointer, allow_end=True), value)
+
+
+def remove(container, token, pointer):
+    if container is None:
+        raise JsonPatchError("Cannot remove the whole document")
+    child(container, token, pointer)
+    if isinstance(container, dict):
+        del container[token]
+    else:
+        del container[int(token)]
+
+
+def replace(container, token, pointer, value):
+    if container is None:
+        return value
+    child(container, token, pointer)
+    if isinstance(container, dict):
+        container[token] = value
+    else:
+        container[int(token)] = value
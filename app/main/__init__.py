@@ -1,10 +1,13 @@
 from flask import Blueprint
 
-from ..authentication import requires_authentication
+from .. import db
+from ..authentication import requires_authentication, release_rate_limit
 
 main = Blueprint('main', __name__)
 
 main.before_request(requires_authentication)
+main.teardown_request(release_rate_limit)
+main.before_request(db.replicas.route_request)
 
 
 @main.after_request
@@ -27,7 +27,18 @@ def page_not_found(e):
     return jsonify(error=e.description or "Not found"), 404
 
 
+@main.app_errorhandler(429)
+def too_many_requests(e):
+    return jsonify(error=e.description), 429, \
+        [('Retry-After', str(getattr(e, 'retry_after', 1)))]
+
+
 @main.app_errorhandler(500)
 def internal_server_error(e):
     # TODO: log the error
     return jsonify(error="Internal error"), 500
+
+
+@main.app_errorhandler(503)
+def service_unavailable(e):
+    return jsonify(error=e.description), 503, [('Retry-After', '1')]
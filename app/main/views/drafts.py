@@ -5,12 +5,14 @@ from sqlalchemy import asc
 from sqlalchemy.types import String
 
 from .. import main
-from ... import db
+from ... import db, service_cache
+from ...archive import archive_service
 from ...validation import is_valid_service_id_or_400
-from ...models import Service, DraftService, ArchivedService, Supplier
+from ...models import Service, DraftService, Supplier, service_read_options
 from ...service_utils import validate_and_return_updater_request, \
     update_and_validate_service, validate_and_return_service_request, \
-    index_service
+    index_service, is_json_patch_request, validate_and_return_json_patch, \
+    validate_and_return_updater_headers, patch_service_data
 
 
 @main.route('/services/<string:service_id>/draft', methods=['PUT'])
@@ -43,20 +45,29 @@ def create_draft_service(service_id):
 @main.route('/services/<string:service_id>/draft', methods=['POST'])
 def edit_draft_service(service_id):
     """
-    Edit a draft service
+    Edit a draft service, with either a `services` object or a JSON Patch
+    (see `update_service`)
     :param service_id:
     :return:
     """
 
     is_valid_service_id_or_400(service_id)
 
-    updater_json = validate_and_return_updater_request()
-    update_json = validate_and_return_service_request(service_id)
+    if is_json_patch_request():
+        operations = validate_and_return_json_patch()
+        updater_json = validate_and_return_updater_headers()
+        update_json = {}
+    else:
+        updater_json = validate_and_return_updater_request()
+        update_json = validate_and_return_service_request(service_id)
 
     draft = DraftService.query.filter(
         DraftService.service_id == service_id
     ).first_or_404()
 
+    if is_json_patch_request():
+        draft.data = patch_service_data(draft.data, operations)
+
     draft.update_from_json(
         update_json,
         updated_by=updater_json['updated_by'],
@@ -88,7 +99,9 @@ def list_drafts():
     if not supplier:
         abort(404, "supplier_id '%d' not found" % supplier_id)
 
-    services = DraftService.query.order_by(
+    services = DraftService.query.options(
+        *service_read_options(DraftService)
+    ).order_by(
         asc(DraftService.framework_id),
         asc(DraftService.data['lot'].cast(String).label('data_lot')),
         asc(DraftService.data['serviceName'].
@@ -112,7 +125,9 @@ def fetch_draft_service(service_id):
 
     is_valid_service_id_or_400(service_id)
 
-    draft = DraftService.query.filter(
+    draft = DraftService.query.options(
+        *service_read_options(DraftService)
+    ).filter(
         DraftService.service_id == service_id
     ).first_or_404()
 
@@ -161,19 +176,22 @@ def publish_draft_service(service_id):
         DraftService.service_id == service_id
     ).first_or_404()
 
-    service = Service.query.filter(
+    service = Service.query.options(
+        *service_read_options()
+    ).filter(
         Service.service_id == draft.service_id
-    ).first_or_404()
+    ).with_for_update(of=Service).first_or_404()
 
-    archived_service = ArchivedService.from_service(service)
+    archived_service = archive_service(service)
     new_service = update_and_validate_service(
         service,
-        draft.data,
+        service.merged_data(draft.data),
         updater_json)
 
     db.session.add(archived_service)
     db.session.add(new_service)
     db.session.delete(draft)
+    index_service(new_service)
 
     try:
         db.session.commit()
@@ -181,6 +199,6 @@ def publish_draft_service(service_id):
         db.session.rollback()
         abort(400, "Database Error: {0}".format(e))
 
-    index_service(new_service)
+    service_cache.invalidate(new_service.service_id)
 
     return jsonify(services=new_service.serialize()), 200
@@ -1,21 +1,30 @@
 from datetime import datetime
 
-from flask import jsonify, abort, request, current_app
+from flask import jsonify, abort, request, current_app, json, Response, \
+    stream_with_context
 
 from .. import main
-from ... import db
-from ...models import ArchivedService, Service, Supplier, Framework
+from ... import db, service_cache, framework_registry, formats
+from ...models import ArchivedService, Service, Supplier, \
+    service_read_options
 
-from sqlalchemy import asc
+from sqlalchemy import asc, desc, tuple_
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.sql.expression import false
-from ...validation import detect_framework_or_400, is_valid_service_id_or_400
+from ...archive import archive_service, archive_services, archived_data
+from ...validation import detect_framework_or_400, \
+    is_valid_service_id_or_400, is_valid_service_id, \
+    detect_framework_with_errors, reason_for_failure
 from ...utils import url_for, pagination_links, \
-    drop_foreign_fields, display_list
+    drop_foreign_fields, display_list, KeysetPage, keyset_filter, \
+    encode_cursor, decode_cursor, make_etag, is_not_modified, \
+    not_modified, with_validators, get_json_from_request, \
+    json_has_required_keys, string_types
 from ...service_utils import validate_and_return_service_request, \
-    update_and_validate_service, index_service, \
-    delete_service_from_index, validate_and_return_updater_request
-from sqlalchemy.types import String
+    update_and_validate_service, index_service, index_services, \
+    delete_service_from_index, validate_and_return_updater_request, \
+    jsonify_services, is_json_patch_request, validate_and_return_json_patch, \
+    validate_and_return_updater_headers, patch_service_data, \
+    queue_search_index_tasks
 
 
 @main.route('/')
@@ -35,21 +44,86 @@ def list_services():
     except ValueError:
         abort(400, "Invalid page argument")
 
-    supplier_id = request.args.get('supplier_id')
+    services = Service.query.options(
+        *service_read_options()
+    ).filter(
+        Service.framework_id.in_(framework_registry.live_ids())
+    ).order_by(
+        *[asc(column) for column in Service.ordering()]
+    )
+
+    services, supplier_id = filter_services_by_request_args(services)
+
+    if supplier_id is not None:
+        return jsonify_services(services.all(), links=dict())
+
+    if 'cursor' in request.args:
+        services = keyset_paginate_services(
+            services,
+            request.args['cursor'],
+            per_page=current_app.config['DM_API_SERVICES_PAGE_SIZE'],
+        )
+    else:
+        services = services.paginate(
+            page=page,
+            per_page=current_app.config['DM_API_SERVICES_PAGE_SIZE'],
+        )
+
+    return jsonify_services(
+        services.items,
+        links=pagination_links(
+            services,
+            '.list_services',
+            request.args
+        )
+    )
+
+
+@main.route('/services/export', methods=['GET'])
+def export_services():
+    """
+    Stream every service on a live framework as newline-delimited JSON,
+    one `Service.serialize()` document per line. Accepts the same
+    `status` and `supplier_id` filters as `list_services`.
 
+    Rows are read through a server-side cursor in batches, so memory use
+    does not grow with the size of the catalogue.
+    """
     services = Service.query.filter(
-        Service.framework.has(Framework.expired == false())
+        Service.framework_id.in_(framework_registry.live_ids())
     ).order_by(
-        asc(Service.framework_id),
-        asc(Service.data['lot'].cast(String).label('data_lot')),
-        asc(Service.data['serviceName'].cast(String).label('data_servicename'))
+        asc(Service.id)
+    )
+
+    services, _ = filter_services_by_request_args(services)
+
+    services = services.options(
+        *service_read_options()
+    ).yield_per(
+        current_app.config['DM_API_SERVICES_EXPORT_BATCH_SIZE']
     )
 
+    def generate():
+        for service in services:
+            yield json.dumps(service.serialize()) + '\n'
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson'
+    )
+
+
+def filter_services_by_request_args(services):
+    """
+    Apply the `status` and `supplier_id` query string filters
+    :return: the filtered query and the supplier id, if one was given
+    """
     if request.args.get('status'):
-        services = Service.query.filter(
+        services = services.filter(
             Service.status.in_(request.values.getlist('status'))
         )
 
+    supplier_id = request.args.get('supplier_id')
     if supplier_id is not None:
         try:
             supplier_id = int(supplier_id)
@@ -61,25 +135,34 @@ def list_services():
         if not supplier:
             abort(404, "supplier_id '%d' not found" % supplier_id)
 
-        items = services.filter(Service.supplier_id == supplier_id).all()
-        return jsonify(
-            services=[service.serialize() for service in items],
-            links=dict()
-        )
+        services = services.filter(Service.supplier_id == supplier_id)
 
-    services = services.paginate(
-        page=page,
-        per_page=current_app.config['DM_API_SERVICES_PAGE_SIZE'],
-    )
+    return services, supplier_id
 
-    return jsonify(
-        services=[service.serialize() for service in services.items],
-        links=pagination_links(
-            services,
-            '.list_services',
-            request.args
+
+def keyset_paginate_services(services, cursor, per_page):
+    """
+    Fetch the page of `services` that follows `cursor`. An empty cursor
+    starts from the beginning of the listing.
+
+    Unlike `paginate` there is no COUNT and no OFFSET: each page is a
+    range scan on `ix_service_ordering` starting after the last row of
+    the previous page.
+    """
+    ordering = Service.ordering()
+    if cursor:
+        services = services.filter(
+            keyset_filter(ordering, decode_cursor(cursor, len(ordering)))
         )
-    )
+
+    items = services.limit(per_page + 1).all()
+
+    next_cursor = None
+    if len(items) > per_page:
+        items = items[:per_page]
+        next_cursor = encode_cursor(items[-1].ordering_key())
+
+    return KeysetPage(items, next_cursor)
 
 
 @main.route('/archived-services', methods=['GET'])
@@ -99,7 +182,13 @@ def list_archived_services_by_service_id():
     except ValueError:
         abort(400, "Invalid page argument")
 
-    services = ArchivedService.query.filter(Service.service_id == service_id)
+    services = ArchivedService.query.options(
+        *service_read_options(ArchivedService)
+    ).filter(
+        ArchivedService.service_id == service_id
+    ).order_by(
+        asc(ArchivedService.id)
+    )
 
     services = services.paginate(
         page=page,
@@ -109,37 +198,118 @@ def list_archived_services_by_service_id():
     if request.args and not services.items:
         abort(404)
     return jsonify(
-        services=[service.serialize() for service in services.items],
+        services=[
+            service.serialize(data) for service, data in
+            zip(services.items, archived_data(services.items))
+        ],
         links=pagination_links(
             services,
-            '.list_services',
+            '.list_archived_services_by_service_id',
             request.args
         )
     )
 
 
+@main.route('/services/<string:service_id>/archived', methods=['GET'])
+def list_service_history(service_id):
+    """
+    Retrieves the archived versions of a service, newest first, a page at
+    a time. Pages are fetched by keyset pagination on
+    `ix_archived_services_history`, so the cost of a page doesn't depend
+    on how far into the history it is.
+    :param service_id:
+    :query_param cursor: the `next` link of the previous page
+    :return: List[service]
+    """
+    is_valid_service_id_or_400(service_id)
+
+    services = ArchivedService.query.options(
+        *service_read_options(ArchivedService)
+    ).filter(
+        ArchivedService.service_id == service_id
+    ).order_by(
+        desc(ArchivedService.updated_at),
+        desc(ArchivedService.id)
+    )
+
+    cursor = request.args.get('cursor')
+    if cursor:
+        updated_at, archived_service_id = decode_cursor(cursor, 2)
+        try:
+            updated_at = datetime.strptime(updated_at,
+                                           formats.DATETIME_FORMAT)
+            archived_service_id = int(archived_service_id)
+        except (TypeError, ValueError):
+            abort(400, "Invalid cursor argument")
+        services = services.filter(
+            tuple_(ArchivedService.updated_at, ArchivedService.id) <
+            tuple_(updated_at, archived_service_id)
+        )
+
+    per_page = current_app.config['DM_API_SERVICES_PAGE_SIZE']
+    items = services.limit(per_page + 1).all()
+    if not items and not cursor:
+        abort(404)
+
+    next_cursor = None
+    if len(items) > per_page:
+        items = items[:per_page]
+        next_cursor = encode_cursor([
+            items[-1].updated_at.strftime(formats.DATETIME_FORMAT),
+            items[-1].id,
+        ])
+
+    return jsonify(
+        services=[
+            service.serialize(data)
+            for service, data in zip(items, archived_data(items))
+        ],
+        links=pagination_links(
+            KeysetPage(items, next_cursor),
+            '.list_service_history',
+            dict(request.args.items(), service_id=service_id)
+        )
+    )
+
+
 @main.route('/services/<string:service_id>', methods=['POST'])
 def update_service(service_id):
     """
         Update a service. Looks service up in DB, and updates the JSON listing.
+
+        The update is either a `services` object whose fields replace the
+        ones in the listing, or an `application/json-patch+json` request
+        whose body is a JSON Patch of the listing.
     """
 
     is_valid_service_id_or_400(service_id)
 
-    service = Service.query.filter(
+    service = Service.query.options(
+        *service_read_options()
+    ).filter(
         Service.service_id == service_id
-    ).first_or_404()
+    ).with_for_update(of=Service).first_or_404()
+
+    if is_json_patch_request():
+        operations = validate_and_return_json_patch()
+        updater_json = validate_and_return_updater_headers()
+        data = patch_service_data(service.data, operations)
+    else:
+        service_json = validate_and_return_service_request(service_id)
+        updater_json = validate_and_return_updater_request()
+        data = service.merged_data(service_json)
+
+    # Resending a listing as it is stored doesn't archive or reindex it
+    if not service.is_changed_by(data):
+        return jsonify(message="done", changed=False), 200
 
-    service_to_archive = ArchivedService.from_service(service)
+    service_to_archive = archive_service(service)
 
     db.session.add(
-        update_and_validate_service(
-            service,
-            validate_and_return_service_request(service_id),
-            validate_and_return_updater_request()
-        )
+        update_and_validate_service(service, data, updater_json)
     )
     db.session.add(service_to_archive)
+    index_service(service)
 
     try:
         db.session.commit()
@@ -147,9 +317,9 @@ def update_service(service_id):
         db.session.rollback()
         abort(400, e.orig)
 
-    index_service(service)
+    service_cache.invalidate(service.service_id)
 
-    return jsonify(message="done"), 200
+    return jsonify(message="done", changed=True), 200
 
 
 @main.route('/services/<string:service_id>', methods=['PUT'])
@@ -188,9 +358,9 @@ def import_service(service_id):
     if supplier is None:
         abort(400, "Key (supplierId)=({}) is not present".format(supplier_id))
 
-    framework = Framework.query.filter(
-        Framework.name == framework
-    ).first()
+    framework = framework_registry.get_by_name(framework)
+    if framework is None:
+        abort(400, "Unknown framework")
 
     service = Service(service_id=service_id)
     service.supplier_id = supplier_id
@@ -201,8 +371,10 @@ def import_service(service_id):
     service.updated_by = updater_json['updated_by']
     service.updated_reason = updater_json['update_reason']
     service.data = service_data
+    service.update_content_hash()
 
     db.session.add(service)
+    index_service(service)
 
     try:
         db.session.commit()
@@ -210,21 +382,178 @@ def import_service(service_id):
         db.session.rollback()
         abort(400, "Database Error: {0}".format(e))
 
-    index_service(service)
-
     return jsonify(services=service.serialize()), 201
 
 
+@main.route('/services/bulk-import', methods=['POST'])
+def bulk_import_services():
+    """Import a batch of services from legacy digital marketplace
+
+    The bulk version of `import_service`: suppliers and frameworks are
+    looked up once for the whole batch and every valid service is inserted
+    in a single transaction. Services that can't be imported are reported
+    in the per-service results instead of failing the whole batch.
+    """
+    updater_json = validate_and_return_updater_request()
+    json_payload = get_json_from_request()
+    json_has_required_keys(json_payload, ['services'])
+
+    listings = json_payload['services']
+    if not isinstance(listings, list):
+        abort(400, "Invalid JSON; 'services' must be a list")
+    limit = current_app.config['DM_API_SERVICES_BULK_IMPORT_LIMIT']
+    if len(listings) > limit:
+        abort(400, "Cannot import more than {} services at once".format(
+            limit))
+
+    results = []
+    services = []
+    for listing in listings:
+        result, service, framework_name = validate_import_listing(listing)
+        results.append(result)
+        if service is not None:
+            services.append((result, service, framework_name))
+
+    existing_service_ids, supplier_names, frameworks = set(), {}, {}
+    if services:
+        existing_service_ids.update(
+            service_id for service_id, in Service.query.with_entities(
+                Service.service_id
+            ).filter(
+                Service.service_id.in_(
+                    [service['service_id'] for _, service, _ in services])
+            )
+        )
+        supplier_names.update(Supplier.query.with_entities(
+            Supplier.supplier_id, Supplier.name
+        ).filter(
+            Supplier.supplier_id.in_(
+                set(service['supplier_id'] for _, service, _ in services))
+        ))
+        frameworks.update(
+            (framework.name, framework)
+            for framework in framework_registry.frameworks()
+        )
+
+    now = datetime.utcnow()
+    created = []
+    for result, service, framework_name in services:
+        if service['service_id'] in existing_service_ids:
+            result.update(status=400, error="Service already exists")
+        elif service['supplier_id'] not in supplier_names:
+            result.update(
+                status=400,
+                error="Key (supplierId)=({}) is not present".format(
+                    service['supplier_id']))
+        elif framework_name not in frameworks:
+            result.update(
+                status=400,
+                error="Framework '{}' is not present".format(framework_name))
+        else:
+            # Later duplicates of a service ID in the batch are rejected
+            existing_service_ids.add(service['service_id'])
+            result['status'] = 201
+            service.update(
+                framework_id=frameworks[framework_name].id,
+                content_hash=Service.hash_content(service['data'],
+                                                  service['status']),
+                created_at=now,
+                updated_at=now,
+                updated_by=updater_json['updated_by'],
+                updated_reason=updater_json['update_reason'])
+            created.append((service, framework_name))
+
+    if created:
+        try:
+            db.session.execute(Service.__table__.insert(),
+                               [service for service, _ in created])
+            index_services([
+                service['service_id'] for service, framework_name in created
+                if service['status'] == 'published' and
+                not frameworks[framework_name].expired
+            ])
+            db.session.commit()
+        except IntegrityError as e:
+            db.session.rollback()
+            abort(400, "Database Error: {0}".format(e))
+
+    return jsonify(results=results), 200
+
+
+def validate_import_listing(listing):
+    """
+    Validate one of the services in a bulk import without aborting
+
+    :return: a (result, service, framework name) tuple, where service is
+             the values for a new `services` row, or None along with an
+             error result if the listing isn't valid
+    """
+    if not isinstance(listing, dict):
+        return {'id': None, 'status': 400,
+                'error': "Invalid JSON; must be a valid JSON object"}, \
+            None, None
+
+    service_id = u'{}'.format(listing.get('id', ''))
+    result = {'id': service_id}
+    if not is_valid_service_id(service_id):
+        result.update(status=400, error="Invalid service ID supplied: {}"
+                      .format(service_id))
+        return result, None, None
+
+    service_data = drop_foreign_fields(
+        listing,
+        ['supplierName', 'links', 'frameworkName']
+    )
+    framework, errors = detect_framework_with_errors(service_data)
+    if not framework:
+        result.update(status=400, error="JSON was not a valid format. {}"
+                      .format(reason_for_failure(service_data, errors)))
+        return result, None, None
+
+    service_data = drop_foreign_fields(service_data, ['id'])
+    try:
+        supplier_id = int(service_data.pop('supplierId'))
+    except (KeyError, TypeError, ValueError):
+        result.update(status=400, error="Invalid supplierId")
+        return result, None, None
+
+    return result, {
+        'service_id': service_id,
+        'supplier_id': supplier_id,
+        'status': service_data.pop('status', 'published'),
+        'data': service_data,
+    }, framework
+
+
 @main.route('/services/<string:service_id>', methods=['GET'])
 def get_service(service_id):
     is_valid_service_id_or_400(service_id)
 
-    service = Service.query.filter(
-        Service.service_id == service_id) \
-        .filter(Service.framework.has(Framework.expired == false())) \
-        .first_or_404()
+    # Everything the serialized service depends on apart from `data`,
+    # which only changes along with `updated_at`
+    live_framework_ids = framework_registry.live_ids()
+    updated_at, supplier_name, framework_id = Service.query.with_entities(
+        Service.updated_at, Supplier.name, Service.framework_id
+    ).join(
+        Service.supplier
+    ).filter(
+        Service.service_id == service_id,
+        Service.framework_id.in_(live_framework_ids)
+    ).first_or_404()
+
+    etag = make_etag(service_id, updated_at.isoformat(), supplier_name,
+                     framework_registry.get(framework_id).name)
+    if is_not_modified(etag):
+        return not_modified(etag)
+
+    service = Service.query.options(
+        *service_read_options()
+    ).filter(
+        Service.service_id == service_id,
+        Service.framework_id.in_(live_framework_ids)
+    ).first_or_404()
 
-    return jsonify(services=service.serialize())
+    return with_validators(jsonify_services(service), etag)
 
 
 @main.route('/archived-services/<int:archived_service_id>', methods=['GET'])
@@ -235,11 +564,32 @@ def get_archived_service(archived_service_id):
     :return: service
     """
 
-    service = ArchivedService.query.filter(
+    service = ArchivedService.query.options(
+        *service_read_options(ArchivedService)
+    ).filter(
         ArchivedService.id == archived_service_id
     ).first_or_404()
 
-    return jsonify(services=service.serialize())
+    return jsonify(services=service.serialize(archived_data([service])[0]))
+
+
+# Statuses are defined in the Supplier model
+VALID_STATUSES = [
+    "published",
+    "enabled",
+    "disabled"
+]
+
+
+def is_valid_status_or_400(status):
+    if status not in VALID_STATUSES:
+        valid_statuses_single_quotes = display_list(
+            ["\'{}\'".format(vstatus) for vstatus in VALID_STATUSES]
+        )
+        abort(400, "\'{0}\' is not a valid status. "
+                   "Valid statuses are {1}"
+              .format(status, valid_statuses_single_quotes)
+              )
 
 
 @main.route(
@@ -254,34 +604,25 @@ def update_service_status(service_id, status):
     :return: the newly updated service in the response
     """
 
-    # Statuses are defined in the Supplier model
-    valid_statuses = [
-        "published",
-        "enabled",
-        "disabled"
-    ]
-
     is_valid_service_id_or_400(service_id)
 
     service = Service.query.filter(
         Service.service_id == service_id
     ).first_or_404()
 
-    service_to_archive = ArchivedService.from_service(service)
     update_json = validate_and_return_updater_request()
 
-    if status not in valid_statuses:
-        valid_statuses_single_quotes = display_list(
-            ["\'{}\'".format(vstatus) for vstatus in valid_statuses]
-        )
-        abort(400, "\'{0}\' is not a valid status. "
-                   "Valid statuses are {1}"
-              .format(status, valid_statuses_single_quotes)
-              )
+    is_valid_status_or_400(status)
+
+    if not service.is_changed_by(service.data, status):
+        return jsonify(services=service.serialize(), changed=False), 200
+
+    service_to_archive = archive_service(service)
 
     now = datetime.utcnow()
     prior_status = service.status
     service.status = status
+    service.update_content_hash()
     service.updated_at = now
     service.updated_by = update_json['updated_by']
     service.updated_reason = update_json['update_reason']
@@ -289,8 +630,6 @@ def update_service_status(service_id, status):
     db.session.add(service)
     db.session.add(service_to_archive)
 
-    db.session.commit()
-
     if prior_status != status:
 
         # If it's being unpublished, delete it from the search api.
@@ -300,4 +639,89 @@ def update_service_status(service_id, status):
             # If it's being published, index in the search api.
             index_service(service)
 
-    return jsonify(services=service.serialize()), 200
+    db.session.commit()
+    service_cache.invalidate(service.service_id)
+
+    return jsonify(services=service.serialize(), changed=True), 200
+
+
+@main.route('/services/status', methods=['POST'])
+def update_services_status():
+    """
+    Change the status of many services at once, selected by a list of
+    `serviceIds` and/or by `supplierId` and `frameworkName`
+
+    The selected services that don't already have the new status are
+    archived, updated and queued for the search index with one statement
+    each, rather than a request per service.
+    :return: the ids of the services whose status changed
+    """
+    updater_json = validate_and_return_updater_request()
+    json_payload = get_json_from_request()
+    json_has_required_keys(json_payload, ['status'])
+    status = json_payload['status']
+    is_valid_status_or_400(status)
+
+    services = Service.query.with_entities(
+        Service.id, Service.service_id
+    ).filter(
+        Service.status != status
+    )
+
+    if not any(key in json_payload for key in
+               ['serviceIds', 'supplierId', 'frameworkName']):
+        abort(400, "Services must be selected by serviceIds, supplierId "
+                   "or frameworkName")
+    if 'serviceIds' in json_payload:
+        service_ids = json_payload['serviceIds']
+        if not isinstance(service_ids, list) or not all(
+                isinstance(service_id, string_types)
+                for service_id in service_ids):
+            abort(400,
+                  "Invalid JSON; 'serviceIds' must be a list of strings")
+        for service_id in service_ids:
+            is_valid_service_id_or_400(service_id)
+        services = services.filter(Service.service_id.in_(service_ids))
+    if 'supplierId' in json_payload:
+        try:
+            supplier_id = int(json_payload['supplierId'])
+        except (TypeError, ValueError):
+            abort(400, "Invalid supplierId: {}".format(
+                json_payload['supplierId']))
+        services = services.filter(Service.supplier_id == supplier_id)
+    if 'frameworkName' in json_payload:
+        framework = framework_registry.get_by_name(
+            json_payload['frameworkName'])
+        if framework is None:
+            abort(400, "Framework '{}' is not present".format(
+                json_payload['frameworkName']))
+        services = services.filter(Service.framework_id == framework.id)
+
+    services = services.with_for_update(of=Service).all()
+    ids = [service.id for service in services]
+
+    if ids:
+        archive_services(ids)
+        if status == 'published':
+            queue_search_index_tasks('index', ids,
+                                     framework_registry.live_ids())
+        else:
+            queue_search_index_tasks('delete', ids, status='published')
+
+        Service.query.filter(
+            Service.id.in_(ids)
+        ).update({
+            'status': status,
+            'content_hash': None,
+            'updated_at': datetime.utcnow(),
+            'updated_by': updater_json['updated_by'],
+            'updated_reason': updater_json['update_reason'],
+        }, synchronize_session=False)
+
+        db.session.commit()
+
+    service_ids = [service.service_id for service in services]
+    for service_id in service_ids:
+        service_cache.invalidate(service_id)
+
+    return jsonify(serviceIds=service_ids), 200
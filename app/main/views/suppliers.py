@@ -1,15 +1,17 @@
-from flask import jsonify, abort, request, current_app
+from flask import jsonify, abort, request, current_app, json
 from sqlalchemy.exc import IntegrityError
 
 from .. import main
 from ... import db
-from ...models import Supplier, ContactInformation, AuditEvent
+from ...models import Supplier, ContactInformation, AuditEvent, \
+    supplier_list_options
 from ...validation import (
     validate_supplier_json_or_400,
     validate_contact_information_json_or_400
 )
 from ...utils import pagination_links, drop_foreign_fields, \
-    get_json_from_request, json_has_required_keys, json_has_matching_id
+    get_json_from_request, json_has_required_keys, json_has_matching_id, \
+    make_etag, is_not_modified, not_modified, with_validators
 
 
 @main.route('/suppliers', methods=['GET'])
@@ -21,7 +23,9 @@ def list_suppliers():
 
     prefix = request.args.get('prefix', '')
 
-    suppliers = Supplier.query.order_by(Supplier.name)
+    suppliers = Supplier.query.options(
+        *supplier_list_options()
+    ).order_by(Supplier.name)
 
     if prefix:
         if prefix == 'other':
@@ -55,7 +59,14 @@ def get_supplier(supplier_id):
         Supplier.supplier_id == supplier_id
     ).first_or_404()
 
-    return jsonify(suppliers=supplier.serialize())
+    # Suppliers have no modification timestamp, so the tag is a hash of
+    # the serialized supplier and only saves sending the body
+    serialized = supplier.serialize()
+    etag = make_etag(json.dumps(serialized, sort_keys=True))
+    if is_not_modified(etag):
+        return not_modified(etag)
+
+    return with_validators(jsonify(suppliers=serialized), etag)
 
 
 # Route to insert new Suppliers, not update existing ones
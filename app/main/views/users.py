@@ -3,14 +3,23 @@ from sqlalchemy.exc import IntegrityError
 from flask import jsonify, abort, request
 
 from .. import main
-from ... import db, encryption
-from ...models import User
+from ... import db, password_hasher
+from ...encryption import PasswordHasherBusy
+from ...models import User, Supplier
 from ...utils import get_json_from_request, json_has_required_keys, \
-    json_has_matching_id
+    json_has_matching_id, make_etag, is_not_modified, not_modified, \
+    with_validators
 from ...validation import validate_user_json_or_400, \
     validate_user_auth_json_or_400
 
 
+def run_password_hasher(method, *args):
+    try:
+        return method(*args)
+    except PasswordHasherBusy:
+        abort(503, "Too many password checks in progress")
+
+
 @main.route('/users/auth', methods=['POST'])
 def auth_user():
     json_payload = get_json_from_request()
@@ -23,7 +32,8 @@ def auth_user():
 
     if user is None:
         return jsonify(authorization=False), 404
-    elif encryption.checkpw(json_payload['password'], user.password):
+    elif run_password_hasher(password_hasher.checkpw,
+                             json_payload['password'], user.password):
         return jsonify(users=user.serialize()), 200
     else:
         return jsonify(authorization=False), 403
@@ -31,10 +41,22 @@ def auth_user():
 
 @main.route('/users/<int:user_id>', methods=['GET'])
 def get_user_by_id(user_id):
+    updated_at, supplier_name = User.query.with_entities(
+        User.updated_at, Supplier.name
+    ).outerjoin(
+        User.supplier
+    ).filter(
+        User.id == user_id
+    ).first_or_404()
+
+    etag = make_etag(user_id, updated_at.isoformat(), supplier_name)
+    if is_not_modified(etag):
+        return not_modified(etag)
+
     user = User.query.filter(
         User.id == user_id
     ).first_or_404()
-    return jsonify(users=user.serialize())
+    return with_validators(jsonify(users=user.serialize()), etag)
 
 
 @main.route('/users', methods=['GET'])
@@ -65,7 +87,8 @@ def create_user():
     if 'hashpw' in json_payload and not json_payload['hashpw']:
         password = json_payload['password']
     else:
-        password = encryption.hashpw(json_payload['password'])
+        password = run_password_hasher(password_hasher.hashpw,
+                                       json_payload['password'])
 
     now = datetime.utcnow()
     user = User(
@@ -112,7 +135,8 @@ def update_user(user_id):
     now = datetime.utcnow()
     user.updated_at = now
     if 'password' in user_update:
-        user.password = encryption.hashpw(user_update['password'])
+        user.password = run_password_hasher(password_hasher.hashpw,
+                                            user_update['password'])
         user.password_changed_at = now
     if 'active' in user_update:
         user.active = user_update['active']
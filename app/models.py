@@ -1,11 +1,17 @@
+import json
 from datetime import datetime
 
-from sqlalchemy.dialects.postgresql import JSON
+from sqlalchemy import String, bindparam, cast
+from sqlalchemy.dialects.postgresql import JSON, JSONB
+from sqlalchemy.orm import defaultload, subqueryload
+from sqlalchemy.orm.attributes import set_committed_value
 from sqlalchemy_utils import generic_relationship
 
 from . import db
 from . import formats
-from .utils import link, url_for
+from .instrumentation import timed
+from .utils import link, url_for, make_etag, drop_foreign_fields, \
+    json_diff
 
 
 class Framework(db.Model):
@@ -65,6 +71,7 @@ class ContactInformation(db.Model):
 
         return self
 
+    @timed('serialization')
     def serialize(self):
         links = link(
             "self", url_for(".update_contact_information",
@@ -115,6 +122,7 @@ class Supplier(db.Model):
 
     clients = db.Column(JSON, default=list)
 
+    @timed('serialization')
     def serialize(self):
         links = link(
             "self", url_for(".get_supplier", supplier_id=self.supplier_id)
@@ -177,6 +185,7 @@ class User(db.Model):
 
     supplier = db.relationship(Supplier, lazy='joined', innerjoin=False)
 
+    @timed('serialization')
     def serialize(self):
         user = {
             'id': self.id,
@@ -217,7 +226,11 @@ class Service(db.Model):
                            nullable=False)
     updated_reason = db.Column(db.String, index=False, unique=False,
                                nullable=False)
-    data = db.Column(JSON)
+    data = db.Column(JSONB)
+    # See `hash_content`; NULL for services that haven't been written
+    # since it was added or whose status was last changed in bulk
+    content_hash = db.Column(db.String, index=False, unique=False,
+                             nullable=True)
 
     framework_id = db.Column(db.BigInteger,
                              db.ForeignKey('frameworks.id'),
@@ -229,6 +242,31 @@ class Service(db.Model):
 
     framework = db.relationship(Framework, lazy='joined', innerjoin=True)
 
+    @classmethod
+    def ordering(cls):
+        """
+        :return: the columns services are listed by; the same expressions
+                 as `ix_service_ordering`, with `id` as a tie-breaker
+        """
+        return [
+            cls.framework_id,
+            cls.data['lot'].astext,
+            cls.data['serviceName'].astext,
+            cls.id,
+        ]
+
+    def ordering_key(self):
+        """
+        :return: this service's values for the `ordering` columns
+        """
+        return [
+            self.framework_id,
+            self.data.get('lot'),
+            self.data.get('serviceName'),
+            self.id,
+        ]
+
+    @timed('serialization')
     def serialize(self):
         """
         :return: dictionary representation of a service
@@ -251,6 +289,82 @@ class Service(db.Model):
 
         return data
 
+    @staticmethod
+    def hash_content(data, status):
+        """
+        :return: a hash of a service's data and status that doesn't depend
+                 on the order of the keys in `data`
+        """
+        return make_etag(
+            json.dumps(data, sort_keys=True, separators=(',', ':')), status)
+
+    def update_content_hash(self):
+        self.content_hash = self.hash_content(self.data, self.status)
+
+    @staticmethod
+    def listing_fields(data):
+        """
+        :return: `data` without the fields `serialize` adds to the listing
+        """
+        return drop_foreign_fields(
+            data,
+            ['id', 'supplierId', 'supplierName', 'frameworkName', 'status',
+             'updatedAt', 'links'])
+
+    def merged_data(self, data):
+        """
+        :return: this service's data updated with the listing fields in
+                 `data`, as `update_from_json` would store it
+        """
+        current_data = dict(self.data.items())
+        current_data.update(self.listing_fields(data))
+        return current_data
+
+    def is_changed_by(self, data, status=None):
+        """
+        :param data: the service's new data, e.g. from `merged_data`
+        :return: whether storing `data` and `status` would change the
+                 service
+        """
+        current_hash = self.content_hash or \
+            self.hash_content(self.data, self.status)
+        return current_hash != self.hash_content(
+            data, self.status if status is None else status)
+
+    def write_data(self, data, updated_by=None, updated_reason=None):
+        """
+        Store `data` as the service's data with an UPDATE that only sends
+        the top-level fields that changed, for the database to merge into
+        the stored data. The merged data is returned by the UPDATE, and
+        replaces `data` on the service.
+        """
+        delta = json_diff(self.data, data)
+        values = {
+            'updated_at': datetime.utcnow(),
+            'updated_by': updated_by,
+            'updated_reason': updated_reason,
+        }
+        table = Service.__table__
+
+        stored_data = table.c.data
+        if 'set' in delta:
+            stored_data = stored_data.op('||')(
+                bindparam('patch', delta['set'], type_=JSONB))
+        for i, key in enumerate(delta.get('unset', [])):
+            stored_data = stored_data.op('-')(
+                cast(bindparam('unset_{}'.format(i), key), String))
+
+        merged_data = db.session.execute(table.update().where(
+            table.c.id == self.id
+        ).values(
+            data=stored_data, **values
+        ).returning(table.c.data)).scalar()
+
+        set_committed_value(self, 'data', merged_data)
+        for key, value in values.items():
+            set_committed_value(self, key, value)
+        self.update_content_hash()
+
     def update_from_json(self, data, updated_by=None, updated_reason=None):
         self.service_id = str(data.pop('id', self.service_id))
 
@@ -258,11 +372,11 @@ class Service(db.Model):
         data.pop('supplierName', None)
         data.pop('frameworkName', None)
         data.pop('status', None)
+        data.pop('updatedAt', None)
         data.pop('links', None)
 
-        current_data = dict(self.data.items())
-        current_data.update(data)
-        self.data = current_data
+        self.data = self.merged_data(data)
+        self.update_content_hash()
 
         now = datetime.utcnow()
         self.updated_at = now
@@ -287,7 +401,16 @@ class ArchivedService(db.Model):
                            nullable=False)
     updated_reason = db.Column(db.String, index=False, unique=False,
                                nullable=False)
-    data = db.Column(JSON)
+    # Full data for snapshots; `None` for versions stored as a `delta`
+    # against `previous_id`. See `app.archive`. `None` is stored as SQL
+    # NULL rather than JSON null so `IS NULL` finds the delta versions.
+    data = db.Column(JSONB(none_as_null=True))
+    delta = db.Column(JSONB(none_as_null=True))
+    previous_id = db.Column(db.Integer,
+                            db.ForeignKey('archived_services.id'),
+                            index=False, unique=False, nullable=True)
+    snapshot_distance = db.Column(db.Integer, index=False, unique=False,
+                                  nullable=False, default=0)
 
     framework_id = db.Column(db.BigInteger,
                              db.ForeignKey('frameworks.id'),
@@ -313,12 +436,15 @@ class ArchivedService(db.Model):
             status=service.status
         )
 
-    def serialize(self):
+    @timed('serialization')
+    def serialize(self, data=None):
         """
+        :param data: the rebuilt data of a delta encoded version, from
+                     `app.archive.archived_data`
         :return: dictionary representation of a service
         """
 
-        data = dict(self.data.items())
+        data = dict((self.data if data is None else data).items())
 
         data.update({
             'id': self.service_id,
@@ -350,7 +476,7 @@ class DraftService(db.Model):
                            nullable=False)
     updated_reason = db.Column(db.String, index=False, unique=False,
                                nullable=False)
-    data = db.Column(JSON)
+    data = db.Column(JSONB)
 
     framework_id = db.Column(db.BigInteger,
                              db.ForeignKey('frameworks.id'),
@@ -377,6 +503,7 @@ class DraftService(db.Model):
             status=service.status
         )
 
+    @timed('serialization')
     def serialize(self):
         """
         :return: dictionary representation of a draft service
@@ -416,6 +543,29 @@ class DraftService(db.Model):
         self.updated_reason = updated_reason
 
 
+def service_read_options(model=None):
+    """
+    Loading profile for endpoints reading services, archived services or
+    drafts: the supplier and framework are joined in as usual, but not the
+    supplier's contact information, which a serialized service doesn't
+    include. Joining it would return a row per contact for every service.
+    :param model: `Service`, `ArchivedService` or `DraftService`
+    """
+    model = model or Service
+    return [
+        defaultload(model.supplier).lazyload(Supplier.contact_information),
+    ]
+
+
+def supplier_list_options():
+    """
+    Loading profile for lists of suppliers: contact information is loaded
+    with one more query for the whole page instead of being joined, so
+    the page is a plain LIMIT over suppliers
+    """
+    return [subqueryload(Supplier.contact_information)]
+
+
 class AuditEvent(db.Model):
     __tablename__ = 'audit_events'
 
@@ -434,6 +584,34 @@ class AuditEvent(db.Model):
     )
 
 
+class SearchIndexTask(db.Model):
+    """A change to make to the search index, written in the same
+    transaction as the change to the service and sent to the search API
+    by the search index worker
+    """
+    __tablename__ = 'search_index_outbox'
+
+    id = db.Column(db.Integer, primary_key=True)
+    service_id = db.Column(db.String, index=True, nullable=False)
+    action = db.Column(db.String, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False,
+                           default=datetime.utcnow)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, index=True, nullable=False,
+                                default=datetime.utcnow)
+    last_error = db.Column(db.String)
+
+
+class SearchIndexCheckpoint(db.Model):
+    """How far an incremental reindex has got"""
+    __tablename__ = 'search_index_checkpoints'
+
+    name = db.Column(db.String, primary_key=True)
+    # Services updated since then haven't been reindexed yet
+    watermark = db.Column(db.DateTime)
+    live_framework_ids = db.Column(JSON)
+
+
 def filter_null_value_fields(obj):
     return dict(
         filter(lambda x: x[1] is not None, obj.items())
@@ -0,0 +1,139 @@
+"""
+Route reads to read replicas of the database
+
+GET and HEAD requests to the `main` blueprint read from one of the
+replicas in SQLALCHEMY_REPLICA_URIS, chosen in turn when the request
+starts and used for the whole request. Everything else, and anything a
+session flushes, goes to the primary.
+
+Replication lag is checked at most every DM_API_REPLICA_CHECK_INTERVAL
+seconds. A replica more than DM_API_REPLICA_MAX_LAG seconds behind, or
+that can't be reached, is left out until a later check finds it has
+caught up. With no replica available reads go to the primary.
+
+Clients that need to read their own writes can send
+`DM-Read-Your-Writes: true` to have a GET read from the primary.
+"""
+
+import time
+from itertools import count
+from threading import Lock
+
+import sqlalchemy
+from flask import current_app, request, has_request_context
+from flask.ext.sqlalchemy import SQLAlchemy, SignallingSession, \
+    _EngineDebuggingSignalEvents, _record_queries
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.exc import SQLAlchemyError
+
+READ_YOUR_WRITES_HEADER = 'DM-Read-Your-Writes'
+REPLICA_ENVIRON_KEY = 'dm.replica_engine'
+
+LAG_QUERY = """
+SELECT CASE WHEN pg_is_in_recovery()
+            THEN EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+            ELSE 0
+       END
+"""
+
+
+class Replica(object):
+    def __init__(self, engine):
+        self.engine = engine
+        self.lag = None
+        self._checked_at = None
+        self._lock = Lock()
+
+    def is_current(self, max_lag, check_interval):
+        with self._lock:
+            due = self._checked_at is None or \
+                time.time() - self._checked_at >= check_interval
+            if due:
+                self._checked_at = time.time()
+        if due:
+            self.lag = self._measure_lag()
+        return self.lag is not None and self.lag <= max_lag
+
+    def _measure_lag(self):
+        try:
+            lag = self.engine.execute(LAG_QUERY).scalar()
+        except SQLAlchemyError:
+            current_app.logger.exception(
+                'Error checking replica {}'.format(self.engine.url))
+            return None
+        return None if lag is None else float(lag)
+
+
+class ReplicaSet(object):
+    def __init__(self, db):
+        self._db = db
+        self._replicas = []
+        self._counter = count()
+        self.max_lag = 0
+        self.check_interval = 0
+
+    def init_app(self, app):
+        self.dispose()
+        self.max_lag = app.config['DM_API_REPLICA_MAX_LAG']
+        self.check_interval = app.config['DM_API_REPLICA_CHECK_INTERVAL']
+        self._replicas = [
+            Replica(self._create_engine(app, uri))
+            for uri in app.config['SQLALCHEMY_REPLICA_URIS']
+        ]
+
+    def _create_engine(self, app, uri):
+        options = {'convert_unicode': True}
+        self._db.apply_pool_defaults(app, options)
+        self._db.apply_driver_hacks(app, make_url(uri), options)
+        engine = sqlalchemy.create_engine(uri, **options)
+        # Record queries the same way Flask-SQLAlchemy does for its own
+        # engines, so they show up in `get_debug_queries`
+        if _record_queries(app):
+            _EngineDebuggingSignalEvents(engine, app.import_name).register()
+        return engine
+
+    def dispose(self):
+        for replica in self._replicas:
+            replica.engine.dispose()
+        self._replicas = []
+
+    def choose(self):
+        """
+        :return: the engine of the next replica that's up to date, or None
+                 if there isn't one
+        """
+        current = [replica for replica in self._replicas
+                   if replica.is_current(self.max_lag, self.check_interval)]
+        if current:
+            return current[next(self._counter) % len(current)].engine
+
+    def route_request(self):
+        """Use a replica for the rest of the request if it only reads"""
+        if request.method in ('GET', 'HEAD') and \
+                request.headers.get(READ_YOUR_WRITES_HEADER) != 'true':
+            request.environ[REPLICA_ENVIRON_KEY] = self.choose()
+
+    def stats(self):
+        return [{'url': repr(replica.engine.url), 'lag': replica.lag}
+                for replica in self._replicas]
+
+
+class RoutingSession(SignallingSession):
+    def get_bind(self, mapper=None, clause=None):
+        if not self._flushing and has_request_context():
+            engine = request.environ.get(REPLICA_ENVIRON_KEY)
+            if engine is not None:
+                return engine
+        return SignallingSession.get_bind(self, mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """`SQLAlchemy` with sessions that send reads to `replicas` when the
+    request allows it"""
+
+    def __init__(self, *args, **kwargs):
+        self.replicas = ReplicaSet(self)
+        super(RoutingSQLAlchemy, self).__init__(*args, **kwargs)
+
+    def create_session(self, options):
+        return RoutingSession(self, **options)
@@ -0,0 +1,309 @@
+"""
+Compile JSON schemas into specialised Python validation functions
+
+Each schema is turned into the source of a single Python function, with
+its type tests, property lookups and loops inlined the way fastjsonschema
+does it, which is compiled once and then called for every instance.
+
+A compiled validator stops at the first error and raises the same
+`jsonschema.ValidationError`, with the same message, that a draft 4
+`jsonschema` validator would raise first: keywords are checked in the
+order `jsonschema` iterates over them and messages are built with the
+same formats and helpers as jsonschema 2.3. Subschemas using a keyword
+the compiler doesn't handle (such as `$ref`) are validated by `jsonschema`
+itself, so the compiled validator never accepts anything it would reject.
+"""
+
+import numbers
+import re
+
+from jsonschema import Draft4Validator, FormatError, ValidationError
+from jsonschema import _utils
+from jsonschema.compat import str_types, int_types
+
+# Keywords with no effect on validation
+ANNOTATION_KEYWORDS = set([
+    'id', 'title', 'description', '$schema', 'definitions', 'default',
+])
+COMPILED_KEYWORDS = set([
+    'type', 'enum', 'properties', 'required', 'additionalProperties',
+    'items', 'minItems', 'maxItems', 'uniqueItems', 'minLength',
+    'maxLength', 'pattern', 'format', 'oneOf',
+])
+TYPE_CHECKS = {
+    'object': 'isinstance({0}, dict)',
+    'array': 'isinstance({0}, list)',
+    'string': 'isinstance({0}, str_types)',
+    'boolean': 'isinstance({0}, bool)',
+    'integer': '(isinstance({0}, int_types) and not isinstance({0}, bool))',
+    'number': '(isinstance({0}, numbers.Number) and '
+              'not isinstance({0}, bool))',
+    'null': '{0} is None',
+}
+
+
+class CompiledValidator(object):
+    """A drop-in for the `validate` and `is_valid` methods of a
+    `jsonschema` validator
+    """
+
+    def __init__(self, schema, function, source):
+        self.schema = schema
+        self.validate = function
+        self.source = source
+
+    def is_valid(self, instance):
+        try:
+            self.validate(instance)
+        except ValidationError:
+            return False
+        return True
+
+
+def compile_schema(schema, format_checker=None):
+    """
+    :param schema: a draft 4 JSON schema
+    :param format_checker: the `jsonschema.FormatChecker` to check
+                           `format` keywords with, if any
+    :return: a `CompiledValidator` for `schema`
+    """
+    return SchemaCompiler(schema, format_checker).compile()
+
+
+def one_of(instance, validators, subschemas):
+    valid = [index for index, validator in enumerate(validators)
+             if validator.is_valid(instance)]
+    if not valid:
+        raise ValidationError(
+            "%r is not valid under any of the given schemas" % (instance,))
+    if len(valid) > 1:
+        more_valid = [subschemas[index] for index in valid[1:]]
+        more_valid.append(subschemas[valid[0]])
+        reprs = ", ".join(repr(schema) for schema in more_valid)
+        raise ValidationError(
+            "%r is valid under each of %s" % (instance, reprs))
+
+
+class SchemaCompiler(object):
+    def __init__(self, schema, format_checker=None, fallback=None):
+        self.schema = schema
+        self.format_checker = format_checker
+        # Resolves references from the root schema, even in subschemas
+        # compiled separately
+        self.fallback = fallback or Draft4Validator(
+            schema, format_checker=format_checker)
+        self.constants = []
+        self.variables = 0
+
+    def compile(self):
+        lines = ['def validate(data):']
+        lines.extend(self.indent(self.schema_lines(self.schema, 'data')))
+        lines.append('    return data')
+        source = '\n'.join(lines) + '\n'
+
+        namespace = {
+            'C': self.constants,
+            'ValidationError': ValidationError,
+            'FormatError': FormatError,
+            'numbers': numbers,
+            'str_types': str_types,
+            'int_types': int_types,
+            'one_of': one_of,
+            'find_additional_properties': _utils.find_additional_properties,
+            'extras_msg': _utils.extras_msg,
+            'types_msg': _utils.types_msg,
+            'uniq': _utils.uniq,
+        }
+        exec(compile(source, '<compiled schema>', 'exec'), namespace)
+
+        return CompiledValidator(self.schema, namespace['validate'], source)
+
+    def constant(self, value):
+        self.constants.append(value)
+        return 'C[{}]'.format(len(self.constants) - 1)
+
+    def variable(self):
+        self.variables += 1
+        return 'data_{}'.format(self.variables)
+
+    def indent(self, lines):
+        return ['    ' + line for line in lines]
+
+    def raise_error(self, message_expression):
+        return ['raise ValidationError({})'.format(message_expression)]
+
+    def schema_lines(self, schema, name):
+        keywords = set(schema) - ANNOTATION_KEYWORDS
+        if not keywords <= COMPILED_KEYWORDS or \
+                not self.types_are_known(schema.get('type')):
+            return self.fallback_lines(schema, name)
+
+        lines = []
+        # Same order as `jsonschema`'s `iter_errors`
+        for keyword, value in schema.items():
+            if keyword in keywords:
+                method = getattr(self, 'keyword_{}'.format(keyword))
+                lines.extend(method(value, schema, name))
+        return lines
+
+    def types_are_known(self, types):
+        if types is None:
+            return True
+        return all(type in TYPE_CHECKS
+                   for type in _utils.ensure_list(types))
+
+    def fallback_lines(self, schema, name):
+        return [
+            'for error in {}.iter_errors({}, {}):'.format(
+                self.constant(self.fallback), name, self.constant(schema)),
+            '    raise ValidationError(error.message)',
+        ]
+
+    def type_check(self, type, name):
+        return TYPE_CHECKS[type].format(name)
+
+    def keyword_type(self, types, schema, name):
+        types = _utils.ensure_list(types)
+        checks = ' or '.join(self.type_check(type, name) for type in types)
+        return ['if not ({}):'.format(checks)] + self.indent(
+            self.raise_error('types_msg({}, {})'.format(
+                name, self.constant(types))))
+
+    def keyword_enum(self, enums, schema, name):
+        enums = self.constant(enums)
+        return ['if {} not in {}:'.format(name, enums)] + self.indent(
+            self.raise_error('"%r is not one of %r" % ({}, {})'.format(
+                name, enums)))
+
+    def keyword_properties(self, properties, schema, name):
+        lines = []
+        for property, subschema in properties.items():
+            variable = self.variable()
+            property_lines = self.schema_lines(subschema, variable)
+            if not property_lines:
+                continue
+            key = self.constant(property)
+            lines.append('if {} in {}:'.format(key, name))
+            lines.append('    {} = {}[{}]'.format(variable, name, key))
+            lines.extend(self.indent(property_lines))
+
+        if not lines:
+            return []
+        return ['if {}:'.format(self.type_check('object', name))] + \
+            self.indent(lines)
+
+    def keyword_required(self, required, schema, name):
+        lines = []
+        for property in required:
+            lines.append('if {} not in {}:'.format(
+                self.constant(property), name))
+            lines.extend(self.indent(self.raise_error(self.constant(
+                "%r is a required property" % property))))
+
+        if not lines:
+            return []
+        return ['if {}:'.format(self.type_check('object', name))] + \
+            self.indent(lines)
+
+    def keyword_additionalProperties(self, additional, schema, name):
+        if isinstance(additional, dict):
+            variable = self.variable()
+            item_lines = self.schema_lines(additional, variable)
+            if not item_lines:
+                return []
+            return [
+                'if {}:'.format(self.type_check('object', name)),
+                '    for extra in set(find_additional_properties('
+                '{}, {})):'.format(name, self.constant(schema)),
+                '        {} = {}[extra]'.format(variable, name),
+            ] + self.indent(self.indent(item_lines))
+
+        if additional:
+            return []
+
+        if 'patternProperties' in schema:
+            check = 'True'
+        else:
+            check = 'not {}.issuperset({})'.format(
+                self.constant(frozenset(schema.get('properties', {}))),
+                name)
+        return [
+            'if {} and {}:'.format(self.type_check('object', name), check),
+            '    extras = set(find_additional_properties({}, {}))'.format(
+                name, self.constant(schema)),
+            '    if extras:',
+        ] + self.indent(self.indent(self.raise_error(
+            '"Additional properties are not allowed (%s %s unexpected)"'
+            ' % extras_msg(extras)')))
+
+    def keyword_items(self, items, schema, name):
+        if not isinstance(items, dict):
+            return self.fallback_lines({'items': items}, name)
+
+        variable = self.variable()
+        item_lines = self.schema_lines(items, variable)
+        if not item_lines:
+            return []
+        return [
+            'if {}:'.format(self.type_check('array', name)),
+            '    for {} in {}:'.format(variable, name),
+        ] + self.indent(self.indent(item_lines))
+
+    def length_check(self, type, comparison, limit, message, name):
+        return [
+            'if {} and len({}) {} {}:'.format(
+                self.type_check(type, name), name, comparison, limit),
+        ] + self.indent(self.raise_error(
+            '"%r is too {}" % ({},)'.format(message, name)))
+
+    def keyword_minItems(self, limit, schema, name):
+        return self.length_check('array', '<', limit, 'short', name)
+
+    def keyword_maxItems(self, limit, schema, name):
+        return self.length_check('array', '>', limit, 'long', name)
+
+    def keyword_minLength(self, limit, schema, name):
+        return self.length_check('string', '<', limit, 'short', name)
+
+    def keyword_maxLength(self, limit, schema, name):
+        return self.length_check('string', '>', limit, 'long', name)
+
+    def keyword_uniqueItems(self, unique, schema, name):
+        if not unique:
+            return []
+        return [
+            'if {} and not uniq({}):'.format(
+                self.type_check('array', name), name),
+        ] + self.indent(self.raise_error(
+            '"%r has non-unique elements" % ({},)'.format(name)))
+
+    def keyword_pattern(self, pattern, schema, name):
+        return [
+            'if {} and not {}.search({}):'.format(
+                self.type_check('string', name),
+                self.constant(re.compile(pattern)), name),
+        ] + self.indent(self.raise_error(
+            '"%r does not match %r" % ({}, {})'.format(
+                name, self.constant(pattern))))
+
+    def keyword_format(self, format, schema, name):
+        if self.format_checker is None or \
+                format not in self.format_checker.checkers:
+            return []
+        return [
+            'try:',
+            '    {}.check({}, {})'.format(
+                self.constant(self.format_checker), name,
+                self.constant(format)),
+            'except FormatError as error:',
+        ] + self.indent(self.raise_error('error.message'))
+
+    def keyword_oneOf(self, subschemas, schema, name):
+        validators = [
+            SchemaCompiler(
+                subschema, self.format_checker, self.fallback
+            ).compile()
+            for subschema in subschemas
+        ]
+        return ['one_of({}, {}, {})'.format(
+            name, self.constant(validators), self.constant(subschemas))]
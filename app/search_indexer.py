@@ -0,0 +1,297 @@
+"""
+Send the changes queued in the search index outbox to the search API
+
+Write endpoints add a `SearchIndexTask` in the same transaction as the
+change to a service, and the worker started by `application.py
+search_index_worker` sends them to the search API in batches. A task only
+names the service and what to do with it: services are indexed with the
+data they have when the task is sent.
+
+Only the latest task queued for a service matters, so the tasks of each
+service in a batch are sent as one. If the search API rejects it, every
+task for the service is retried with exponential backoff; once it
+succeeds, all of them are removed.
+
+`application.py reindex` indexes services straight from the database
+instead, for rebuilding the search index or, with `--incremental`,
+catching up with the services changed since it was last run.
+"""
+
+import time
+from datetime import datetime, timedelta
+from itertools import islice
+from multiprocessing.pool import ThreadPool
+
+from flask import current_app
+from sqlalchemy import and_, or_
+from sqlalchemy.sql.expression import false
+
+from . import db, search_api_client, apiclient
+from .models import SearchIndexTask, SearchIndexCheckpoint, Service, \
+    Supplier, Framework, service_read_options
+
+
+def process_search_index_outbox(batch_size=None):
+    """
+    Send one batch of due tasks to the search API
+    :return: the number of tasks in the batch
+    """
+    batch_size = batch_size or \
+        current_app.config['DM_SEARCH_INDEX_WORKER_BATCH_SIZE']
+    now = datetime.utcnow()
+
+    tasks = SearchIndexTask.query.filter(
+        SearchIndexTask.next_attempt_at <= now
+    ).order_by(
+        SearchIndexTask.id
+    ).limit(batch_size).with_for_update().all()
+    if not tasks:
+        db.session.commit()
+        return 0
+
+    latest_tasks = {}
+    for task in tasks:
+        latest_tasks[task.service_id] = task
+    services = dict(
+        (service.service_id, service) for service in Service.query.options(
+            *service_read_options()
+        ).filter(
+            Service.service_id.in_(list(latest_tasks))
+        )
+    )
+
+    sent = []
+    for service_id, task in latest_tasks.items():
+        try:
+            send_task(task, services.get(service_id))
+        except apiclient.HTTPError as e:
+            retry_tasks(task, e.message, now)
+        else:
+            sent.append(task)
+
+    if sent:
+        SearchIndexTask.query.filter(or_(*[
+            and_(SearchIndexTask.service_id == task.service_id,
+                 SearchIndexTask.id <= task.id)
+            for task in sent
+        ])).delete(synchronize_session=False)
+
+    db.session.commit()
+    return len(tasks)
+
+
+def send_task(task, service):
+    if task.action == 'delete':
+        try:
+            search_api_client.delete(task.service_id)
+        except apiclient.HTTPError as e:
+            # Already gone
+            if getattr(e, 'status_code', None) != 404:
+                raise
+    elif service is not None and not service.framework.expired and \
+            service.status == 'published':
+        search_api_client.index(
+            service.service_id,
+            service.data,
+            service.supplier.name,
+            service.framework.name)
+
+
+def retry_tasks(task, error, now):
+    attempts = task.attempts + 1
+    delay = min(
+        current_app.config['DM_SEARCH_INDEX_RETRY_DELAY'] *
+        2 ** (attempts - 1),
+        current_app.config['DM_SEARCH_INDEX_MAX_RETRY_DELAY'])
+    current_app.logger.warning(
+        'Failed to {} {} in search index (attempt {}): {}'.format(
+            task.action, task.service_id, attempts, error))
+
+    SearchIndexTask.query.filter(
+        SearchIndexTask.service_id == task.service_id
+    ).update({
+        'attempts': attempts,
+        'last_error': error,
+        'next_attempt_at': now + timedelta(seconds=delay),
+    }, synchronize_session=False)
+
+
+def run_search_index_worker(batch_size=None, once=False):
+    """
+    Keep sending batches of tasks, waiting between polls when there are
+    fewer than a full batch due
+    :param once: stop as soon as there are no tasks due
+    """
+    batch_size = batch_size or \
+        current_app.config['DM_SEARCH_INDEX_WORKER_BATCH_SIZE']
+    while True:
+        processed = process_search_index_outbox(batch_size)
+        if processed < batch_size:
+            if once:
+                return
+            time.sleep(
+                current_app.config['DM_SEARCH_INDEX_WORKER_POLL_INTERVAL'])
+
+
+def services_to_index(framework=None, supplier_id=None,
+                      updated_since=None, updated_before=None):
+    """
+    :return: a query for the (service_id, data, supplier name, framework
+             name) of the published services on live frameworks
+    """
+    services = db.session.query(
+        Service.service_id, Service.data, Supplier.name, Framework.name
+    ).join(
+        Service.supplier
+    ).join(
+        Service.framework
+    ).filter(
+        Service.status == 'published',
+        Framework.expired == false()
+    )
+
+    if framework is not None:
+        services = services.filter(Framework.name == framework)
+    if supplier_id is not None:
+        services = services.filter(Service.supplier_id == supplier_id)
+    if updated_since is not None:
+        services = services.filter(Service.updated_at >= updated_since)
+    if updated_before is not None:
+        services = services.filter(Service.updated_at < updated_before)
+
+    return services.order_by(Service.id)
+
+
+def services_to_delete(since, expired_framework_ids=()):
+    """
+    :param since: only services changed since then are considered
+    :param expired_framework_ids: frameworks whose published services
+                                  should all be deleted
+    :return: a query for the ids of services that may be in the index but
+             no longer should be: services changed since `since` that
+             aren't published or are on an expired framework, and the
+             published services on `expired_framework_ids`
+    """
+    changed = and_(
+        Service.updated_at >= since,
+        or_(Service.status != 'published', Framework.expired)
+    )
+    if expired_framework_ids:
+        changed = or_(changed, and_(
+            Service.status == 'published',
+            Service.framework_id.in_(list(expired_framework_ids))
+        ))
+
+    return db.session.query(
+        Service.service_id
+    ).join(
+        Service.framework
+    ).filter(changed).order_by(Service.id)
+
+
+def reindex_services(services, processes=10, batch_size=None,
+                     send=None):
+    """
+    Index services, read with a server-side cursor a batch at a time,
+    with a pool of threads sending them to the search API
+    :param services: a `services_to_index` query, or a
+                     `services_to_delete` query with `send=delete_document`
+    :return: the number of services sent and the number that failed
+    """
+    send = send or index_document
+    batch_size = batch_size or \
+        current_app.config['DM_SEARCH_INDEX_WORKER_BATCH_SIZE']
+    pool = ThreadPool(processes)
+
+    sent = failed = 0
+    start_time = datetime.utcnow()
+    rows = iter(services.yield_per(batch_size))
+    try:
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            for service_id, error in pool.map(send, batch):
+                if error is None:
+                    sent += 1
+                else:
+                    failed += 1
+                    current_app.logger.warning(
+                        'Failed to update {} in search index: {}'.format(
+                            service_id, error))
+            current_app.logger.info('Sent {} services in {}'.format(
+                sent, datetime.utcnow() - start_time))
+    finally:
+        pool.close()
+        pool.join()
+
+    return sent, failed
+
+
+def incremental_reindex(processes=10, batch_size=None,
+                        checkpoint_name='services'):
+    """
+    Index the services changed since the last incremental reindex and
+    delete the ones that shouldn't be in the index any more, then move the
+    checkpoint on if everything was sent
+
+    Status changes set `updated_at`, so they're picked up along with
+    changes to the data. Frameworks that have expired since the last run
+    have all their services deleted. The first run indexes everything.
+    :return: the numbers of services indexed, deleted and failed
+    """
+    checkpoint = SearchIndexCheckpoint.query.get(checkpoint_name) or \
+        SearchIndexCheckpoint(name=checkpoint_name)
+    # Catch rows committed after the scan by transactions that set
+    # `updated_at` before it started
+    watermark = datetime.utcnow() - timedelta(
+        seconds=current_app.config['DM_SEARCH_REINDEX_OVERLAP'])
+    live_framework_ids = set(
+        framework_id for framework_id, in Framework.query.with_entities(
+            Framework.id
+        ).filter(Framework.expired == false())
+    )
+
+    if checkpoint.watermark is None:
+        indexed, failed = reindex_services(
+            services_to_index(), processes, batch_size)
+        deleted = 0
+    else:
+        indexed, failed = reindex_services(
+            services_to_index(updated_since=checkpoint.watermark),
+            processes, batch_size)
+        newly_expired = \
+            set(checkpoint.live_framework_ids or []) - live_framework_ids
+        deleted, failed_deletes = reindex_services(
+            services_to_delete(checkpoint.watermark, newly_expired),
+            processes, batch_size, send=delete_document)
+        failed += failed_deletes
+
+    if not failed:
+        checkpoint.watermark = watermark
+        checkpoint.live_framework_ids = sorted(live_framework_ids)
+        db.session.add(checkpoint)
+        db.session.commit()
+
+    return indexed, deleted, failed
+
+
+def index_document(row):
+    service_id, data, supplier_name, framework_name = row
+    try:
+        search_api_client.index(service_id, data, supplier_name,
+                                framework_name)
+    except apiclient.HTTPError as e:
+        return service_id, e.message
+    return service_id, None
+
+
+def delete_document(row):
+    service_id, = row
+    try:
+        search_api_client.delete(service_id)
+    except apiclient.HTTPError as e:
+        # Already gone
+        if getattr(e, 'status_code', None) != 404:
+            return service_id, e.message
+    return service_id, None
@@ -1,8 +1,15 @@
-from flask import current_app
+from datetime import datetime
+
+from flask import current_app, json, request, abort
+from sqlalchemy import select, literal
+from werkzeug.exceptions import HTTPException
+from .instrumentation import timed
+from .json_patch import JSON_PATCH_MIMETYPE, JsonPatchError, apply_patch
 from .utils import get_json_from_request, \
-    json_has_matching_id, json_has_required_keys, drop_foreign_fields
+    json_has_matching_id, json_has_required_keys
 from .validation import validate_updater_json_or_400, detect_framework_or_400
-from . import search_api_client, apiclient
+from .models import Service, SearchIndexTask
+from . import db, service_cache, framework_registry
 
 
 def validate_and_return_updater_request():
@@ -19,40 +26,145 @@ def validate_and_return_service_request(service_id):
     return json_payload['services']
 
 
-def update_and_validate_service(service, service_payload, updater_payload):
-    service.update_from_json(
-        service_payload,
+def update_and_validate_service(service, data, updater_payload):
+    """
+    Store `data` as the new data of the service with `Service.write_data`,
+    then validate the data the UPDATE returned. The update is rolled back
+    if that isn't valid.
+    """
+    service.write_data(
+        data,
         updated_by=updater_payload['updated_by'],
         updated_reason=updater_payload['update_reason'])
 
-    data = service.serialize()
+    data = dict(service.data,
+                id=service.service_id,
+                supplierId=service.supplier_id,
+                status=service.status)
+    try:
+        detect_framework_or_400(data)
+    except HTTPException:
+        db.session.rollback()
+        raise
+    return service
 
-    data = drop_foreign_fields(
-        data,
-        ['service_id', 'supplierName', 'links', 'frameworkName', 'updatedAt'])
 
-    detect_framework_or_400(data)
-    return service
+def is_json_patch_request():
+    return request.mimetype == JSON_PATCH_MIMETYPE
+
+
+def validate_and_return_json_patch():
+    """
+    :return: the operations of the JSON Patch that is the request body
+    """
+    try:
+        operations = json.loads(request.get_data(as_text=True))
+    except ValueError:
+        operations = None
+    if not isinstance(operations, list):
+        abort(400, "Invalid JSON Patch; must be a JSON array of operations")
+    return operations
+
+
+def validate_and_return_updater_headers():
+    """
+    The body of a JSON Patch request is the patch, so the updater details
+    are sent in the DM-Updated-By and DM-Update-Reason headers instead
+    """
+    updater_json = {}
+    for key, header in [('updated_by', 'DM-Updated-By'),
+                        ('update_reason', 'DM-Update-Reason')]:
+        if header in request.headers:
+            updater_json[key] = request.headers[header]
+    validate_updater_json_or_400(updater_json)
+    return updater_json
+
+
+def patch_service_data(data, operations):
+    """
+    :return: the listing fields of `data` with the JSON Patch
+             `operations` applied
+    """
+    try:
+        return Service.listing_fields(apply_patch(data, operations))
+    except JsonPatchError as e:
+        abort(400, "Invalid JSON Patch: {}".format(e))
+
+
+@timed('serialization')
+def jsonify_services(services, links=None):
+    """
+    Build the same response as `jsonify(services=..., links=...)` from
+    the cached JSON encoding of each service
+    :param services: a service or a list of services
+    """
+    if isinstance(services, list):
+        encoded = u'[{}]'.format(
+            u', '.join(service_cache.serialize(s) for s in services))
+    else:
+        encoded = service_cache.serialize(services)
+
+    body = u'{{"services": {}'.format(encoded)
+    if links is not None:
+        body += u', "links": {}'.format(json.dumps(links))
+
+    return current_app.response_class(body + u'}',
+                                      mimetype='application/json')
 
 
 def index_service(service):
-    if not service.framework.expired and service.status == 'published':
-        try:
-            search_api_client.index(
-                service.service_id,
-                service.data,
-                service.supplier.name,
-                service.framework.name)
-        except apiclient.HTTPError as e:
-            current_app.logger.warning(
-                'Failed to add {} to search index: {}'.format(
-                    service.service_id, e.message))
+    """Queue the service to be (re)indexed once the current transaction
+    is committed. The framework is looked up by id, as `service.framework`
+    isn't loaded for services that haven't been flushed yet.
+    """
+    framework = framework_registry.get(service.framework_id)
+    if framework is not None and not framework.expired and \
+            service.status == 'published':
+        db.session.add(
+            SearchIndexTask(service_id=service.service_id, action='index'))
+
+
+def index_services(service_ids):
+    """Queue services inserted without the ORM to be indexed
+    """
+    if service_ids:
+        db.session.execute(SearchIndexTask.__table__.insert(), [
+            {'service_id': service_id, 'action': 'index',
+             'attempts': 0, 'created_at': datetime.utcnow(),
+             'next_attempt_at': datetime.utcnow()}
+            for service_id in service_ids
+        ])
+
+
+def queue_search_index_tasks(action, ids, framework_ids=None, status=None):
+    """Queue a task for each of many services with a single
+    INSERT ... SELECT
+    :param ids: the `Service.id`s of the services
+    :param framework_ids: only queue services on these frameworks
+    :param status: only queue services with this status
+    """
+    services = Service.__table__
+    query = select([
+        services.c.service_id,
+        literal(action),
+        literal(0),
+        literal(datetime.utcnow()),
+        literal(datetime.utcnow()),
+    ]).where(services.c.id.in_(ids))
+    if framework_ids is not None:
+        query = query.where(services.c.framework_id.in_(framework_ids))
+    if status is not None:
+        query = query.where(services.c.status == status)
+
+    db.session.execute(SearchIndexTask.__table__.insert().from_select(
+        ['service_id', 'action', 'attempts', 'created_at', 'next_attempt_at'],
+        query
+    ))
 
 
 def delete_service_from_index(service):
-    try:
-        search_api_client.delete(service.service_id)
-    except apiclient.HTTPError as e:
-        current_app.logger.warning(
-            'Failed to remove {} to search index: {}'.format(
-                service.service_id, e.message))
+    """Queue the service to be removed from the search index once the
+    current transaction is committed
+    """
+    db.session.add(
+        SearchIndexTask(service_id=service.service_id, action='delete'))
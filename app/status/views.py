@@ -4,6 +4,7 @@ from sqlalchemy.exc import SQLAlchemyError
 
 from . import status
 from . import utils
+from .. import db, service_cache, password_hasher
 from dmutils.status import get_flags
 
 
@@ -17,7 +18,10 @@ def status_no_db():
             status="ok",
             version=version,
             db_version=utils.get_db_version(),
-            flags=get_flags(current_app)
+            flags=get_flags(current_app),
+            service_cache=service_cache.stats(),
+            password_hasher=password_hasher.stats(),
+            replicas=db.replicas.stats()
         )
 
     except SQLAlchemyError:
@@ -26,5 +30,8 @@ def status_no_db():
             status="error",
             version=version,
             message="Error connecting to database",
-            flags=get_flags(current_app)
+            flags=get_flags(current_app),
+            service_cache=service_cache.stats(),
+            password_hasher=password_hasher.stats(),
+            replicas=db.replicas.stats()
         ), 500
@@ -1,5 +1,16 @@
+import base64
+import binascii
+import hashlib
+import json
+
 from flask import url_for as base_url_for
-from flask import abort, request
+from flask import abort, request, current_app
+from sqlalchemy import and_, or_
+
+try:
+    string_types = basestring
+except NameError:  # Python 3
+    string_types = str
 
 
 def link(rel, href):
@@ -12,8 +23,34 @@ def url_for(*args, **kwargs):
     return base_url_for(*args, **kwargs)
 
 
+class KeysetPage(object):
+    """A page of results fetched by keyset (cursor) pagination.
+
+    Quacks enough like a Flask-SQLAlchemy `Pagination` for
+    `pagination_links`. There is no way back from a cursor, so only the
+    next link is ever generated.
+    """
+    has_prev = False
+
+    def __init__(self, items, next_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+
 def pagination_links(pagination, endpoint, args):
     links = dict()
+    if getattr(pagination, 'next_cursor', None) is not None:
+        args = dict((k, v) for k, v in args.items() if k != 'page')
+        links['next'] = url_for(endpoint,
+                                **dict(list(args.items()) +
+                                       list({'cursor': pagination.next_cursor}
+                                            .items()
+                                            )))
+        return links
     if pagination.has_prev:
         links['prev'] = url_for(endpoint,
                                 **dict(list(args.items()) +
@@ -29,6 +66,88 @@ def pagination_links(pagination, endpoint, args):
     return links
 
 
+def encode_cursor(values):
+    """Encode a row's ordering key as an opaque, URL-safe cursor
+
+    >>> print(encode_cursor([1, None, 3]))
+    WzEsIG51bGwsIDNd
+    >>> decode_cursor(encode_cursor([1, None, 3]), 3)
+    [1, None, 3]
+    """
+    return base64.urlsafe_b64encode(
+        json.dumps(values).encode('utf-8')
+    ).decode('ascii')
+
+
+def decode_cursor(cursor, length):
+    try:
+        values = json.loads(
+            base64.urlsafe_b64decode(str(cursor)).decode('utf-8'))
+    except (TypeError, ValueError, binascii.Error):
+        abort(400, "Invalid cursor argument")
+    if not isinstance(values, list) or len(values) != length:
+        abort(400, "Invalid cursor argument")
+    return values
+
+
+def keyset_filter(columns, values):
+    """Return a filter matching the rows that sort after `values`
+
+    `columns` are assumed to be in ascending order with NULLs last (the
+    Postgres default). The leading column must be non-nullable; it is
+    also bounded on its own so the planner can range scan an index
+    starting with it.
+    """
+    clauses = []
+    equal_so_far = []
+    for column, value in zip(columns, values):
+        if value is None:
+            # Nothing sorts after NULL, so only rows tied on it can follow
+            equal_so_far.append(column.is_(None))
+        else:
+            clauses.append(and_(*(equal_so_far + [
+                or_(column > value, column.is_(None))
+            ])))
+            equal_so_far.append(column == value)
+
+    return and_(columns[0] >= values[0], or_(*clauses))
+
+
+def make_etag(*parts):
+    """Build a strong entity tag from the values a representation depends on
+
+    >>> make_etag('1234567890', 'Supplier 1') == \\
+    ...     make_etag('1234567890', 'Supplier 1')
+    True
+    >>> make_etag('1234567890', 'Supplier 1') == \\
+    ...     make_etag('1234567890', 'Supplier 2')
+    False
+    """
+    return hashlib.sha1(
+        u'\x1f'.join(u'{}'.format(part) for part in parts).encode('utf-8')
+    ).hexdigest()
+
+
+def is_not_modified(etag):
+    """Check the request's `If-None-Match` header against a resource's ETag
+
+    `If-Modified-Since` is deliberately not supported: representations
+    include values from related rows (eg supplier and framework names)
+    that can change without the resource's own timestamp moving, so only
+    the entity tag can tell whether the response would be the same.
+    """
+    return request.if_none_match.contains(etag)
+
+
+def with_validators(response, etag):
+    response.set_etag(etag)
+    return response
+
+
+def not_modified(etag):
+    return with_validators(current_app.response_class(status=304), etag)
+
+
 def get_json_from_request():
     if request.content_type not in ['application/json',
                                     'application/json; charset=UTF-8']:
@@ -53,6 +172,41 @@ def drop_foreign_fields(json_object, list_of_keys):
     return json_object
 
 
+def json_diff(old, new):
+    """Describe how to turn one JSON object into another, key by key
+
+    >>> delta = json_diff({'a': 1, 'b': 2}, {'a': 1, 'b': 3, 'c': 4})
+    >>> sorted(delta['set'].items())
+    [('b', 3), ('c', 4)]
+    >>> json_diff({'a': 1, 'b': 2}, {'a': 1})
+    {'unset': ['b']}
+    >>> json_diff({'a': 1}, {'a': 1})
+    {}
+    """
+    delta = {}
+    changed = dict((key, value) for key, value in new.items()
+                   if key not in old or old[key] != value)
+    if changed:
+        delta['set'] = changed
+    removed = sorted(key for key in old if key not in new)
+    if removed:
+        delta['unset'] = removed
+    return delta
+
+
+def apply_json_diff(data, delta):
+    """Apply a `json_diff` to a copy of `data`
+
+    >>> apply_json_diff({'a': 1, 'b': 2}, {'set': {'b': 3}, 'unset': ['a']})
+    {'b': 3}
+    """
+    data = dict(data)
+    data.update(delta.get('set', {}))
+    for key in delta.get('unset', []):
+        data.pop(key, None)
+    return data
+
+
 def json_has_matching_id(data, id):
     if 'id' in data and not id == data['id']:
         abort(400, "id parameter must match id in data")
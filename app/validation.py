@@ -6,6 +6,9 @@ from flask import abort
 from jsonschema import ValidationError, FormatChecker
 from jsonschema.validators import validator_for
 
+from .instrumentation import timed
+from .schema_compiler import compile_schema
+
 MINIMUM_SERVICE_ID_LENGTH = 10
 MAXIMUM_SERVICE_ID_LENGTH = 20
 
@@ -39,13 +42,20 @@ def load_schemas(schemas_path, schema_names):
     return loaded_schemas
 
 _SCHEMAS = load_schemas(JSON_SCHEMAS_PATH, SCHEMA_NAMES)
+_VALIDATORS = {}
 
 
 def get_validator(schema_name):
-    schema = _SCHEMAS[schema_name]
-    return validator_for(schema)(schema, format_checker=FORMAT_CHECKER)
+    """Return the compiled validator for a schema, compiling it on first use
+    """
+    validator = _VALIDATORS.get(schema_name)
+    if validator is None:
+        validator = compile_schema(_SCHEMAS[schema_name], FORMAT_CHECKER)
+        _VALIDATORS[schema_name] = validator
+    return validator
 
 
+@timed('validation')
 def validate_updater_json_or_400(submitted_json):
     try:
         get_validator('services-update').validate(submitted_json)
@@ -53,6 +63,7 @@ def validate_updater_json_or_400(submitted_json):
         abort(400, "JSON validation error: {}".format(e1.message))
 
 
+@timed('validation')
 def validate_user_json_or_400(submitted_json):
     if not validates_against_schema('users', submitted_json):
         abort(400, "JSON was not a valid format")
@@ -61,6 +72,7 @@ def validate_user_json_or_400(submitted_json):
         abort(400, "No supplier id provided for supplier user")
 
 
+@timed('validation')
 def validate_user_auth_json_or_400(submitted_json):
     try:
         validates_against_schema('users-auth', submitted_json)
@@ -69,29 +81,92 @@ def validate_user_auth_json_or_400(submitted_json):
 
 
 def detect_framework_or_400(submitted_json):
-    framework = detect_framework(submitted_json)
+    framework, errors = detect_framework_with_errors(submitted_json)
     if not framework:
         abort(400, "JSON was not a valid format. {}".format(
-            reason_for_failure(submitted_json))
+            reason_for_failure(submitted_json, errors))
         )
 
     return framework
 
 
+FRAMEWORK_SCHEMAS = [
+    ('services-g4', 'G-Cloud 4'),
+    ('services-g5', 'G-Cloud 5'),
+    ('services-g6-scs', 'G-Cloud 6'),
+    ('services-g6-saas', 'G-Cloud 6'),
+    ('services-g6-paas', 'G-Cloud 6'),
+    ('services-g6-iaas', 'G-Cloud 6'),
+]
+FRAMEWORK_SCHEMA_LABELS = {
+    'services-g4': 'G4',
+    'services-g5': 'G5',
+    'services-g6-scs': 'SCS',
+    'services-g6-saas': 'SaaS',
+    'services-g6-paas': 'PaaS',
+    'services-g6-iaas': 'IaaS',
+}
+G6_LOT_SCHEMAS = {
+    'SCS': 'services-g6-scs',
+    'SaaS': 'services-g6-saas',
+    'PaaS': 'services-g6-paas',
+    'IaaS': 'services-g6-iaas',
+}
+
+
 def detect_framework(submitted_json):
-    if validates_against_schema('services-g4', submitted_json):
-        return 'G-Cloud 4'
-    elif validates_against_schema('services-g5', submitted_json):
-        return 'G-Cloud 5'
-    elif validates_against_schema('services-g6-scs', submitted_json) or \
-            validates_against_schema('services-g6-saas', submitted_json) or \
-            validates_against_schema('services-g6-paas', submitted_json) or \
-            validates_against_schema('services-g6-iaas', submitted_json):
-        return 'G-Cloud 6'
-    else:
-        return False
+    return detect_framework_with_errors(submitted_json)[0]
+
+
+@timed('validation')
+def detect_framework_with_errors(submitted_json):
+    """
+    Validate a service against the framework schemas, the likely
+    candidate first, until one of them accepts it
+
+    :return: a (framework, errors) tuple, where framework is False if no
+             schema accepted the service and errors maps the name of each
+             schema that was tried and rejected it to its error message
+    """
+    candidate = candidate_framework_schema(submitted_json)
+    schema_names = [schema_name for schema_name, _ in FRAMEWORK_SCHEMAS
+                    if schema_name != candidate]
+    if candidate is not None:
+        schema_names.insert(0, candidate)
+
+    errors = {}
+    for schema_name in schema_names:
+        error = schema_error(schema_name, submitted_json)
+        if error is None:
+            return dict(FRAMEWORK_SCHEMAS)[schema_name], errors
+        errors[schema_name] = error
+
+    return False, errors
 
 
+def candidate_framework_schema(submitted_json):
+    """
+    Pick the only framework schema a service could be valid against
+    from its discriminating fields, without validating it
+
+    G-Cloud 6 services must have `lastUpdated`/`lastCompleted`, which the
+    older schemas don't allow, and each G6 schema accepts a single `lot`.
+    G-Cloud 4 and 5 service ids must start with '4-' and '5-'.
+    :return: a schema name, or None if no single candidate is obvious
+    """
+    if 'lastUpdated' in submitted_json or 'lastCompleted' in submitted_json:
+        return G6_LOT_SCHEMAS.get(submitted_json.get('lot'))
+
+    service_id = u'{}'.format(submitted_json.get('id', ''))
+    if service_id.startswith('4-'):
+        return 'services-g4'
+    elif service_id.startswith('5-'):
+        return 'services-g5'
+
+    return None
+
+
+@timed('validation')
 def validate_supplier_json_or_400(submitted_json):
     try:
         get_validator('suppliers').validate(submitted_json)
@@ -99,6 +174,7 @@ def validate_supplier_json_or_400(submitted_json):
         abort(400, "JSON was not a valid format. {}".format(e.message))
 
 
+@timed('validation')
 def validate_contact_information_json_or_400(submitted_json):
     try:
         get_validator('contact-information').validate(submitted_json)
@@ -107,45 +183,39 @@ def validate_contact_information_json_or_400(submitted_json):
 
 
 def validates_against_schema(validator_name, submitted_json):
-    try:
-        get_validator(validator_name).validate(submitted_json)
-    except ValidationError:
-        return False
-    else:
-        return True
+    return schema_error(validator_name, submitted_json) is None
 
 
-def reason_for_failure(submitted_json):
-    response = []
-    try:
-        get_validator('services-g4').validate(submitted_json)
-    except ValidationError as e1:
-        response.append('Not G4: %s' % e1.message)
-
-    try:
-        get_validator('services-g5').validate(submitted_json)
-    except ValidationError as e1:
-        response.append('Not G5: %s' % e1.message)
-
+@timed('validation')
+def schema_error(validator_name, submitted_json):
+    """
+    :return: the message of the first error found validating against the
+             schema, or None if it is valid
+    """
     try:
-        get_validator('services-g6-scs').validate(submitted_json)
-    except ValidationError as e1:
-        response.append('Not SCS: %s' % e1.message)
+        get_validator(validator_name).validate(submitted_json)
+    except ValidationError as e:
+        return e.message
 
-    try:
-        get_validator('services-g6-saas').validate(submitted_json)
-    except ValidationError as e2:
-        response.append('Not SaaS: %s' % e2.message)
 
-    try:
-        get_validator('services-g6-paas').validate(submitted_json)
-    except ValidationError as e3:
-        response.append('Not PaaS: %s' % e3.message)
+def reason_for_failure(submitted_json, errors=None):
+    """
+    :param errors: schema errors already found by
+                   `detect_framework_with_errors`, so that the schemas
+                   aren't validated against a second time
+    """
+    if errors is None:
+        errors = {}
 
-    try:
-        get_validator('services-g6-iaas').validate(submitted_json)
-    except ValidationError as e4:
-        response.append('Not IaaS: %s' % e4.message)
+    response = []
+    for schema_name, _ in FRAMEWORK_SCHEMAS:
+        if schema_name in errors:
+            error = errors[schema_name]
+        else:
+            error = schema_error(schema_name, submitted_json)
+        if error is not None:
+            response.append('Not %s: %s' % (
+                FRAMEWORK_SCHEMA_LABELS[schema_name], error))
 
     return '. '.join(response)
 
@@ -1,11 +1,14 @@
 #!/usr/bin/env python
 
 import os
+from datetime import datetime
 
 from flask.ext.script import Manager, Server
 from flask.ext.migrate import Migrate, MigrateCommand
 
 from app import create_app, db
+from app.search_indexer import run_search_index_worker, \
+    services_to_index, reindex_services, incremental_reindex
 
 
 application = create_app(os.getenv('DM_ENVIRONMENT') or 'development')
@@ -14,5 +17,52 @@ manager.add_command("runserver", Server(port=5000))
 migrate = Migrate(application, db)
 manager.add_command('db', MigrateCommand)
 
+
+@manager.option('-b', '--batch-size', dest='batch_size', type=int,
+                help="Number of search index tasks to send at a time")
+@manager.option('--once', dest='once', action='store_true', default=False,
+                help="Stop when there are no more tasks to send")
+def search_index_worker(batch_size=None, once=False):
+    """Send queued service changes to the search API"""
+    run_search_index_worker(batch_size, once)
+
+
+def parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d')
+
+
+@manager.option('--framework', dest='framework',
+                help="Only index services on this framework")
+@manager.option('--supplier', dest='supplier_id', type=int,
+                help="Only index services from this supplier")
+@manager.option('--updated-since', dest='updated_since', type=parse_date,
+                help="Only index services updated on or after YYYY-MM-DD")
+@manager.option('--updated-before', dest='updated_before', type=parse_date,
+                help="Only index services updated before YYYY-MM-DD")
+@manager.option('--incremental', dest='incremental', action='store_true',
+                default=False,
+                help="Only send the changes since the last incremental run")
+@manager.option('-p', '--processes', dest='processes', type=int, default=10,
+                help="Number of services to index at a time")
+def reindex(framework=None, supplier_id=None, updated_since=None,
+            updated_before=None, incremental=False, processes=10):
+    """Index published services straight from the database"""
+    if incremental:
+        if framework or supplier_id or updated_since or updated_before:
+            print("--incremental can't be combined with filters")
+            return 2
+        indexed, deleted, failed = incremental_reindex(processes=processes)
+        print("Indexed {} services, deleted {}, {} failed".format(
+            indexed, deleted, failed))
+    else:
+        indexed, failed = reindex_services(
+            services_to_index(framework, supplier_id,
+                              updated_since, updated_before),
+            processes=processes)
+        print("Indexed {} services, {} failed".format(indexed, failed))
+
+    return 1 if failed else 0
+
+
 if __name__ == '__main__':
     manager.run()
@@ -26,9 +26,34 @@ class Config:
 
     DM_API_SERVICES_PAGE_SIZE = 100
     DM_API_SUPPLIERS_PAGE_SIZE = 100
+    DM_API_SERVICES_EXPORT_BATCH_SIZE = 1000
+    DM_API_SERVICES_BULK_IMPORT_LIMIT = 500
+    DM_API_SERVICE_CACHE_SIZE = 5000
+    DM_API_FRAMEWORK_CACHE_TTL = 60
+    DM_API_ARCHIVE_SNAPSHOT_INTERVAL = 20
+    DM_API_ARCHIVE_CACHE_SIZE = 1000
+    DM_API_PASSWORD_HASH_PROCESSES = 2
+    DM_API_PASSWORD_HASH_QUEUE_SIZE = 8
+    DM_API_PASSWORD_HASH_TIMEOUT = 10
+    DM_API_AUTH_TOKENS_FILE = None
+    DM_API_AUTH_TOKENS_RELOAD_SIGNAL = 'SIGHUP'
+    DM_API_TOKEN_RATE_LIMIT = 50
+    DM_API_TOKEN_RATE_LIMIT_BURST = 100
+    DM_API_TOKEN_CONCURRENCY_LIMIT = 10
+    DM_API_RATE_LIMIT_BACKEND = None
+    DM_SEARCH_INDEX_WORKER_BATCH_SIZE = 100
+    DM_SEARCH_INDEX_WORKER_POLL_INTERVAL = 5
+    DM_SEARCH_INDEX_RETRY_DELAY = 10
+    DM_SEARCH_INDEX_MAX_RETRY_DELAY = 3600
+    DM_SEARCH_REINDEX_OVERLAP = 300
     SQLALCHEMY_COMMIT_ON_TEARDOWN = False
     SQLALCHEMY_RECORD_QUERIES = True
     SQLALCHEMY_DATABASE_URI = 'postgresql://localhost/digitalmarketplace'
+    SQLALCHEMY_REPLICA_URIS = []
+    DM_API_REPLICA_MAX_LAG = 10
+    DM_API_REPLICA_CHECK_INTERVAL = 5
+    DM_API_SLOW_QUERY_THRESHOLD = 0.5
+    DM_API_SERVER_TIMING_HEADER = True
 
 
 class Test(Config):
@@ -39,6 +64,10 @@ class Test(Config):
     SQLALCHEMY_DATABASE_URI = 'postgresql://localhost/digitalmarketplace_test'
     DM_API_SERVICES_PAGE_SIZE = 5
     DM_API_SUPPLIERS_PAGE_SIZE = 5
+    DM_API_SERVICES_EXPORT_BATCH_SIZE = 2
+    DM_API_PASSWORD_HASH_PROCESSES = 0
+    DM_API_AUTH_TOKENS_RELOAD_SIGNAL = None
+    DM_API_TOKEN_RATE_LIMIT = 0
 
 
 class Development(Config):
@@ -49,6 +78,7 @@ class Live(Config):
     DEBUG = False
     ALLOW_EXPLORER = False
     DM_HTTP_PROTO = 'https'
+    DM_API_SERVER_TIMING_HEADER = False
 
 
 configs = {
@@ -0,0 +1,22 @@
+"""Add an index for listing the history of a service
+
+Revision ID: 100_archived_history_index
+Revises: 90_add_search_index_checkpoints
+Create Date: 2015-06-29 11:02:17.604381
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '100_archived_history_index'
+down_revision = '90_add_search_index_checkpoints'
+
+from alembic import op
+from sqlalchemy import text
+
+
+def upgrade():
+    op.create_index('ix_archived_services_history', 'archived_services', [text("service_id, updated_at DESC, id DESC")])
+
+
+def downgrade():
+    op.drop_index('ix_archived_services_history', table_name='archived_services')
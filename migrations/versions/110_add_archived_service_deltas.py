@@ -0,0 +1,44 @@
+"""Store archived services as deltas against the previous version
+
+Revision ID: 110_add_archived_service_deltas
+Revises: 100_archived_history_index
+Create Date: 2015-07-01 14:21:45.118304
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '110_add_archived_service_deltas'
+down_revision = '100_archived_history_index'
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+def upgrade():
+    op.add_column('archived_services',
+                  sa.Column('delta', postgresql.JSONB(), nullable=True))
+    op.add_column('archived_services',
+                  sa.Column('previous_id', sa.Integer(), nullable=True))
+    op.add_column('archived_services',
+                  sa.Column('snapshot_distance', sa.Integer(),
+                            nullable=False, server_default='0'))
+    op.create_foreign_key('archived_services_previous_id_fkey',
+                          'archived_services', 'archived_services',
+                          ['previous_id'], ['id'])
+
+
+def downgrade():
+    # Rebuilding the full data of delta encoded versions needs the
+    # application, and dropping the deltas would lose those versions
+    deltas = op.get_bind().execute(
+        "SELECT 1 FROM archived_services WHERE data IS NULL LIMIT 1"
+    ).first()
+    if deltas is not None:
+        raise Exception("archived_services has delta encoded versions")
+
+    op.drop_constraint('archived_services_previous_id_fkey',
+                       'archived_services', type_='foreignkey')
+    op.drop_column('archived_services', 'snapshot_distance')
+    op.drop_column('archived_services', 'previous_id')
+    op.drop_column('archived_services', 'delta')
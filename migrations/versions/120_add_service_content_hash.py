@@ -0,0 +1,23 @@
+"""Add a hash of the data and status of services
+
+Revision ID: 120_add_service_content_hash
+Revises: 110_add_archived_service_deltas
+Create Date: 2015-07-03 10:37:52.840716
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '120_add_service_content_hash'
+down_revision = '110_add_archived_service_deltas'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('services',
+                  sa.Column('content_hash', sa.String(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('services', 'content_hash')
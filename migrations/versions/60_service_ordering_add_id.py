@@ -0,0 +1,24 @@
+"""Add id to the service ordering index
+
+Revision ID: 60_service_ordering_add_id
+Revises: 30_add_audit_events
+Create Date: 2015-06-15 10:12:41.208351
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '60_service_ordering_add_id'
+down_revision = '30_add_audit_events'
+
+from alembic import op
+from sqlalchemy import text
+
+
+def upgrade():
+    op.drop_index('ix_service_ordering', table_name='services')
+    op.create_index('ix_service_ordering', 'services', [text("framework_id, (data->>'lot'), (data->>'serviceName'), id")])
+
+
+def downgrade():
+    op.drop_index('ix_service_ordering', table_name='services')
+    op.create_index('ix_service_ordering', 'services', [text("framework_id, (data->>'lot'), (data->>'serviceName')")])
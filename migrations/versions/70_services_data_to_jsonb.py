@@ -0,0 +1,114 @@
+"""Convert services, drafts and archive data columns from JSON to JSONB
+
+The conversion is done online: a `data_jsonb` column is added and kept in
+step with `data` by a trigger while existing rows are backfilled in
+batches, each committed separately. Indexes are built concurrently on
+the new column before the swap, so writes carry on while they're built
+and the final transaction only drops the old column and renames the new
+one.
+
+Revision ID: 70_services_data_to_jsonb
+Revises: 60_service_ordering_add_id
+Create Date: 2015-06-22 14:03:12.518204
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '70_services_data_to_jsonb'
+down_revision = '60_service_ordering_add_id'
+
+from alembic import op
+from sqlalchemy import text
+
+BATCH_SIZE = 1000
+TABLES = ['services', 'draft_services', 'archived_services']
+GIN_INDEXED_TABLES = ['services', 'draft_services']
+
+SERVICE_ORDERING = "framework_id, (data->>'lot'), (data->>'serviceName'), id"
+
+
+def commit():
+    """End the current transaction so its locks are released"""
+    op.execute("COMMIT")
+    op.execute("BEGIN")
+
+
+def create_index_concurrently(name, definition):
+    """Build an index without blocking writes to its table. This can't
+    be done inside a transaction. An invalid index left by an earlier,
+    failed build is dropped first."""
+    op.execute("COMMIT")
+    op.execute("DROP INDEX CONCURRENTLY IF EXISTS {0}".format(name))
+    op.execute("CREATE INDEX CONCURRENTLY {0} ON {1}".format(
+        name, definition))
+    op.execute("BEGIN")
+
+
+def upgrade():
+    connection = op.get_bind()
+
+    for table in TABLES:
+        # The column is left behind if an earlier run was interrupted
+        if not connection.execute(text("""
+            SELECT 1 FROM information_schema.columns
+            WHERE table_name = :table AND column_name = 'data_jsonb'
+        """), table=table).scalar():
+            op.execute(
+                "ALTER TABLE {0} ADD COLUMN data_jsonb jsonb".format(table))
+        op.execute("""
+            CREATE OR REPLACE FUNCTION {0}_sync_data_jsonb() RETURNS trigger AS $$
+            BEGIN
+                NEW.data_jsonb := NEW.data::jsonb;
+                RETURN NEW;
+            END
+            $$ LANGUAGE plpgsql
+        """.format(table))
+        op.execute("""
+            DROP TRIGGER IF EXISTS {0}_sync_data_jsonb ON {0};
+            CREATE TRIGGER {0}_sync_data_jsonb
+                BEFORE INSERT OR UPDATE OF data ON {0}
+                FOR EACH ROW EXECUTE PROCEDURE {0}_sync_data_jsonb()
+        """.format(table))
+        commit()
+
+    for table in TABLES:
+        max_id = connection.execute(
+            "SELECT max(id) FROM {0}".format(table)).scalar() or 0
+        for start in range(0, max_id + 1, BATCH_SIZE):
+            connection.execute(text("""
+                UPDATE {0} SET data_jsonb = data::jsonb
+                WHERE id >= :start AND id < :end AND data_jsonb IS NULL
+            """.format(table)), start=start, end=start + BATCH_SIZE)
+            commit()
+
+    create_index_concurrently(
+        'ix_service_ordering_jsonb',
+        "services ({0})".format(
+            SERVICE_ORDERING.replace('data->>', 'data_jsonb->>')))
+    for table in GIN_INDEXED_TABLES:
+        create_index_concurrently(
+            'ix_{0}_data'.format(table),
+            "{0} USING gin (data_jsonb jsonb_path_ops)".format(table))
+
+    for table in TABLES:
+        op.execute("DROP TRIGGER {0}_sync_data_jsonb ON {0}".format(table))
+        op.execute("DROP FUNCTION {0}_sync_data_jsonb()".format(table))
+        # Also drops the old ix_service_ordering
+        op.drop_column(table, 'data')
+        op.alter_column(table, 'data_jsonb', new_column_name='data')
+
+    op.execute(
+        "ALTER INDEX ix_service_ordering_jsonb RENAME TO ix_service_ordering")
+
+
+def downgrade():
+    op.drop_index('ix_service_ordering', table_name='services')
+    for table in GIN_INDEXED_TABLES:
+        op.drop_index('ix_{0}_data'.format(table), table_name=table)
+
+    for table in TABLES:
+        op.execute(
+            "ALTER TABLE {0} ALTER COLUMN data TYPE json USING data::json"
+            .format(table))
+
+    op.create_index('ix_service_ordering', 'services', [text(SERVICE_ORDERING)])
@@ -0,0 +1,40 @@
+"""Add the search index outbox
+
+Revision ID: 80_add_search_index_outbox
+Revises: 70_services_data_to_jsonb
+Create Date: 2015-06-24 10:12:41.803417
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '80_add_search_index_outbox'
+down_revision = '70_services_data_to_jsonb'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table(
+        'search_index_outbox',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('service_id', sa.String(), nullable=False),
+        sa.Column('action', sa.String(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+        sa.Column('last_error', sa.String(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_search_index_outbox_service_id'),
+                    'search_index_outbox', ['service_id'], unique=False)
+    op.create_index(op.f('ix_search_index_outbox_next_attempt_at'),
+                    'search_index_outbox', ['next_attempt_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_search_index_outbox_next_attempt_at'),
+                  table_name='search_index_outbox')
+    op.drop_index(op.f('ix_search_index_outbox_service_id'),
+                  table_name='search_index_outbox')
+    op.drop_table('search_index_outbox')
@@ -0,0 +1,29 @@
+"""Add search index checkpoints for incremental reindexing
+
+Revision ID: 90_add_search_index_checkpoints
+Revises: 80_add_search_index_outbox
+Create Date: 2015-06-25 16:40:03.271954
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '90_add_search_index_checkpoints'
+down_revision = '80_add_search_index_outbox'
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+def upgrade():
+    op.create_table(
+        'search_index_checkpoints',
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('watermark', sa.DateTime(), nullable=True),
+        sa.Column('live_framework_ids', postgresql.JSON(), nullable=True),
+        sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('search_index_checkpoints')
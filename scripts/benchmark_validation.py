@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+"""Time validating the example listings against every service schema with
+jsonschema and with the compiled validators used by the API.
+
+Usage:
+    benchmark_validation.py [options]
+
+    --number=<n>    Validations per listing and schema [default: 200]
+
+Example:
+    ./scripts/benchmark_validation.py --number=1000
+
+Run from the root of the project so the schemas can be found.
+"""
+
+from __future__ import print_function
+import os
+import sys
+import json
+import timeit
+
+from docopt import docopt
+from jsonschema import ValidationError
+from jsonschema.validators import validator_for
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from app.validation import _SCHEMAS, FORMAT_CHECKER, FRAMEWORK_SCHEMAS  # noqa
+from app.schema_compiler import compile_schema  # noqa
+
+EXAMPLE_LISTINGS_PATH = 'example_listings'
+
+
+def load_example_listings():
+    listings = {}
+    for file_name in sorted(os.listdir(EXAMPLE_LISTINGS_PATH)):
+        if file_name.startswith('G'):
+            with open(os.path.join(EXAMPLE_LISTINGS_PATH, file_name)) as f:
+                listings[file_name[:-5]] = json.load(f)
+    return listings
+
+
+def validate(validator, listing):
+    try:
+        validator.validate(listing)
+    except ValidationError:
+        pass
+
+
+def jsonschema_validator(schema):
+    return validator_for(schema)(schema, format_checker=FORMAT_CHECKER)
+
+
+def time_per_call(function, number):
+    return timeit.timeit(function, number=number) / number * 1000
+
+
+def do_benchmark(number):
+    listings = load_example_listings()
+
+    print("{:<12} {:<18} {:>11} {:>11} {:>11} {:>8}".format(
+        "listing", "schema", "jsonschema", "cached", "compiled", "speedup"))
+
+    total_jsonschema = total_compiled = 0
+    for schema_name, _ in FRAMEWORK_SCHEMAS:
+        schema = _SCHEMAS[schema_name]
+        cached = jsonschema_validator(schema)
+        compiled = compile_schema(schema, FORMAT_CHECKER)
+
+        for name, listing in sorted(listings.items()):
+            fresh_time = time_per_call(
+                lambda: validate(jsonschema_validator(schema), listing),
+                number)
+            cached_time = time_per_call(
+                lambda: validate(cached, listing), number)
+            compiled_time = time_per_call(
+                lambda: validate(compiled, listing), number)
+
+            total_jsonschema += fresh_time
+            total_compiled += compiled_time
+            print("{:<12} {:<18} {:>9.3f}ms {:>9.3f}ms {:>9.3f}ms "
+                  "{:>7.1f}x".format(
+                      name, schema_name, fresh_time, cached_time,
+                      compiled_time, fresh_time / compiled_time))
+
+    print("Total: jsonschema {:.3f}ms, compiled {:.3f}ms ({:.1f}x)".format(
+        total_jsonschema, total_compiled, total_jsonschema / total_compiled))
+
+
+if __name__ == "__main__":
+    arguments = docopt(__doc__)
+    do_benchmark(int(arguments['--number']))
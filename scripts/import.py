@@ -6,10 +6,12 @@ Usage:
 
     --cert=<cert>   Path to certificate file to verify against
     --serial        Do not run in parallel (useful for debugging)
+    --bulk=<size>   Import batches of <size> services with each request
     -v, --verbose   Enable verbose output for errors
 
 Example:
     ./import.py --serial http://localhost:5000 myToken ~/myData
+    ./import.py --bulk=200 http://localhost:5000 myToken ~/myData
 """
 from __future__ import print_function
 import sys
@@ -42,6 +44,26 @@ def print_progress(counter, start_time):
                                        counter / time_delta.total_seconds()))
 
 
+def load_listing(file_path):
+    with open(file_path) as f:
+        try:
+            data = json.load(f)
+            data["id"] = str(data["id"])
+        except ValueError:
+            print("Skipping {}: not a valid JSON file".format(file_path))
+            return None
+    return data
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
 class ServicePutter(object):
     def __init__(self, endpoint, access_token, cert=None):
         self.endpoint = endpoint
@@ -49,13 +71,9 @@ class ServicePutter(object):
         self.cert = cert
 
     def __call__(self, file_path):
-        with open(file_path) as f:
-            try:
-                data = json.load(f)
-                data["id"] = str(data["id"])
-            except ValueError:
-                print("Skipping {}: not a valid JSON file".format(file_path))
-                return file_path, None
+        data = load_listing(file_path)
+        if data is None:
+            return file_path, None
         data = {'update_details': {'updated_by': getpass.getuser(),
                                    'update_reason': 'service import'},
                 'services': data}
@@ -71,7 +89,27 @@ class ServicePutter(object):
         return file_path, response
 
 
-def do_import(base_url, access_token, listing_dir, serial, cert, verbose):
+class ServiceBatchPoster(ServicePutter):
+    def __call__(self, file_paths):
+        file_paths = [(file_path, load_listing(file_path))
+                      for file_path in file_paths]
+        data = {'update_details': {'updated_by': getpass.getuser(),
+                                   'update_reason': 'service import'},
+                'services': [data for _, data in file_paths
+                             if data is not None]}
+        response = requests.post(
+            '{}/bulk-import'.format(self.endpoint),
+            data=json.dumps(data),
+            headers={
+                "content-type": "application/json",
+                "authorization": "Bearer {}".format(self.access_token),
+            },
+            verify=self.cert if self.cert else True)
+        return file_paths, response
+
+
+def do_import(base_url, access_token, listing_dir, serial, cert, verbose,
+              bulk=None):
     endpoint = "{}/services".format(base_url)
     print("Base URL: {}".format(base_url))
     print("Access token: {}".format(access_token))
@@ -83,6 +121,10 @@ def do_import(base_url, access_token, listing_dir, serial, cert, verbose):
         pool = multiprocessing.Pool(10)
         mapper = pool.imap
 
+    if bulk:
+        return do_bulk_import(mapper, endpoint, access_token, listing_dir,
+                              cert, verbose, bulk)
+
     putter = ServicePutter(endpoint, access_token, cert)
 
     counter = 0
@@ -102,6 +144,37 @@ def do_import(base_url, access_token, listing_dir, serial, cert, verbose):
 
     print_progress(counter, start_time)
 
+
+def do_bulk_import(mapper, endpoint, access_token, listing_dir, cert, verbose,
+                   size):
+    poster = ServiceBatchPoster(endpoint, access_token, cert)
+
+    counter = 0
+    start_time = datetime.now()
+    batch_files = batches(list_files(listing_dir), size)
+    for file_paths, response in mapper(poster, batch_files):
+        if response.status_code != 200:
+            print("ERROR: {} on batch of {} files".format(
+                response.status_code, len(file_paths)), file=sys.stderr)
+            if verbose:
+                print(response.text, file=sys.stderr)
+            continue
+
+        loaded = [file_path for file_path, data in file_paths
+                  if data is not None]
+        results = response.json()['results']
+        for file_path, result in zip(loaded, results):
+            if result['status'] != 201:
+                print("ERROR: {} on {}".format(result['status'], file_path),
+                      file=sys.stderr)
+                if verbose:
+                    print(result['error'], file=sys.stderr)
+            else:
+                counter += 1
+                print_progress(counter, start_time)
+
+    print_progress(counter, start_time)
+
 if __name__ == "__main__":
     arguments = docopt(__doc__)
     do_import(
@@ -111,4 +184,5 @@ if __name__ == "__main__":
         serial=arguments['--serial'],
         cert=arguments['--cert'],
         verbose=arguments['--verbose'],
+        bulk=int(arguments['--bulk'] or 0),
     )
@@ -5,22 +5,34 @@ Usage:
     index_services.py <search_endpoint> <search_access_token> <api_endpoint>
               <api_access_token> [options]
 
-    --serial        Do not run in parallel (useful for debugging)
+    --serial            Do not run in parallel (useful for debugging)
+    --batch-size=<n>    Send services to each worker in batches of <n>,
+                        indexed over a keep-alive connection
 
 Example:
     ./index_services.py http://search-api myToken http://data-api token
+    ./index_services.py --batch-size=500 http://localhost:5001 myToken \
+        http://data-api token
+
+Use scripts/search_api_stand_in.py as <search_endpoint> to time indexing
+without a search API.
 """
 
 from __future__ import print_function
 from six.moves import map
 import sys
+import time
 import multiprocessing
 from itertools import islice
 from datetime import datetime
 
+import requests
 from docopt import docopt
 from dmutils import apiclient
 
+# The requests `SearchAPIClient` makes to index and delete a service
+SEARCH_API_SERVICE_PATH = '{}/g-cloud/services/{}'
+
 
 def request_services(api_url, api_access_token, page=1):
 
@@ -51,20 +63,18 @@ def print_progress(counter, start_time):
 
 class ServiceIndexer(object):
     def __init__(self, endpoint, access_token):
-        self.endpoint = endpoint
-        self.access_token = access_token
+        self.client = apiclient.SearchAPIClient(endpoint, access_token)
 
     def __call__(self, service):
-        client = apiclient.SearchAPIClient(self.endpoint, self.access_token)
         try:
             if service['status'] == 'published':
-                client.index(
+                self.client.index(
                     service['id'],
                     service,
                     service['supplierName'],
                     service['frameworkName'])
             else:
-                client.delete(service['id'])
+                self.client.delete(service['id'])
             return True
         except apiclient.APIError as e:
             print("ERROR: {}. {} not indexed".format(e.message,
@@ -73,6 +83,93 @@ class ServiceIndexer(object):
             return False
 
 
+_session = None
+
+
+def init_batch_worker():
+    """Give each worker process its own keep-alive session"""
+    global _session
+    _session = requests.Session()
+
+
+class BatchServiceIndexer(object):
+    def __init__(self, endpoint, access_token):
+        self.endpoint = endpoint.rstrip('/')
+        self.headers = {
+            "content-type": "application/json",
+            "authorization": "Bearer {}".format(access_token),
+        }
+
+    def __call__(self, services):
+        """
+        :return: (number of services indexed, number of services in the
+                 batch, seconds taken)
+        """
+        start_time = time.time()
+        indexed = 0
+        for service in services:
+            url = SEARCH_API_SERVICE_PATH.format(self.endpoint, service['id'])
+            try:
+                if service['status'] == 'published':
+                    response = _session.put(url, json={'service': service},
+                                            headers=self.headers)
+                else:
+                    response = _session.delete(url, headers=self.headers)
+                    # Never indexed, so there's nothing to delete
+                    if response.status_code == 404:
+                        indexed += 1
+                        continue
+                response.raise_for_status()
+                indexed += 1
+            except requests.RequestException as e:
+                print("ERROR: {}. {} not indexed".format(e, service.get('id')),
+                      file=sys.stderr)
+
+        return indexed, len(services), time.time() - start_time
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def do_batch_index(search_api_url, search_api_access_token, data_api_url,
+                   data_api_access_token, serial, batch_size):
+    print("Search API URL: {}".format(search_api_url))
+    print("Data API URL: {}".format(data_api_url))
+
+    if serial:
+        init_batch_worker()
+        mapper = map
+    else:
+        pool = multiprocessing.Pool(10, initializer=init_batch_worker)
+        mapper = pool.imap_unordered
+
+    indexer = BatchServiceIndexer(search_api_url, search_api_access_token)
+    iter_services = request_services(data_api_url, data_api_access_token)
+
+    counter = 0
+    start_time = datetime.now()
+    status = True
+    try:
+        for indexed, size, seconds in mapper(
+                indexer, batches(iter_services, batch_size)):
+            counter += indexed
+            status = status and indexed == size
+            print("Batch of {} in {:.2f}s ({:.1f}/s), {} in {}".format(
+                size, seconds, size / seconds if seconds else 0,
+                counter, datetime.now() - start_time))
+    except apiclient.APIError as e:
+        print('API request failed: {}'.format(e.message), file=sys.stderr)
+        return False
+
+    return status
+
+
 def do_index(search_api_url, search_api_access_token, data_api_url,
              data_api_access_token, serial):
     print("Search API URL: {}".format(search_api_url))
@@ -105,19 +202,24 @@ def do_index(search_api_url, search_api_access_token, data_api_url,
             status = status and result
             print_progress(counter, start_time)
 
-    return status
-
     print_progress(counter, start_time)
 
+    return status
+
 if __name__ == "__main__":
     arguments = docopt(__doc__)
-    ok = do_index(
+    index_arguments = dict(
         search_api_url=arguments['<search_endpoint>'],
         search_api_access_token=arguments['<search_access_token>'],
         data_api_url=arguments['<api_endpoint>'],
         data_api_access_token=arguments['<api_access_token>'],
         serial=arguments['--serial'],
     )
+    if arguments['--batch-size']:
+        ok = do_batch_index(batch_size=int(arguments['--batch-size']),
+                            **index_arguments)
+    else:
+        ok = do_index(**index_arguments)
 
     if not ok:
         sys.exit(1)
@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+"""Accept index and delete requests the way the search API does, without
+indexing anything, to time scripts/index_services.py locally.
+
+Usage:
+    search_api_stand_in.py [options]
+
+    --port=<port>       Port to listen on [default: 5001]
+    --delay=<seconds>   Time to take over each request [default: 0]
+
+Example:
+    ./search_api_stand_in.py --port=5001 --delay=0.01
+"""
+
+from __future__ import print_function
+import time
+
+from docopt import docopt
+from flask import Flask, jsonify, request, abort
+
+app = Flask(__name__)
+documents = {}
+
+
+@app.route('/<index_name>/services/<service_id>', methods=['PUT'])
+def index_service(index_name, service_id):
+    time.sleep(app.config['DELAY'])
+    json_payload = request.get_json()
+    if not json_payload or 'service' not in json_payload:
+        abort(400)
+    documents[(index_name, service_id)] = json_payload['service']
+    return jsonify(message="acknowledged"), 200
+
+
+@app.route('/<index_name>/services/<service_id>', methods=['DELETE'])
+def delete_service(index_name, service_id):
+    time.sleep(app.config['DELAY'])
+    if documents.pop((index_name, service_id), None) is None:
+        abort(404)
+    return jsonify(message="acknowledged"), 200
+
+
+if __name__ == "__main__":
+    arguments = docopt(__doc__)
+    app.config['DELAY'] = float(arguments['--delay'])
+    app.run(port=int(arguments['--port']), threaded=True)
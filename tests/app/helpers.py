@@ -2,9 +2,11 @@ from __future__ import absolute_import
 
 import os
 import json
+from contextlib import contextmanager
 from datetime import datetime
 
 from nose.tools import assert_equal, assert_in
+from sqlalchemy import event
 
 from app import create_app, db
 from app.models import Service, Supplier, ContactInformation, Framework
@@ -50,6 +52,22 @@ class BaseApplicationTest(object):
     def do_not_provide_access_token(self):
         self.app.wsgi_app = self.app.wsgi_app.app
 
+    @contextmanager
+    def recorded_queries(self, engine=None):
+        """Record the SQL statements run inside the block, on the primary
+        database unless another `engine` is given"""
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        engine = engine or db.get_engine(self.app)
+        event.listen(engine, 'before_cursor_execute', record)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, 'before_cursor_execute', record)
+
     def setup_dummy_suppliers(self, n):
         with self.app.app_context():
             for i in range(n):
@@ -4,6 +4,7 @@ Tests for the application infrastructure
 from flask import json
 from nose.tools import assert_equal
 
+from app.authentication import rate_limiter
 from .helpers import BaseApplicationTest
 
 
@@ -33,3 +34,13 @@ class TestApplication(BaseApplicationTest):
     def test_max_age_is_one_day(self):
         response = self.client.get('/')
         assert_equal(86400, response.cache_control.max_age)
+
+    def test_requests_over_the_token_rate_limit_are_throttled(self):
+        rate_limiter.rate = 1
+        rate_limiter.burst = 2
+        assert_equal(self.client.get('/').status_code, 200)
+        assert_equal(self.client.get('/').status_code, 200)
+
+        response = self.client.get('/')
+        assert_equal(response.status_code, 429)
+        assert_equal(response.headers['Retry-After'], '1')
@@ -0,0 +1,115 @@
+from datetime import datetime
+
+from nose.tools import assert_equal, assert_is_none, assert_is_not_none
+
+from app import db, archived_data_cache
+from app.archive import archive_service, archived_data
+from app.models import Service, Supplier, ArchivedService
+from .helpers import BaseApplicationTest
+
+
+class TestArchiveService(BaseApplicationTest):
+    def setup(self):
+        super(TestArchiveService, self).setup()
+        self.app.config['DM_API_ARCHIVE_SNAPSHOT_INTERVAL'] = 3
+        now = datetime.utcnow()
+        with self.app.app_context():
+            db.session.add(Supplier(supplier_id=1, name=u"Supplier 1"))
+            db.session.add(Service(service_id="1234567890123456",
+                                   supplier_id=1,
+                                   updated_at=now,
+                                   status='published',
+                                   created_at=now,
+                                   updated_by="tests",
+                                   framework_id=1,
+                                   updated_reason="test data",
+                                   data={'serviceName': 'Version 0',
+                                         'lot': 'SaaS'}))
+            db.session.commit()
+
+    def archive_versions(self, count):
+        """Archive the service, then change its name, `count` times"""
+        with self.app.app_context():
+            service = Service.query.first()
+            for i in range(count):
+                db.session.add(archive_service(service))
+                service.data = dict(service.data,
+                                    serviceName='Version {}'.format(i + 1))
+                db.session.add(service)
+                db.session.commit()
+
+    def archived_services(self):
+        return ArchivedService.query.order_by(ArchivedService.id).all()
+
+    def test_first_version_is_stored_in_full(self):
+        self.archive_versions(1)
+        with self.app.app_context():
+            archived, = self.archived_services()
+            assert_equal(archived.data,
+                         {'serviceName': 'Version 0', 'lot': 'SaaS'})
+            assert_is_none(archived.previous_id)
+
+    def test_later_versions_are_stored_as_deltas(self):
+        self.archive_versions(2)
+        with self.app.app_context():
+            first, second = self.archived_services()
+            assert_is_none(second.data)
+            assert_equal(second.delta, {'set': {'serviceName': 'Version 1'}})
+            assert_equal(second.previous_id, first.id)
+
+    def test_snapshots_are_taken_periodically(self):
+        self.archive_versions(7)
+        with self.app.app_context():
+            assert_equal(
+                [archived.data is not None
+                 for archived in self.archived_services()],
+                [True, False, False, True, False, False, True])
+
+    def test_every_version_is_rebuilt(self):
+        self.archive_versions(7)
+        archived_data_cache.clear()
+        with self.app.app_context():
+            data = archived_data(list(reversed(self.archived_services())))
+
+        assert_equal([version['serviceName'] for version in data],
+                     ['Version {}'.format(i) for i in reversed(range(7))])
+        assert_equal(set(version['lot'] for version in data), {'SaaS'})
+
+    def test_rebuilt_versions_are_cached(self):
+        self.archive_versions(3)
+        archived_data_cache.clear()
+        with self.app.app_context():
+            archived = self.archived_services()[-1]
+            with self.recorded_queries() as statements:
+                archived_data([archived])
+                archived_data([archived])
+
+        assert_equal(len(statements), 1)
+
+    def test_versions_archived_concurrently_are_rebuilt(self):
+        self.archive_versions(1)
+        with self.app.app_context():
+            service = Service.query.first()
+            first = archive_service(service)
+            second = archive_service(service)
+            second.delta = {'set': {'serviceName': 'Concurrent version'}}
+            db.session.add(first)
+            db.session.add(second)
+            db.session.commit()
+            assert_equal(first.previous_id, second.previous_id)
+            archived_data_cache.clear()
+
+            assert_equal(
+                [version['serviceName'] for version in
+                 archived_data([second, first])],
+                ['Concurrent version', 'Version 1'])
+
+    def test_previous_version_is_not_loaded_with_its_supplier(self):
+        self.archive_versions(1)
+        with self.app.app_context():
+            service = Service.query.first()
+            with self.recorded_queries() as statements:
+                assert_is_not_none(archive_service(service).delta)
+
+        assert_equal(len(statements), 1)
+        assert_equal(statements[0].count('suppliers'), 0)
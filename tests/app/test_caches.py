@@ -0,0 +1,181 @@
+from datetime import datetime, timedelta
+
+from flask import json
+from nose.tools import assert_equal, assert_not_equal, assert_in, \
+    assert_not_in, assert_is_none
+
+from app import db
+from app.caches import SerializedServiceCache, FrameworkRegistry, \
+    ArchivedDataCache
+from app.models import Service, Supplier, Framework
+from .helpers import BaseApplicationTest
+
+
+class TestSerializedServiceCache(BaseApplicationTest):
+    def setup(self):
+        super(TestSerializedServiceCache, self).setup()
+        self.cache = SerializedServiceCache(maxsize=2)
+        self.supplier = Supplier(supplier_id=1, name=u"Supplier 1")
+        self.framework = Framework(id=1, name=u"G-Cloud 6", expired=False)
+
+    def service(self, service_id, updated_at=None):
+        return Service(service_id=service_id,
+                       supplier_id=1,
+                       supplier=self.supplier,
+                       framework=self.framework,
+                       updated_at=updated_at or datetime(2015, 6, 1),
+                       status='published',
+                       data={'serviceName': 'A service'})
+
+    def test_returns_encoded_serialization(self):
+        service = self.service('1234567890')
+        with self.app.test_request_context():
+            encoded = self.cache.serialize(service)
+            assert_equal(json.loads(encoded), service.serialize())
+
+    def test_counts_hits_and_misses(self):
+        service = self.service('1234567890')
+        with self.app.test_request_context():
+            self.cache.serialize(service)
+            self.cache.serialize(service)
+
+        assert_equal(self.cache.stats()['misses'], 1)
+        assert_equal(self.cache.stats()['hits'], 1)
+
+    def test_new_version_is_a_miss(self):
+        with self.app.test_request_context():
+            first = self.cache.serialize(self.service('1234567890'))
+            second = self.cache.serialize(self.service(
+                '1234567890', updated_at=datetime(2015, 6, 2)))
+
+        assert_not_equal(first, second)
+        assert_equal(self.cache.stats()['misses'], 2)
+        assert_equal(self.cache.stats()['size'], 1)
+
+    def test_supplier_name_change_is_a_miss(self):
+        service = self.service('1234567890')
+        with self.app.test_request_context():
+            self.cache.serialize(service)
+            self.supplier.name = u"Renamed"
+            encoded = self.cache.serialize(service)
+
+        assert_equal(json.loads(encoded)['supplierName'], u"Renamed")
+        assert_equal(self.cache.stats()['hits'], 0)
+
+    def test_evicts_least_recently_used(self):
+        with self.app.test_request_context():
+            self.cache.serialize(self.service('1111111111'))
+            self.cache.serialize(self.service('2222222222'))
+            self.cache.serialize(self.service('1111111111'))
+            self.cache.serialize(self.service('3333333333'))
+            self.cache.serialize(self.service('1111111111'))
+
+        assert_equal(self.cache.stats()['evictions'], 1)
+        assert_equal(self.cache.stats()['size'], 2)
+        assert_equal(self.cache.stats()['hits'], 2)
+
+    def test_invalidate(self):
+        service = self.service('1234567890')
+        with self.app.test_request_context():
+            self.cache.serialize(service)
+            self.cache.invalidate('1234567890')
+            self.cache.serialize(service)
+
+        assert_equal(self.cache.stats()['misses'], 2)
+
+
+class TestServiceCacheStatus(BaseApplicationTest):
+    def test_status_reports_cache_counters(self):
+        self.setup_dummy_services_including_unpublished(1)
+        self.client.get('/services')
+        self.client.get('/services')
+
+        response = self.client.get('/_status')
+        data = json.loads(response.get_data())
+
+        assert_equal(data['service_cache']['misses'], 3)
+        assert_equal(data['service_cache']['hits'], 3)
+
+
+def test_archived_data_cache_evicts_the_least_recently_used():
+    cache = ArchivedDataCache(maxsize=2)
+    cache.set(1, {'serviceName': 'One'})
+    cache.set(2, {'serviceName': 'Two'})
+    cache.get(1)
+    cache.set(3, {'serviceName': 'Three'})
+
+    assert_equal(cache.get(1), {'serviceName': 'One'})
+    assert_is_none(cache.get(2))
+    assert_equal(cache.get(3), {'serviceName': 'Three'})
+
+
+class TestFrameworkRegistry(BaseApplicationTest):
+    def setup(self):
+        super(TestFrameworkRegistry, self).setup()
+        self.registry = FrameworkRegistry(ttl=60)
+        with self.app.app_context():
+            db.session.add(Framework(id=123, name=u"expired", expired=True))
+            db.session.commit()
+
+    def test_live_ids_excludes_expired_frameworks(self):
+        with self.app.app_context():
+            live_ids = self.registry.live_ids()
+
+        assert_in(1, live_ids)
+        assert_not_in(123, live_ids)
+
+    def test_lookups(self):
+        with self.app.app_context():
+            assert_equal(self.registry.get_by_name(u"G-Cloud 6").id, 1)
+            assert_equal(self.registry.get(123).name, u"expired")
+            assert_is_none(self.registry.get_by_name(u"G-Cloud 99"))
+
+    def test_frameworks_are_loaded_once(self):
+        with self.app.app_context():
+            with self.recorded_queries() as statements:
+                self.registry.live_ids()
+                self.registry.get_by_name(u"expired")
+
+        assert_equal(len(statements), 1)
+
+    def test_invalidate_reloads_frameworks(self):
+        with self.app.app_context():
+            self.registry.live_ids()
+            Framework.query.filter(Framework.id == 123).update(
+                {'expired': False})
+            db.session.commit()
+            assert_not_in(123, self.registry.live_ids())
+
+            self.registry.invalidate()
+            assert_in(123, self.registry.live_ids())
+
+    def test_lookup_miss_reloads_frameworks(self):
+        with self.app.app_context():
+            self.registry.live_ids()
+            db.session.add(Framework(id=124, name=u"new", expired=False))
+            db.session.commit()
+
+            assert_equal(self.registry.get(124).name, u"new")
+            assert_equal(self.registry.get_by_name(u"new").id, 124)
+            assert_in(124, self.registry.live_ids())
+
+    def test_frameworks_are_reloaded_after_the_ttl(self):
+        self.registry.ttl = 0
+        with self.app.app_context():
+            with self.recorded_queries() as statements:
+                self.registry.live_ids()
+                self.registry.live_ids()
+
+        assert_equal(len(statements), 2)
+
+
+class TestFrameworkRegistryQueries(BaseApplicationTest):
+    def test_list_services_does_not_query_frameworks_again(self):
+        self.setup_dummy_services_including_unpublished(1)
+        self.client.get('/services')
+        with self.recorded_queries() as statements:
+            self.client.get('/services')
+
+        for statement in statements:
+            assert_not_in('EXISTS', statement)
+            assert_not_in('FROM frameworks', statement)
@@ -1,6 +1,8 @@
-from nose.tools import assert_equal, assert_not_equal
+from nose.tools import assert_equal, assert_not_equal, assert_raises, \
+    assert_true
 
-from app.encryption import checkpw, hashpw
+from app.encryption import checkpw, hashpw, PasswordHasher, \
+    PasswordHasherBusy
 
 
 def test_should_hash_password():
@@ -18,3 +20,50 @@ def test_should_check_invalid_password():
     password = "mypassword"
     password_hash = hashpw(password)
     assert_equal(checkpw("not my password", password_hash), False)
+
+
+class TestPasswordHasher(object):
+    def setup(self):
+        self.password_hash = hashpw("mypassword")
+
+    def test_checks_passwords_in_a_worker_process(self):
+        hasher = PasswordHasher(processes=1, queue_size=1)
+        try:
+            assert_equal(hasher.checkpw("mypassword", self.password_hash),
+                         True)
+            assert_equal(hasher.checkpw("not my password",
+                                        self.password_hash), False)
+        finally:
+            hasher.close()
+
+    def test_calls_that_time_out_are_rejected(self):
+        hasher = PasswordHasher(processes=1, queue_size=1, timeout=0.001)
+        try:
+            assert_raises(PasswordHasherBusy, hasher.checkpw,
+                          "mypassword", self.password_hash)
+            stats = hasher.stats()
+            assert_equal(stats['timed_out'], 1)
+            assert_equal(stats['in_flight'], 0)
+        finally:
+            hasher.close()
+
+    def test_hashes_passwords_without_a_pool(self):
+        hasher = PasswordHasher(processes=0, queue_size=1)
+        assert_equal(checkpw("mypassword", hasher.hashpw("mypassword")),
+                     True)
+
+    def test_rejects_calls_when_the_queue_is_full(self):
+        hasher = PasswordHasher(processes=0, queue_size=1)
+        hasher.in_flight = 1
+        assert_raises(PasswordHasherBusy, hasher.checkpw,
+                      "mypassword", self.password_hash)
+        assert_equal(hasher.stats()['rejected'], 1)
+
+    def test_records_timings(self):
+        hasher = PasswordHasher(processes=0, queue_size=1)
+        hasher.checkpw("mypassword", self.password_hash)
+        stats = hasher.stats()
+        assert_equal(stats['completed'], 1)
+        assert_equal(stats['in_flight'], 0)
+        assert_true(stats['hash_seconds'] > 0)
+        assert_equal(stats['max_hash_seconds'], stats['hash_seconds'])
@@ -0,0 +1,52 @@
+import mock
+from nose.tools import assert_equal, assert_in, assert_not_in, assert_true
+
+from app import request_instrumentation
+from .helpers import BaseApplicationTest
+
+
+class TestRequestInstrumentation(BaseApplicationTest):
+    def setup(self):
+        super(TestRequestInstrumentation, self).setup()
+        self.setup_dummy_suppliers(1)
+
+    def server_timing(self, response):
+        return dict(
+            entry.split(';', 1)
+            for entry in response.headers['Server-Timing'].split(', '))
+
+    def test_server_timing_header_is_added(self):
+        with self.recorded_queries() as statements:
+            response = self.client.get('/suppliers/0')
+
+        timing = self.server_timing(response)
+        assert_equal(
+            sorted(timing.keys()),
+            ['db', 'serialization', 'total', 'validation'])
+        assert_in('desc="{} queries"'.format(len(statements)), timing['db'])
+
+    def test_validation_time_is_recorded(self):
+        response = self.client.post(
+            '/users',
+            data='{"users": {"emailAddress": "joeblogs@email.com"}}',
+            content_type='application/json')
+
+        assert_equal(response.status_code, 400)
+        duration = self.server_timing(response)['validation']
+        assert_true(float(duration[len('dur='):]) > 0)
+
+    def test_server_timing_header_can_be_turned_off(self):
+        request_instrumentation.server_timing = False
+        response = self.client.get('/suppliers/0')
+
+        assert_not_in('Server-Timing', response.headers)
+
+    def test_slow_queries_are_logged(self):
+        request_instrumentation.slow_query_threshold = 0
+        with mock.patch.object(self.app.logger, 'warning') as warning:
+            self.client.get('/suppliers/0')
+
+        assert_true(warning.called)
+        message = warning.call_args[0][0]
+        assert_in('Slow query in main.get_supplier', message)
+        assert_in('suppliers.supplier_id', message)
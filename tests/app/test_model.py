@@ -1,5 +1,6 @@
-from nose.tools import assert_equal
-from app.models import User
+from nose.tools import assert_equal, assert_not_equal, assert_true, \
+    assert_false
+from app.models import User, Service
 from datetime import datetime
 
 
@@ -21,3 +22,28 @@ def test_should_not_return_password_on_user():
     assert_equal(user.serialize()['name'], "name")
     assert_equal(user.serialize()['role'], "buyer")
     assert_equal('password' in user.serialize(), False)
+
+
+def test_service_content_hash_does_not_depend_on_key_order():
+    assert_equal(
+        Service.hash_content({'a': 1, 'b': [1, 2]}, 'published'),
+        Service.hash_content({'b': [1, 2], 'a': 1}, 'published'))
+
+
+def test_service_content_hash_includes_the_status():
+    assert_not_equal(
+        Service.hash_content({'a': 1}, 'published'),
+        Service.hash_content({'a': 1}, 'enabled'))
+
+
+def test_service_is_changed_by_new_data_or_status():
+    service = Service(data={'serviceName': 'A service', 'lot': 'SaaS'},
+                      status='published')
+    service.update_content_hash()
+
+    assert_false(service.is_changed_by(service.merged_data(
+        {'serviceName': 'A service', 'supplierName': 'Supplier 1'})))
+    assert_true(service.is_changed_by(service.merged_data(
+        {'serviceName': 'Another service'})))
+    assert_true(service.is_changed_by({'serviceName': 'A service'}))
+    assert_true(service.is_changed_by(service.data, 'enabled'))
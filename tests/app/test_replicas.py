@@ -0,0 +1,76 @@
+from flask import json
+from nose.tools import assert_equal, assert_true
+
+from app import db
+from .helpers import BaseApplicationTest
+
+
+class TestReplicaRouting(BaseApplicationTest):
+    def setup(self):
+        super(TestReplicaRouting, self).setup()
+        self.setup_dummy_suppliers(1)
+        self.app.config['SQLALCHEMY_REPLICA_URIS'] = [
+            self.app.config['SQLALCHEMY_DATABASE_URI']]
+        self.setup_replicas()
+
+    def setup_replicas(self):
+        db.replicas.init_app(self.app)
+        with self.app.app_context():
+            self.replica = db.replicas.choose()
+
+    def teardown(self):
+        db.replicas.dispose()
+        super(TestReplicaRouting, self).teardown()
+
+    def test_get_requests_read_from_a_replica(self):
+        with self.recorded_queries() as primary_statements:
+            with self.recorded_queries(self.replica) as replica_statements:
+                response = self.client.get('/suppliers/0')
+
+        assert_equal(response.status_code, 200)
+        assert_equal(len(primary_statements), 0)
+        assert_true(len(replica_statements) > 0)
+
+    def test_writes_go_to_the_primary(self):
+        with self.recorded_queries() as primary_statements:
+            with self.recorded_queries(self.replica) as replica_statements:
+                response = self.client.post(
+                    '/users',
+                    data=json.dumps({
+                        'users': {
+                            'emailAddress': 'joeblogs@email.com',
+                            'password': '1234567890',
+                            'role': 'buyer',
+                            'name': 'joe bloggs'}}),
+                    content_type='application/json')
+
+        assert_equal(response.status_code, 200)
+        assert_true(len(primary_statements) > 0)
+        assert_equal(len(replica_statements), 0)
+
+    def test_read_your_writes_reads_from_the_primary(self):
+        with self.recorded_queries() as primary_statements:
+            with self.recorded_queries(self.replica) as replica_statements:
+                response = self.client.get(
+                    '/suppliers/0',
+                    headers={'DM-Read-Your-Writes': 'true'})
+
+        assert_equal(response.status_code, 200)
+        assert_true(len(primary_statements) > 0)
+        assert_equal(len(replica_statements), 0)
+
+    def test_replicas_that_fall_behind_are_not_used(self):
+        self.app.config['DM_API_REPLICA_MAX_LAG'] = -1
+        self.setup_replicas()
+
+        with self.recorded_queries() as primary_statements:
+            response = self.client.get('/suppliers/0')
+
+        assert_equal(response.status_code, 200)
+        assert_true(len(primary_statements) > 0)
+
+    def test_status_reports_replica_lag(self):
+        response = self.client.get('/_status')
+
+        replicas = json.loads(response.get_data())['replicas']
+        assert_equal([replica['lag'] for replica in replicas], [0])
@@ -0,0 +1,284 @@
+from datetime import datetime, timedelta
+
+import mock
+from nose.tools import assert_equal, assert_false, assert_true
+from dmutils.apiclient import HTTPError
+
+from app import db
+from app.models import Service, Supplier, Framework, SearchIndexTask, \
+    SearchIndexCheckpoint
+from app.search_indexer import process_search_index_outbox, \
+    run_search_index_worker, services_to_index, reindex_services, \
+    incremental_reindex
+from .helpers import BaseApplicationTest
+
+
+@mock.patch('app.search_indexer.search_api_client')
+class TestProcessSearchIndexOutbox(BaseApplicationTest):
+    def setup(self):
+        super(TestProcessSearchIndexOutbox, self).setup()
+        now = datetime.utcnow()
+        with self.app.app_context():
+            db.session.add(Supplier(supplier_id=1, name=u"Supplier 1"))
+            db.session.add(Service(service_id="1234567890123456",
+                                   supplier_id=1,
+                                   updated_at=now,
+                                   status='published',
+                                   created_at=now,
+                                   updated_by="tests",
+                                   framework_id=1,
+                                   updated_reason="test data",
+                                   data={'serviceName': 'A service'}))
+            db.session.commit()
+
+    def queue(self, *actions, **kwargs):
+        with self.app.app_context():
+            for action in actions:
+                db.session.add(SearchIndexTask(
+                    service_id=kwargs.get('service_id', "1234567890123456"),
+                    action=action))
+            db.session.commit()
+
+    def tasks(self):
+        with self.app.app_context():
+            return SearchIndexTask.query.order_by(SearchIndexTask.id).all()
+
+    def test_indexes_the_current_service_data(self, search_api_client):
+        self.queue('index')
+        with self.app.app_context():
+            assert_equal(process_search_index_outbox(), 1)
+
+        search_api_client.index.assert_called_once_with(
+            "1234567890123456", {'serviceName': 'A service'},
+            "Supplier 1", "G-Cloud 6")
+        assert_equal(self.tasks(), [])
+
+    def test_only_the_latest_task_for_a_service_is_sent(
+            self, search_api_client):
+        self.queue('index', 'delete', 'index')
+        with self.app.app_context():
+            assert_equal(process_search_index_outbox(), 3)
+
+        assert_equal(search_api_client.index.call_count, 1)
+        assert_false(search_api_client.delete.called)
+        assert_equal(self.tasks(), [])
+
+    def test_does_not_index_unknown_services(self, search_api_client):
+        self.queue('index', service_id="6543210987654321")
+        with self.app.app_context():
+            process_search_index_outbox()
+
+        assert_false(search_api_client.index.called)
+        assert_equal(self.tasks(), [])
+
+    def test_deletes_services(self, search_api_client):
+        self.queue('delete')
+        with self.app.app_context():
+            process_search_index_outbox()
+
+        search_api_client.delete.assert_called_once_with("1234567890123456")
+
+    def test_failed_tasks_are_retried_with_backoff(self, search_api_client):
+        search_api_client.index.side_effect = HTTPError()
+        self.queue('index')
+        with self.app.app_context():
+            process_search_index_outbox()
+            assert_equal(process_search_index_outbox(), 0)
+
+        task, = self.tasks()
+        assert_equal(task.attempts, 1)
+        assert_true(task.next_attempt_at > datetime.utcnow())
+
+        with self.app.app_context():
+            SearchIndexTask.query.update({
+                'next_attempt_at': datetime.utcnow() - timedelta(seconds=1)})
+            db.session.commit()
+            process_search_index_outbox()
+
+        task, = self.tasks()
+        assert_equal(task.attempts, 2)
+        assert_true(task.next_attempt_at > datetime.utcnow() +
+                    timedelta(seconds=15))
+        assert_equal(search_api_client.index.call_count, 2)
+
+    def test_backoff_is_capped(self, search_api_client):
+        search_api_client.index.side_effect = HTTPError()
+        self.queue('index')
+        with self.app.app_context():
+            SearchIndexTask.query.update({'attempts': 30})
+            db.session.commit()
+            process_search_index_outbox()
+
+        task, = self.tasks()
+        assert_true(task.next_attempt_at < datetime.utcnow() +
+                    timedelta(seconds=3601))
+
+    def test_new_task_after_a_failure_replaces_it(self, search_api_client):
+        search_api_client.delete.side_effect = HTTPError()
+        self.queue('delete')
+        with self.app.app_context():
+            process_search_index_outbox()
+
+        self.queue('index')
+        with self.app.app_context():
+            process_search_index_outbox()
+
+        assert_equal(search_api_client.index.call_count, 1)
+        assert_equal(self.tasks(), [])
+
+    def test_worker_drains_every_batch(self, search_api_client):
+        self.queue('index', service_id="1111111111")
+        self.queue('index', service_id="2222222222")
+        self.queue('index', service_id="3333333333")
+        with self.app.app_context():
+            run_search_index_worker(batch_size=2, once=True)
+
+        assert_equal(self.tasks(), [])
+
+
+@mock.patch('app.search_indexer.search_api_client')
+class TestReindexServices(BaseApplicationTest):
+    def setup(self):
+        super(TestReindexServices, self).setup()
+        with self.app.app_context():
+            db.session.add(Supplier(supplier_id=1, name=u"Supplier 1"))
+            db.session.add(Supplier(supplier_id=2, name=u"Supplier 2"))
+            self.add_service("1111111111", updated_at=datetime(2015, 6, 1))
+            self.add_service("2222222222", supplier_id=2,
+                             updated_at=datetime(2015, 6, 2))
+            self.add_service("3333333333", updated_at=datetime(2015, 6, 3))
+            self.add_service("4444444444", status='enabled')
+            self.add_service("5555555555", framework_id=2)  # G-Cloud 4
+            db.session.commit()
+
+    def add_service(self, service_id, supplier_id=1, framework_id=1,
+                    status='published', updated_at=datetime(2015, 6, 1)):
+        db.session.add(Service(service_id=service_id,
+                               supplier_id=supplier_id,
+                               updated_at=updated_at,
+                               status=status,
+                               created_at=updated_at,
+                               updated_by="tests",
+                               framework_id=framework_id,
+                               updated_reason="test data",
+                               data={'serviceName': service_id}))
+
+    def reindex(self, **kwargs):
+        with self.app.app_context():
+            return reindex_services(services_to_index(**kwargs),
+                                    processes=2, batch_size=2)
+
+    def indexed_service_ids(self, search_api_client):
+        return sorted(call[0][0]
+                      for call in search_api_client.index.call_args_list)
+
+    def test_indexes_published_services_on_live_frameworks(
+            self, search_api_client):
+        assert_equal(self.reindex(), (3, 0))
+        assert_equal(self.indexed_service_ids(search_api_client),
+                     ["1111111111", "2222222222", "3333333333"])
+        search_api_client.index.assert_any_call(
+            "2222222222", {'serviceName': "2222222222"},
+            "Supplier 2", "G-Cloud 6")
+
+    def test_filters_by_supplier(self, search_api_client):
+        self.reindex(supplier_id=2)
+        assert_equal(self.indexed_service_ids(search_api_client),
+                     ["2222222222"])
+
+    def test_filters_by_framework(self, search_api_client):
+        assert_equal(self.reindex(framework="G-Cloud 5"), (0, 0))
+
+    def test_filters_by_updated_at(self, search_api_client):
+        self.reindex(updated_since=datetime(2015, 6, 2),
+                     updated_before=datetime(2015, 6, 3))
+        assert_equal(self.indexed_service_ids(search_api_client),
+                     ["2222222222"])
+
+    def test_counts_failures(self, search_api_client):
+        search_api_client.index.side_effect = HTTPError()
+        assert_equal(self.reindex(), (0, 3))
+
+
+@mock.patch('app.search_indexer.search_api_client')
+class TestIncrementalReindex(BaseApplicationTest):
+    def setup(self):
+        super(TestIncrementalReindex, self).setup()
+        with self.app.app_context():
+            db.session.add(Supplier(supplier_id=1, name=u"Supplier 1"))
+            db.session.add(Framework(id=100, name=u"Test framework",
+                                     expired=False))
+            self.add_service("1111111111")
+            self.add_service("2222222222")
+            self.add_service("3333333333", framework_id=100)
+            db.session.commit()
+
+    def add_service(self, service_id, framework_id=1):
+        db.session.add(Service(service_id=service_id,
+                               supplier_id=1,
+                               updated_at=datetime(2015, 6, 1),
+                               status='published',
+                               created_at=datetime(2015, 6, 1),
+                               updated_by="tests",
+                               framework_id=framework_id,
+                               updated_reason="test data",
+                               data={'serviceName': service_id}))
+
+    def reindex(self):
+        with self.app.app_context():
+            return incremental_reindex(processes=2, batch_size=2)
+
+    def update_service(self, service_id, **kwargs):
+        with self.app.app_context():
+            Service.query.filter(Service.service_id == service_id).update(
+                dict(kwargs, updated_at=datetime.utcnow()))
+            db.session.commit()
+
+    def test_first_run_indexes_everything(self, search_api_client):
+        assert_equal(self.reindex(), (3, 0, 0))
+        with self.app.app_context():
+            checkpoint = SearchIndexCheckpoint.query.get('services')
+            assert_true(checkpoint.watermark is not None)
+            assert_true(100 in checkpoint.live_framework_ids)
+
+    def test_only_changed_services_are_indexed(self, search_api_client):
+        self.reindex()
+        search_api_client.reset_mock()
+        self.update_service("2222222222", data={'serviceName': 'New name'})
+
+        assert_equal(self.reindex(), (1, 0, 0))
+        search_api_client.index.assert_called_once_with(
+            "2222222222", {'serviceName': 'New name'},
+            "Supplier 1", "G-Cloud 6")
+
+    def test_unpublished_services_are_deleted(self, search_api_client):
+        self.reindex()
+        search_api_client.reset_mock()
+        self.update_service("1111111111", status='enabled')
+
+        assert_equal(self.reindex(), (0, 1, 0))
+        search_api_client.delete.assert_called_once_with("1111111111")
+
+    def test_services_on_newly_expired_frameworks_are_deleted(
+            self, search_api_client):
+        self.reindex()
+        search_api_client.reset_mock()
+        with self.app.app_context():
+            Framework.query.filter(Framework.id == 100).update(
+                {'expired': True})
+            db.session.commit()
+
+        assert_equal(self.reindex(), (0, 1, 0))
+        search_api_client.delete.assert_called_once_with("3333333333")
+
+        search_api_client.reset_mock()
+        assert_equal(self.reindex(), (0, 0, 0))
+
+    def test_checkpoint_is_kept_after_a_failure(self, search_api_client):
+        self.reindex()
+        self.update_service("2222222222", data={'serviceName': 'New name'})
+        search_api_client.index.side_effect = HTTPError()
+
+        assert_equal(self.reindex(), (0, 0, 1))
+        search_api_client.index.side_effect = None
+        assert_equal(self.reindex(), (1, 0, 0))
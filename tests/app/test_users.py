@@ -1,6 +1,6 @@
 from flask import json
 from nose.tools import assert_equal, assert_not_equal, assert_in
-from app import db, encryption, formats
+from app import db, encryption, formats, password_hasher
 from app.models import User, Supplier
 from datetime import datetime
 from .helpers import BaseApplicationTest, JSONUpdateTestMixin
@@ -99,6 +99,34 @@ class TestUsersAuth(BaseApplicationTest):
             data = json.loads(response.get_data())
             assert_equal(data['authorization'], False)
 
+    def test_should_return_503_when_password_checks_are_saturated(self):
+        with self.app.app_context():
+            self.client.post(
+                '/users',
+                data=json.dumps({
+                    'users': {
+                        'emailAddress': 'joeblogs@email.com',
+                        'password': '1234567890',
+                        'role': 'buyer',
+                        'name': 'joe bloggs'}}),
+                content_type='application/json')
+            password_hasher.queue_size = 0
+
+            response = self.client.post(
+                '/users/auth',
+                data=json.dumps({
+                    'authUsers': {
+                        'emailAddress': 'joeblogs@email.com',
+                        'password': '1234567890'}}),
+                content_type='application/json')
+
+            assert_equal(response.status_code, 503)
+            assert_equal(response.headers['Retry-After'], '1')
+            assert_equal(password_hasher.stats()['rejected'], 1)
+
+            data = json.loads(self.client.get('/_status').get_data())
+            assert_equal(data['password_hasher']['rejected'], 1)
+
 
 class TestUsersPost(BaseApplicationTest, JSONUpdateTestMixin):
     method = "post"
@@ -516,6 +544,35 @@ class TestUsersGet(BaseApplicationTest):
             assert_equal('password' in data, False)
             assert_equal(response.status_code, 200)
 
+    def test_get_user_by_id_with_matching_etag_is_not_modified(self):
+        response = self.client.get("/users/123")
+        etag = response.headers['ETag']
+
+        response = self.client.get("/users/123",
+                                   headers={'If-None-Match': etag})
+        assert_equal(response.status_code, 304)
+
+    def test_get_user_by_id_etag_changes_on_update(self):
+        response = self.client.get("/users/123")
+        etag = response.headers['ETag']
+
+        response = self.client.post(
+            '/users/123',
+            data=json.dumps({'users': {'name': 'new name'}}),
+            content_type='application/json')
+        assert_equal(response.status_code, 200)
+
+        response = self.client.get("/users/123",
+                                   headers={'If-None-Match': etag})
+        assert_equal(response.status_code, 200)
+        data = json.loads(response.get_data())["users"]
+        assert_equal(data['name'], "new name")
+
+    def test_get_non_existent_user_with_etag_is_404(self):
+        response = self.client.get("/users/999",
+                                   headers={'If-None-Match': '*'})
+        assert_equal(response.status_code, 404)
+
     def test_returns_404_for_non_int_id(self):
         response = self.client.get("/users/bogus")
         assert_equal(response.status_code, 404)
@@ -3,11 +3,15 @@ import os
 
 from flask import json
 from nose.tools import assert_equal, assert_in, \
-    assert_almost_equal, assert_false, assert_is_not_none, assert_not_in
+    assert_almost_equal, assert_false, assert_is_not_none, assert_not_in, \
+    assert_not_equal
 
-from app.models import Service, Supplier, ContactInformation, Framework
+from app.models import Service, Supplier, ContactInformation, Framework, \
+    ArchivedService, SearchIndexTask
 import mock
 from app import db, create_app
+from app.search_indexer import process_search_index_outbox
+from app.utils import encode_cursor
 from ..helpers import BaseApplicationTest, JSONUpdateTestMixin, \
     TEST_SUPPLIERS_COUNT
 from sqlalchemy.exc import IntegrityError
@@ -83,6 +87,35 @@ class TestListServices(BaseApplicationTest):
         assert_equal(response.status_code, 200)
         assert_equal(data['services'], [])
 
+    def test_list_services_runs_a_constant_number_of_queries(self):
+        self.setup_dummy_services_including_unpublished(4)
+        # Load the framework registry
+        self.client.get('/services')
+        with self.recorded_queries() as few_services:
+            self.client.get('/services')
+        self.teardown_database()
+
+        self.setup_dummy_services_including_unpublished(20)
+        with self.recorded_queries() as more_services:
+            self.client.get('/services')
+
+        # The page and its count
+        assert_equal(len(few_services), 2)
+        assert_equal(len(more_services), 2)
+
+    def test_list_services_does_not_load_contact_information(self):
+        self.setup_dummy_services_including_unpublished(4)
+        for url in ['/services', '/services?cursor=',
+                    '/services?supplier_id=1', '/services/export']:
+            with self.recorded_queries() as statements:
+                response = self.client.get(url)
+                response.get_data()
+
+            assert_equal(response.status_code, 200)
+            for statement in statements:
+                if 'FROM services' in statement:
+                    assert_not_in('contact_information', statement)
+
     def test_list_services_gets_all_statuses(self):
         self.setup_dummy_services_including_unpublished(1)
         response = self.client.get('/services')
@@ -165,8 +198,8 @@ class TestListServices(BaseApplicationTest):
 
         assert_equal(response.status_code, 200)
         assert_equal(len(data['services']), 2)
-        assert_equal(data['services'][0]['id'], '3')
-        assert_equal(data['services'][1]['id'], '2')
+        assert_equal(data['services'][0]['id'], '2')
+        assert_equal(data['services'][1]['id'], '3')
 
     def test_list_services_gets_combination_of_enabled_and_published(self):
         self.setup_dummy_services_including_unpublished(1)
@@ -304,6 +337,121 @@ class TestListServices(BaseApplicationTest):
 
         assert_equal(response.status_code, 404)
 
+    def test_cursor_list_services_first_page(self):
+        self.setup_dummy_services_including_unpublished(7)
+
+        response = self.client.get('/services?cursor=')
+        data = json.loads(response.get_data())
+
+        assert_equal(response.status_code, 200)
+        assert_equal(len(data['services']), 5)
+        assert_in('cursor=', data['links']['next'])
+        assert_not_in('page=', data['links']['next'])
+        assert_not_in('prev', data['links'])
+
+    def test_cursor_list_services_follows_next_link(self):
+        self.setup_dummy_services_including_unpublished(7)
+
+        response = self.client.get('/services?cursor=')
+        first_page = json.loads(response.get_data())
+        next_link = first_page['links']['next'].split('/', 3)[-1]
+        response = self.client.get('/' + next_link)
+        second_page = json.loads(response.get_data())
+
+        assert_equal(response.status_code, 200)
+        assert_equal(len(second_page['services']), 4)
+        assert_not_in('next', second_page['links'])
+
+        ids = [s['id'] for s in first_page['services'] +
+               second_page['services']]
+        assert_equal(len(set(ids)), 9)
+
+    def test_cursor_list_services_matches_page_ordering(self):
+        self.setup_dummy_services_including_unpublished(7)
+
+        response = self.client.get('/services')
+        paged = json.loads(response.get_data())
+        response = self.client.get('/services?cursor=')
+        keyset = json.loads(response.get_data())
+
+        assert_equal([s['id'] for s in paged['services']],
+                     [s['id'] for s in keyset['services']])
+
+    def test_invalid_cursor_argument(self):
+        response = self.client.get('/services?cursor=not-a-cursor')
+
+        assert_equal(response.status_code, 400)
+        assert_in(b'Invalid cursor argument', response.get_data())
+
+
+class TestExportServices(BaseApplicationTest):
+    def export(self, query=''):
+        response = self.client.get('/services/export' + query)
+        lines = response.get_data().decode('utf-8').splitlines()
+        return response, [json.loads(line) for line in lines]
+
+    def test_export_with_no_services(self):
+        response, services = self.export()
+
+        assert_equal(response.status_code, 200)
+        assert_equal(response.mimetype, 'application/x-ndjson')
+        assert_equal(services, [])
+
+    def test_export_streams_every_service(self):
+        self.setup_dummy_services_including_unpublished(7)
+        response, services = self.export()
+
+        assert_equal(response.status_code, 200)
+        assert_equal(len(services), 9)
+        assert_equal(services[0]['supplierName'], u'Supplier 0')
+        assert_equal(services[0]['frameworkName'], u'G-Cloud 6')
+
+    def test_export_excludes_expired_frameworks(self):
+        with self.app.app_context():
+            db.session.add(Framework(id=123, name="expired", expired=True))
+            self.setup_dummy_services_including_unpublished(1)
+            now = datetime.utcnow()
+            db.session.add(Service(service_id="999",
+                                   supplier_id=1,
+                                   updated_at=now,
+                                   status='published',
+                                   created_at=now,
+                                   updated_by='tests',
+                                   updated_reason='test data',
+                                   data={'foo': 'bar'},
+                                   framework_id=123))
+            db.session.commit()
+
+        response, services = self.export()
+
+        assert_equal(len(services), 3)
+
+    def test_export_status_filter(self):
+        self.setup_dummy_services_including_unpublished(7)
+        response, services = self.export('?status=published')
+
+        assert_equal(len(services), 7)
+
+    def test_export_supplier_id_filter(self):
+        self.setup_dummy_services_including_unpublished(7)
+        response, services = self.export('?supplier_id=1')
+
+        assert_equal(len(services), 4)
+        assert_equal(set(s['supplierId'] for s in services), {1})
+
+    def test_export_supplier_id_and_status_filters(self):
+        self.setup_dummy_services_including_unpublished(7)
+        response, services = self.export('?supplier_id=1&status=published')
+
+        assert_equal(len(services), 2)
+        assert_equal(set(s['supplierId'] for s in services), {1})
+        assert_equal(set(s['status'] for s in services), {'published'})
+
+    def test_export_unknown_supplier_id(self):
+        response = self.client.get('/services/export?supplier_id=100')
+
+        assert_equal(response.status_code, 404)
+
 
 class TestPostService(BaseApplicationTest):
     service_id = None
@@ -546,6 +694,24 @@ class TestPostService(BaseApplicationTest):
             assert_in('JSON was not a valid format',
                       json.loads(response.get_data())['error'])
 
+    def test_invalid_update_is_not_stored(self):
+        with self.app.app_context():
+            response = self.client.post(
+                "/services/" + self.service_id,
+                data=json.dumps(
+                    {'update_details': {
+                        'updated_by': 'joeblogs',
+                        'update_reason': 'whateves'}, 'services': {
+                        'priceUnit': 'per Truth'}}),
+                content_type='application/json')
+            assert_equal(response.status_code, 400)
+            db.session.commit()
+
+            service = Service.query.filter(
+                Service.service_id == self.service_id).one()
+            assert_not_equal(service.data['priceUnit'], 'per Truth')
+            assert_equal(ArchivedService.query.count(), 0)
+
     def test_updated_service_should_be_archived(self):
         with self.app.app_context():
             response = self.client.post(
@@ -588,6 +754,104 @@ class TestPostService(BaseApplicationTest):
                 self.service_id).get_data()
             assert_equal(len(json.loads(archived_state)['services']), 5)
 
+    def update_service_name(self, *names):
+        for name in names:
+            response = self.client.post(
+                '/services/%s' % self.service_id,
+                data=json.dumps(
+                    {'update_details': {
+                        'updated_by': 'joeblogs',
+                        'update_reason': 'whateves'},
+                     'services': {
+                         'serviceName': name}}),
+                content_type='application/json')
+            assert_equal(response.status_code, 200)
+
+    def test_service_history_is_listed_newest_first(self):
+        self.update_service_name('first name', 'second name')
+
+        response = self.client.get('/services/%s/archived' % self.service_id)
+        assert_equal(response.status_code, 200)
+        data = json.loads(response.get_data())
+
+        assert_equal([service['serviceName'] for service in data['services']],
+                     ['first name', 'My Iaas Service'])
+        assert_equal(data['links'], {})
+
+    def test_service_history_is_paginated_with_a_cursor(self):
+        self.app.config['DM_API_SERVICES_PAGE_SIZE'] = 2
+        self.update_service_name('one', 'two', 'three', 'four')
+
+        response = self.client.get('/services/%s/archived' % self.service_id)
+        data = json.loads(response.get_data())
+        assert_equal([service['serviceName'] for service in data['services']],
+                     ['three', 'two'])
+        assert_in('cursor=', data['links']['next'])
+
+        next_link = data['links']['next'].split('/', 3)[-1]
+        response = self.client.get('/' + next_link)
+        data = json.loads(response.get_data())
+        assert_equal([service['serviceName'] for service in data['services']],
+                     ['one', 'My Iaas Service'])
+        assert_equal(data['links'], {})
+
+    def test_delta_encoded_versions_are_rebuilt(self):
+        self.app.config['DM_API_ARCHIVE_SNAPSHOT_INTERVAL'] = 2
+        self.update_service_name('one', 'two', 'three')
+
+        response = self.client.get('/services/%s/archived' % self.service_id)
+        data = json.loads(response.get_data())
+        assert_equal([service['serviceName'] for service in data['services']],
+                     ['two', 'one', 'My Iaas Service'])
+        assert_equal(data['services'][0]['lot'], 'IaaS')
+
+        with self.app.app_context():
+            delta = ArchivedService.query.filter(
+                ArchivedService.data.is_(None)
+            ).one()
+        response = self.client.get('/archived-services/%d' % delta.id)
+        assert_equal(response.status_code, 200)
+        data = json.loads(response.get_data())
+        assert_equal(data['services']['serviceName'], 'one')
+
+    def test_service_history_only_includes_the_service(self):
+        self.update_service_name('new service name')
+        with self.app.app_context():
+            db.session.add(ArchivedService(
+                service_id='6543210987654321',
+                supplier_id=1,
+                framework_id=1,
+                created_at=datetime.utcnow(),
+                updated_at=datetime.utcnow(),
+                updated_by='tests',
+                updated_reason='test data',
+                status='published',
+                data={'serviceName': 'Another service'}))
+            db.session.commit()
+
+        for url in ['/services/%s/archived' % self.service_id,
+                    '/archived-services?service-id=%s' % self.service_id]:
+            data = json.loads(self.client.get(url).get_data())
+            assert_equal(len(data['services']), 1)
+            assert_equal(data['services'][0]['id'], self.service_id)
+
+    def test_service_history_404s_if_there_is_none(self):
+        response = self.client.get('/services/%s/archived' % self.service_id)
+        assert_equal(response.status_code, 404)
+
+    def test_service_history_400s_for_an_invalid_service_id(self):
+        response = self.client.get('/services/not-valid/archived')
+        assert_equal(response.status_code, 400)
+        assert_in(b'Invalid service ID supplied', response.get_data())
+
+    def test_service_history_400s_for_an_invalid_cursor(self):
+        self.update_service_name('new service name')
+        for cursor in ['not-a-cursor', encode_cursor(['yesterday', 1])]:
+            response = self.client.get(
+                '/services/%s/archived?cursor=%s' % (self.service_id, cursor))
+            assert_equal(response.status_code, 400)
+            assert_in(b'Invalid cursor argument', response.get_data())
+
     def test_writing_full_service_back(self):
         with self.app.app_context():
             response = self.client.get('/services/%s' % self.service_id)
@@ -646,6 +910,176 @@ class TestPostService(BaseApplicationTest):
         assert_in(b'id parameter must match id in data',
                   response.get_data())
 
+    def post_service_update(self, services):
+        return self.client.post(
+            '/services/%s' % self.service_id,
+            data=json.dumps(
+                {'update_details': {
+                    'updated_by': 'joeblogs',
+                    'update_reason': 'whateves'},
+                 'services': services}),
+            content_type='application/json')
+
+    def test_updates_report_whether_the_service_changed(self):
+        response = self.post_service_update({'serviceName': 'New name'})
+        assert_equal(json.loads(response.get_data())['changed'], True)
+
+        response = self.post_service_update({'serviceName': 'New name'})
+        assert_equal(response.status_code, 200)
+        assert_equal(json.loads(response.get_data())['changed'], False)
+
+    def test_updates_only_send_the_changed_fields(self):
+        with self.recorded_queries() as statements:
+            response = self.post_service_update({'serviceName': 'New name'})
+        assert_equal(response.status_code, 200)
+
+        updates = [statement for statement in statements
+                   if statement.startswith('UPDATE services') and
+                   'data=' in statement]
+        assert_equal(len(updates), 1)
+        assert_in('data=(services.data || %(patch)s)', updates[0])
+        assert_in('RETURNING services.data', updates[0])
+
+    def test_updates_are_merged_into_the_stored_data(self):
+        with self.app.app_context():
+            service = Service.query.filter(
+                Service.service_id == self.service_id).one()
+            db.engine.execute(
+                """UPDATE services
+                   SET data = data || '{"serviceSummary": "Elsewhere"}'""")
+            service.write_data(
+                service.merged_data({'serviceName': 'New name'}),
+                'tests', 'test data')
+            assert_equal(service.data['serviceName'], 'New name')
+            assert_equal(service.data['serviceSummary'], 'Elsewhere')
+            db.session.commit()
+
+            data = Service.query.filter(
+                Service.service_id == self.service_id).one().data
+            assert_equal(data['serviceName'], 'New name')
+            assert_equal(data['serviceSummary'], 'Elsewhere')
+
+    def patch_service(self, operations, url=None, headers=None):
+        return self.client.post(
+            url or '/services/%s' % self.service_id,
+            data=json.dumps(operations),
+            content_type='application/json-patch+json',
+            headers=headers if headers is not None else {
+                'DM-Updated-By': 'joeblogs',
+                'DM-Update-Reason': 'whateves'})
+
+    def stored_data(self):
+        with self.app.app_context():
+            return Service.query.filter(
+                Service.service_id == self.service_id).one().data
+
+    def test_json_patch_updates_the_service(self):
+        response = self.patch_service([
+            {'op': 'replace', 'path': '/serviceName', 'value': 'New name'},
+            {'op': 'replace', 'path': '/serviceFeatures/0', 'value': 'New'},
+        ], headers={'DM-Updated-By': 'patcher',
+                    'DM-Update-Reason': 'patching'})
+        assert_equal(response.status_code, 200)
+        assert_equal(json.loads(response.get_data())['changed'], True)
+
+        data = self.stored_data()
+        assert_equal(data['serviceName'], 'New name')
+        assert_equal(data['serviceFeatures'][0], 'New')
+
+        with self.app.app_context():
+            service = Service.query.filter(
+                Service.service_id == self.service_id).one()
+            assert_equal(service.updated_by, 'patcher')
+            assert_equal(service.updated_reason, 'patching')
+            assert_equal(ArchivedService.query.count(), 1)
+
+    def test_json_patch_can_remove_fields(self):
+        assert_in('apiType', self.stored_data())
+        response = self.patch_service([
+            {'op': 'remove', 'path': '/apiType'},
+        ])
+        assert_equal(response.status_code, 200)
+        assert_not_in('apiType', self.stored_data())
+
+    def test_json_patch_result_is_validated(self):
+        response = self.patch_service([
+            {'op': 'remove', 'path': '/serviceName'},
+        ])
+        assert_equal(response.status_code, 400)
+        assert_in(b'JSON was not a valid format', response.get_data())
+        assert_in('serviceName', self.stored_data())
+
+    def test_json_patch_that_changes_nothing_is_a_no_op(self):
+        response = self.patch_service([
+            {'op': 'test', 'path': '/serviceName',
+             'value': 'My Iaas Service'},
+        ])
+        assert_equal(response.status_code, 200)
+        assert_equal(json.loads(response.get_data())['changed'], False)
+
+    def test_failed_json_patch_is_not_applied(self):
+        response = self.patch_service([
+            {'op': 'replace', 'path': '/serviceName', 'value': 'New name'},
+            {'op': 'test', 'path': '/serviceName', 'value': 'Old name'},
+        ])
+        assert_equal(response.status_code, 400)
+        assert_in(b'Invalid JSON Patch: Test failed', response.get_data())
+        assert_equal(self.stored_data()['serviceName'], 'My Iaas Service')
+
+    def test_json_patch_must_be_a_list_of_operations(self):
+        for body in [{'op': 'remove', 'path': '/serviceName'}, 'not json']:
+            response = self.client.post(
+                '/services/%s' % self.service_id,
+                data=body if isinstance(body, str) else json.dumps(body),
+                content_type='application/json-patch+json',
+                headers={'DM-Updated-By': 'joeblogs',
+                         'DM-Update-Reason': 'whateves'})
+            assert_equal(response.status_code, 400)
+            assert_in(b'Invalid JSON Patch', response.get_data())
+
+    def test_json_patch_needs_updater_headers(self):
+        response = self.patch_service(
+            [{'op': 'replace', 'path': '/serviceName', 'value': 'New name'}],
+            headers={'DM-Updated-By': 'joeblogs'})
+        assert_equal(response.status_code, 400)
+        assert_in(b"'update_reason' is a required property",
+                  response.get_data())
+
+    def test_json_patch_edits_drafts(self):
+        self.client.put(
+            '/services/%s/draft' % self.service_id,
+            data=json.dumps({'update_details': {
+                'updated_by': 'joeblogs', 'update_reason': 'whateves'}}),
+            content_type='application/json')
+
+        response = self.patch_service(
+            [{'op': 'replace', 'path': '/serviceName', 'value': 'Draft'}],
+            url='/services/%s/draft' % self.service_id)
+        assert_equal(response.status_code, 200)
+        assert_equal(
+            json.loads(response.get_data())['services']['serviceName'],
+            'Draft')
+        assert_equal(self.stored_data()['serviceName'], 'My Iaas Service')
+
+    def test_unchanged_service_is_not_archived_or_reindexed(self):
+        with self.app.app_context():
+            updated_at = Service.query.filter(
+                Service.service_id == self.service_id).one().updated_at
+            SearchIndexTask.query.delete()
+            db.session.commit()
+
+        data = json.loads(
+            self.client.get('/services/%s' % self.service_id).get_data())
+        response = self.post_service_update(data['services'])
+        assert_equal(json.loads(response.get_data())['changed'], False)
+
+        with self.app.app_context():
+            after = Service.query.filter(
+                Service.service_id == self.service_id).one()
+            assert_equal(after.updated_at, updated_at)
+            assert_equal(ArchivedService.query.count(), 0)
+            assert_equal(SearchIndexTask.query.count(), 0)
+
     def test_should_not_update_status_through_service_post(self):
         response = self.client.post(
             '/services/%s' % self.service_id,
@@ -810,7 +1244,7 @@ class TestPostService(BaseApplicationTest):
             assert_equal(response.status_code, 200)
 
 
-@mock.patch('app.service_utils.search_api_client')
+@mock.patch('app.search_indexer.search_api_client')
 class TestShouldCallSearchApiOnPutToCreateService(BaseApplicationTest):
     def setup(self):
         super(TestShouldCallSearchApiOnPutToCreateService, self).setup()
@@ -837,6 +1271,7 @@ class TestShouldCallSearchApiOnPutToCreateService(BaseApplicationTest):
                         'services': payload}
                 ),
                 content_type='application/json')
+            process_search_index_outbox()
 
             service = Service.query.filter(Service.service_id ==
                                            "1234567890123456").first()
@@ -868,6 +1303,7 @@ class TestShouldCallSearchApiOnPutToCreateService(BaseApplicationTest):
             assert_equal(res.status_code, 201)
             assert_is_not_none(Service.query.filter(
                 Service.service_id == payload["id"]).first())
+            process_search_index_outbox()
             assert_false(search_api_client.index.called)
 
     def test_should_ignore_index_error_on_service_put(self, search_api_client):
@@ -890,7 +1326,7 @@ class TestShouldCallSearchApiOnPutToCreateService(BaseApplicationTest):
             assert_equal(response.status_code, 201)
 
 
-@mock.patch('app.service_utils.search_api_client')
+@mock.patch('app.search_indexer.search_api_client')
 class TestShouldCallSearchApiOnPost(BaseApplicationTest):
     def setup(self):
         super(TestShouldCallSearchApiOnPost, self).setup()
@@ -927,6 +1363,7 @@ class TestShouldCallSearchApiOnPost(BaseApplicationTest):
 
             payload = self.load_example_listing("G6-IaaS")
             payload['id'] = "1234567890123456"
+            payload['serviceName'] = "New service name"
             self.client.post(
                 '/services/1234567890123456',
                 data=json.dumps(
@@ -937,6 +1374,7 @@ class TestShouldCallSearchApiOnPost(BaseApplicationTest):
                         'services': payload}
                 ),
                 content_type='application/json')
+            process_search_index_outbox()
 
             service = Service.query.filter(Service.service_id ==
                                            "1234567890123456").first()
@@ -947,6 +1385,26 @@ class TestShouldCallSearchApiOnPost(BaseApplicationTest):
                 "G-Cloud 6"
             )
 
+    def test_should_not_index_on_unchanged_service_post(
+            self, search_api_client):
+        with self.app.app_context():
+            payload = self.load_example_listing("G6-IaaS")
+            payload['id'] = "1234567890123456"
+            response = self.client.post(
+                '/services/1234567890123456',
+                data=json.dumps(
+                    {
+                        'update_details': {
+                            'updated_by': 'joeblogs',
+                            'update_reason': 'whateves'},
+                        'services': payload}
+                ),
+                content_type='application/json')
+            process_search_index_outbox()
+
+            assert_equal(response.status_code, 200)
+            assert_false(search_api_client.index.called)
+
     @mock.patch('app.main.views.services.db.session.commit')
     def test_should_not_index_on_service_post_if_db_exception(
             self, search_api_client, db_session_commit
@@ -968,6 +1426,7 @@ class TestShouldCallSearchApiOnPost(BaseApplicationTest):
                         'services': payload}
                 ),
                 content_type='application/json')
+            process_search_index_outbox()
             assert_equal(search_api_client.index.called, False)
 
     def test_should_not_index_on_service_on_expired_frameworks(
@@ -989,6 +1448,7 @@ class TestShouldCallSearchApiOnPost(BaseApplicationTest):
                 content_type='application/json')
 
             assert_equal(res.status_code, 200)
+            process_search_index_outbox()
             assert_false(search_api_client.index.called)
 
     def test_should_ignore_index_error(self, search_api_client):
@@ -1059,7 +1519,7 @@ class TestShouldCallSearchApiOnPostStatusUpdate(BaseApplicationTest):
                             service_is_indexed, service_is_deleted,
                             expected_status_code):
 
-        with mock.patch('app.service_utils.search_api_client') \
+        with mock.patch('app.search_indexer.search_api_client') \
                 as search_api_client:
 
             search_api_client.index.return_value = True
@@ -1085,6 +1545,9 @@ class TestShouldCallSearchApiOnPostStatusUpdate(BaseApplicationTest):
             if expected_status_code != 200:
                 return
 
+            with self.app.app_context():
+                process_search_index_outbox()
+
             service = self._get_service_from_database_by_service_id(
                 self.services[old_status]['id'])
 
@@ -1147,6 +1610,21 @@ class TestShouldCallSearchApiOnPostStatusUpdate(BaseApplicationTest):
             expected_status_code=200,
         )
 
+    def test_unchanged_status_is_not_archived(self):
+        response = self.client.post(
+            '/services/{0}/status/published'.format(
+                self.services['published']['id']),
+            data=json.dumps(
+                {'update_details': {
+                    'updated_by': 'joeblogs',
+                    'update_reason': 'Change status for unit test'}}),
+            content_type='application/json')
+
+        assert_equal(response.status_code, 200)
+        assert_equal(json.loads(response.get_data())['changed'], False)
+        with self.app.app_context():
+            assert_equal(ArchivedService.query.count(), 0)
+
     @mock.patch('app.search_api_client')
     def test_should_ignore_index_error(self, search_api_client):
         search_api_client.index.side_effect = HTTPError()
@@ -1184,6 +1662,144 @@ class TestShouldCallSearchApiOnPostStatusUpdate(BaseApplicationTest):
         assert_equal(response.status_code, 200)
 
 
+class TestUpdateServicesStatus(BaseApplicationTest):
+    def setup(self):
+        super(TestUpdateServicesStatus, self).setup()
+        now = datetime.utcnow()
+        with self.app.app_context():
+            db.session.add(Supplier(supplier_id=1, name=u"Supplier 1"))
+            db.session.add(Supplier(supplier_id=2, name=u"Supplier 2"))
+            for service_id, supplier_id, framework_id, status in [
+                ("1111111111", 1, 1, 'published'),
+                ("2222222222", 1, 1, 'published'),
+                ("3333333333", 1, 1, 'enabled'),
+                ("4444444444", 1, 2, 'published'),  # G-Cloud 4
+                ("5555555555", 2, 1, 'published'),
+            ]:
+                db.session.add(Service(service_id=service_id,
+                                       supplier_id=supplier_id,
+                                       updated_at=now,
+                                       status=status,
+                                       created_at=now,
+                                       updated_by="tests",
+                                       framework_id=framework_id,
+                                       updated_reason="test data",
+                                       data={'serviceName': service_id}))
+            db.session.commit()
+
+    def update_status(self, status, **selector):
+        return self.client.post(
+            '/services/status',
+            data=json.dumps(dict(selector, status=status, update_details={
+                'updated_by': 'joeblogs',
+                'update_reason': 'suspended'})),
+            content_type='application/json')
+
+    def statuses(self):
+        with self.app.app_context():
+            return dict(Service.query.with_entities(
+                Service.service_id, Service.status))
+
+    def tasks(self):
+        with self.app.app_context():
+            return sorted(SearchIndexTask.query.with_entities(
+                SearchIndexTask.service_id, SearchIndexTask.action))
+
+    def test_unpublishes_a_suppliers_services(self):
+        response = self.update_status('disabled', supplierId=1)
+
+        assert_equal(response.status_code, 200)
+        assert_equal(
+            sorted(json.loads(response.get_data())['serviceIds']),
+            ["1111111111", "2222222222", "3333333333", "4444444444"])
+        assert_equal(self.statuses(), {
+            "1111111111": 'disabled',
+            "2222222222": 'disabled',
+            "3333333333": 'disabled',
+            "4444444444": 'disabled',
+            "5555555555": 'published',
+        })
+        assert_equal(self.tasks(), [
+            ("1111111111", 'delete'),
+            ("2222222222", 'delete'),
+            ("4444444444", 'delete'),
+        ])
+
+    def test_archives_the_previous_versions(self):
+        self.update_status('enabled', serviceIds=["1111111111"])
+
+        with self.app.app_context():
+            archived = ArchivedService.query.one()
+            assert_equal(archived.service_id, "1111111111")
+            assert_equal(archived.status, 'published')
+            assert_equal(archived.data, {'serviceName': "1111111111"})
+
+            service = Service.query.filter(
+                Service.service_id == "1111111111").one()
+            assert_equal(service.updated_by, 'joeblogs')
+            assert_equal(service.updated_reason, 'suspended')
+
+    def test_services_that_already_have_the_status_are_skipped(self):
+        response = self.update_status('published', supplierId=1,
+                                      frameworkName="G-Cloud 6")
+
+        assert_equal(json.loads(response.get_data())['serviceIds'],
+                     ["3333333333"])
+        assert_equal(self.tasks(), [("3333333333", 'index')])
+        with self.app.app_context():
+            assert_equal(ArchivedService.query.count(), 1)
+
+    def test_only_services_on_live_frameworks_are_indexed(self):
+        self.update_status('enabled', serviceIds=["4444444444"])
+        with self.app.app_context():
+            SearchIndexTask.query.delete()
+            db.session.commit()
+
+        self.update_status('published', serviceIds=["4444444444"])
+        assert_equal(self.statuses()["4444444444"], 'published')
+        assert_equal(self.tasks(), [])
+
+    def test_runs_the_same_statements_for_any_number_of_services(self):
+        with self.recorded_queries() as statements:
+            self.update_status('enabled', supplierId=1)
+
+        assert_equal(
+            len([statement for statement in statements
+                 if statement.startswith('INSERT INTO archived_services')]),
+            1)
+        assert_equal(
+            len([statement for statement in statements
+                 if statement.startswith('UPDATE services')]),
+            1)
+
+    def test_services_must_be_selected(self):
+        response = self.update_status('enabled')
+        assert_equal(response.status_code, 400)
+        assert_in(b'Services must be selected', response.get_data())
+
+    def test_invalid_selectors_are_rejected(self):
+        for selector in [{'serviceIds': "1111111111"},
+                         {'serviceIds': ["not-valid"]},
+                         {'supplierId': "one"},
+                         {'frameworkName': "G-Cloud 99"}]:
+            response = self.update_status('enabled', **selector)
+            assert_equal(response.status_code, 400)
+
+        assert_equal(self.statuses()["1111111111"], 'published')
+
+    def test_service_ids_must_be_strings(self):
+        response = self.update_status('enabled', serviceIds=[123])
+        assert_equal(response.status_code, 400)
+        assert_in(b"'serviceIds' must be a list of strings",
+                  response.get_data())
+
+    def test_invalid_status_is_rejected(self):
+        response = self.update_status('suspended', supplierId=1)
+        assert_equal(response.status_code, 400)
+        assert_in(b"'suspended' is not a valid status",
+                  response.get_data())
+
+
 class TestPutService(BaseApplicationTest, JSONUpdateTestMixin):
     method = "put"
     endpoint = "/services/1234567890123456"
@@ -1206,6 +1822,28 @@ class TestPutService(BaseApplicationTest, JSONUpdateTestMixin):
             )
             db.session.commit()
 
+    def test_creating_a_service_queues_it_for_indexing(self):
+        with self.app.app_context():
+            payload = self.load_example_listing("G6-IaaS")
+            payload['id'] = "1234567890123456"
+
+            response = self.client.put(
+                '/services/1234567890123456',
+                data=json.dumps({
+                    'update_details': {
+                        'updated_by': 'joeblogs',
+                        'update_reason': 'whateves'},
+                    'services': payload,
+                }),
+                content_type='application/json')
+
+            assert_equal(response.status_code, 201)
+            assert_equal(
+                SearchIndexTask.query.with_entities(
+                    SearchIndexTask.service_id, SearchIndexTask.action
+                ).all(),
+                [("1234567890123456", 'index')])
+
     def test_json_postgres_field_should_not_include_column_fields(self):
         non_json_fields = [
             'supplierName', 'links', 'frameworkName', 'status', 'id',
@@ -1391,6 +2029,132 @@ class TestPutService(BaseApplicationTest, JSONUpdateTestMixin):
             assert_equal(data['services']['supplierName'], u'Supplier 1')
 
 
+class TestBulkImportServices(BaseApplicationTest, JSONUpdateTestMixin):
+    method = "post"
+    endpoint = "/services/bulk-import"
+
+    def setup(self):
+        super(TestBulkImportServices, self).setup()
+        with self.app.app_context():
+            db.session.add(
+                Supplier(supplier_id=1, name=u"Supplier 1")
+            )
+            db.session.commit()
+
+    def listing(self, service_id, name="G6-IaaS", **kwargs):
+        payload = self.load_example_listing(name)
+        payload['id'] = service_id
+        payload.update(kwargs)
+        return payload
+
+    def bulk_import(self, services):
+        return self.client.post(
+            '/services/bulk-import',
+            data=json.dumps({
+                'update_details': {
+                    'updated_by': 'joeblogs',
+                    'update_reason': 'whateves'},
+                'services': services,
+            }),
+            content_type='application/json')
+
+    @mock.patch('app.search_indexer.search_api_client')
+    def test_imports_every_service(self, search_api_client):
+        response = self.bulk_import([
+            self.listing("1234567890123456"),
+            self.listing("1234567890123457", name="G6-SaaS"),
+        ])
+        data = json.loads(response.get_data())
+
+        assert_equal(response.status_code, 200)
+        assert_equal(data['results'], [
+            {'id': "1234567890123456", 'status': 201},
+            {'id': "1234567890123457", 'status': 201},
+        ])
+        with self.app.app_context():
+            service = Service.query.filter(
+                Service.service_id == "1234567890123457").first()
+            assert_equal(service.supplier_id, 1)
+            assert_equal(service.framework.name, "G-Cloud 6")
+            assert_equal(service.updated_by, 'joeblogs')
+            assert_equal(service.data['lot'], 'SaaS')
+            for key in ['supplierName', 'links', 'frameworkName',
+                        'status', 'id', 'supplierId']:
+                assert_not_in(key, service.data)
+        with self.app.app_context():
+            process_search_index_outbox()
+        assert_equal(search_api_client.index.call_count, 2)
+
+    @mock.patch('app.search_indexer.search_api_client')
+    def test_reports_invalid_services_and_imports_the_rest(
+            self, search_api_client):
+        response = self.bulk_import([
+            self.listing("1234567890123456"),
+            self.listing("1234567890123457", lot="DaaS"),
+            self.listing("invalid.service.id"),
+            self.listing("1234567890123458", supplierId=100),
+            self.listing("1234567890123456"),
+            "not a service",
+        ])
+        results = json.loads(response.get_data())['results']
+
+        assert_equal(response.status_code, 200)
+        assert_equal([result['status'] for result in results],
+                     [201, 400, 400, 400, 400, 400])
+        assert_in("JSON was not a valid format", results[1]['error'])
+        assert_in("Invalid service ID supplied", results[2]['error'])
+        assert_equal(results[3]['error'],
+                     "Key (supplierId)=(100) is not present")
+        assert_equal(results[4]['error'], "Service already exists")
+        with self.app.app_context():
+            assert_equal(Service.query.count(), 1)
+            process_search_index_outbox()
+        assert_equal(search_api_client.index.call_count, 1)
+
+    @mock.patch('app.search_indexer.search_api_client')
+    def test_existing_services_are_not_replaced(self, search_api_client):
+        self.bulk_import([self.listing("1234567890123456")])
+        response = self.bulk_import([
+            self.listing("1234567890123456", serviceName="New name"),
+        ])
+        results = json.loads(response.get_data())['results']
+
+        assert_equal(results[0]['error'], "Service already exists")
+        with self.app.app_context():
+            service = Service.query.filter(
+                Service.service_id == "1234567890123456").first()
+            assert_equal(service.data['serviceName'],
+                         self.listing("1234567890123456")['serviceName'])
+
+    @mock.patch('app.search_indexer.search_api_client')
+    def test_does_not_index_services_on_expired_frameworks(
+            self, search_api_client):
+        payload = self.load_example_listing("G4")
+        response = self.bulk_import([payload])
+
+        assert_equal(json.loads(response.get_data())['results'][0]['status'],
+                     201)
+        with self.app.app_context():
+            process_search_index_outbox()
+        assert_false(search_api_client.index.called)
+
+    def test_services_must_be_a_list(self):
+        response = self.bulk_import(self.listing("1234567890123456"))
+
+        assert_equal(response.status_code, 400)
+        assert_in(b"'services' must be a list", response.get_data())
+
+    def test_too_many_services(self):
+        self.app.config['DM_API_SERVICES_BULK_IMPORT_LIMIT'] = 1
+        response = self.bulk_import([
+            self.listing("1234567890123456"),
+            self.listing("1234567890123457"),
+        ])
+
+        assert_equal(response.status_code, 400)
+        assert_in(b"Cannot import more than 1 services", response.get_data())
+
+
 class TestGetService(BaseApplicationTest):
     def setup(self):
         super(TestGetService, self).setup()
@@ -1486,3 +2250,48 @@ class TestGetService(BaseApplicationTest):
         data = json.loads(response.get_data())
         assert_equal(data['services']['supplierId'], 1)
         assert_equal(data['services']['supplierName'], u'Supplier 1')
+
+    def test_get_service_sets_validators(self):
+        response = self.client.get('/services/123-published-456')
+        assert_equal(200, response.status_code)
+        assert_is_not_none(response.headers.get('ETag'))
+
+    def test_get_service_with_matching_etag_is_not_modified(self):
+        response = self.client.get('/services/123-published-456')
+        etag = response.headers['ETag']
+
+        response = self.client.get('/services/123-published-456',
+                                   headers={'If-None-Match': etag})
+        assert_equal(304, response.status_code)
+        assert_equal(etag, response.headers['ETag'])
+        assert_equal(b'', response.get_data())
+
+    def test_get_service_with_stale_etag_is_returned(self):
+        response = self.client.get('/services/123-published-456',
+                                   headers={'If-None-Match': '"stale"'})
+        assert_equal(200, response.status_code)
+
+    def test_get_service_ignores_if_modified_since(self):
+        response = self.client.get(
+            '/services/123-published-456',
+            headers={'If-Modified-Since': 'Thu, 01 Jan 2099 00:00:00 GMT'})
+        assert_equal(200, response.status_code)
+        assert_not_in('Last-Modified', response.headers)
+
+    def test_get_service_etag_changes_with_supplier_name(self):
+        response = self.client.get('/services/123-published-456')
+        etag = response.headers['ETag']
+
+        with self.app.app_context():
+            supplier = Supplier.query.filter(Supplier.supplier_id == 1).one()
+            supplier.name = u"Renamed Supplier"
+            db.session.commit()
+
+        response = self.client.get('/services/123-published-456',
+                                   headers={'If-None-Match': etag})
+        assert_equal(200, response.status_code)
+
+    def test_get_expired_service_with_etag_is_404(self):
+        response = self.client.get('/services/123-expired-456',
+                                   headers={'If-None-Match': '*'})
+        assert_equal(404, response.status_code)
@@ -1,5 +1,5 @@
 from flask import json
-from nose.tools import assert_equal, assert_in
+from nose.tools import assert_equal, assert_in, assert_not_in
 
 from app import db
 from app.models import Supplier, ContactInformation, AuditEvent
@@ -39,6 +39,33 @@ class TestGetSupplier(BaseApplicationTest):
         assert_equal(self.supplier_id, data['suppliers']['id'])
         assert_equal(self.supplier['name'], data['suppliers']['name'])
 
+    def test_get_supplier_with_matching_etag_is_not_modified(self):
+        response = self.client.get('/suppliers/{}'.format(self.supplier_id))
+        etag = response.headers['ETag']
+
+        response = self.client.get('/suppliers/{}'.format(self.supplier_id),
+                                   headers={'If-None-Match': etag})
+        assert_equal(304, response.status_code)
+        assert_equal(b'', response.get_data())
+
+    def test_get_supplier_etag_changes_with_supplier(self):
+        response = self.client.get('/suppliers/{}'.format(self.supplier_id))
+        etag = response.headers['ETag']
+
+        response = self.client.post(
+            '/suppliers/{}'.format(self.supplier_id),
+            data=json.dumps({
+                'suppliers': {'name': 'New Name'},
+                'updated_by': 'supplier@user.dmdev'
+            }),
+            content_type='application/json')
+        assert_equal(200, response.status_code)
+
+        response = self.client.get('/suppliers/{}'.format(self.supplier_id),
+                                   headers={'If-None-Match': etag})
+        assert_equal(200, response.status_code)
+        assert_in('ETag', response.headers)
+
     def test_supplier_clients_exist(self):
         response = self.client.get('/suppliers/{}'.format(self.supplier_id))
 
@@ -81,6 +108,18 @@ class TestListSuppliers(BaseApplicationTest):
         response = self.client.get('/suppliers')
         assert_equal(200, response.status_code)
 
+    def test_list_suppliers_runs_a_constant_number_of_queries(self):
+        with self.recorded_queries() as statements:
+            response = self.client.get('/suppliers')
+        data = json.loads(response.get_data())
+
+        # The page of suppliers, all their contacts and the count
+        assert_equal(len(statements), 3)
+        assert_not_in('contact_information', statements[0])
+        assert_equal(len(data['suppliers']), 5)
+        assert_equal(data['suppliers'][0]['contactInformation'][0]['email'],
+                     u"0@contact.com")
+
     def test_query_string_prefix_empty(self):
         response = self.client.get('/suppliers?prefix=')
         assert_equal(200, response.status_code)
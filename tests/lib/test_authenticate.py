@@ -1,6 +1,13 @@
-from nose.tools import eq_
+import os
+import tempfile
 
-from app.authentication import get_token_from_headers
+import mock
+from nose.tools import eq_, assert_equal, assert_true, assert_false, \
+    assert_raises
+from werkzeug.exceptions import TooManyRequests
+
+from app.authentication import get_token_from_headers, TokenRegistry, \
+    LocalTokenBuckets, RateLimiter
 
 
 def test_get_token_from_headers():
@@ -15,3 +22,114 @@ def test_get_token_from_headers():
 
 def check_token(headers, expected_token, message=None):
     eq_(get_token_from_headers(headers), expected_token, message)
+
+
+class TestTokenRegistry(object):
+    def setup(self):
+        self._auth_tokens = os.environ.get('DM_API_AUTH_TOKENS')
+        os.environ['DM_API_AUTH_TOKENS'] = 'foo-bar:bar-foo'
+
+    def teardown(self):
+        if self._auth_tokens is None:
+            del os.environ['DM_API_AUTH_TOKENS']
+        else:
+            os.environ['DM_API_AUTH_TOKENS'] = self._auth_tokens
+
+    def test_is_valid(self):
+        registry = TokenRegistry()
+        assert_true(registry.is_valid('foo-bar'))
+        assert_true(registry.is_valid(u'bar-foo'))
+        assert_false(registry.is_valid('foo-ba'))
+        assert_false(registry.is_valid(u'b\xe4r-foo'))
+
+    def test_tokens_are_kept_until_reloaded(self):
+        registry = TokenRegistry()
+        registry.is_valid('foo-bar')
+        os.environ['DM_API_AUTH_TOKENS'] = 'baz'
+        assert_true(registry.is_valid('foo-bar'))
+
+        registry.reload()
+        assert_false(registry.is_valid('foo-bar'))
+        assert_true(registry.is_valid('baz'))
+
+    def test_tokens_are_read_from_the_tokens_file(self):
+        with tempfile.NamedTemporaryFile('w') as tokens_file:
+            tokens_file.write('file-token\nother-token:third-token\n')
+            tokens_file.flush()
+            registry = TokenRegistry(tokens_file.name)
+
+            assert_false(registry.is_valid('foo-bar'))
+            assert_true(registry.is_valid('file-token'))
+            assert_true(registry.is_valid('other-token'))
+            assert_true(registry.is_valid('third-token'))
+
+    def test_changes_to_the_tokens_file_are_read_on_reload(self):
+        with tempfile.NamedTemporaryFile('w') as tokens_file:
+            tokens_file.write('file-token')
+            tokens_file.flush()
+            registry = TokenRegistry(tokens_file.name)
+            assert_true(registry.is_valid('file-token'))
+
+            with open(tokens_file.name, 'w') as rewritten:
+                rewritten.write('new-token')
+            assert_true(registry.is_valid('file-token'))
+
+            registry.reload()
+            assert_false(registry.is_valid('file-token'))
+            assert_true(registry.is_valid('new-token'))
+
+    def test_missing_tokens_file_is_an_error(self):
+        registry = TokenRegistry('/nonexistent/auth-tokens')
+        assert_raises(IOError, registry.tokens)
+
+    def test_reload_does_not_take_the_lock(self):
+        registry = TokenRegistry()
+        registry.is_valid('foo-bar')
+        registry._lock = mock.MagicMock()
+
+        registry.reload()
+        assert_false(registry._lock.__enter__.called)
+
+
+def test_token_bucket_allows_bursts_then_refills():
+    buckets = LocalTokenBuckets()
+    with mock.patch('time.time', return_value=100.0):
+        assert_equal(buckets.take('key', 2, 2), 0)
+        assert_equal(buckets.take('key', 2, 2), 0)
+        assert_equal(buckets.take('key', 2, 2), 0.5)
+        assert_equal(buckets.take('other-key', 2, 2), 0)
+    with mock.patch('time.time', return_value=100.5):
+        assert_equal(buckets.take('key', 2, 2), 0)
+
+
+class TestRateLimiter(object):
+    def test_limits_the_rate_of_requests(self):
+        limiter = RateLimiter(rate=1, burst=1)
+        limiter.release(limiter.acquire('foo-bar'))
+        assert_raises(TooManyRequests, limiter.acquire, 'foo-bar')
+        limiter.acquire('bar-foo')
+
+    def test_limits_concurrent_requests(self):
+        limiter = RateLimiter(concurrency=2)
+        key = limiter.acquire('foo-bar')
+        limiter.acquire('foo-bar')
+        assert_raises(TooManyRequests, limiter.acquire, 'foo-bar')
+
+        limiter.release(key)
+        limiter.acquire('foo-bar')
+
+    def test_retry_after_is_rounded_up(self):
+        limiter = RateLimiter(rate=0.25, burst=1)
+        limiter.acquire('foo-bar')
+        try:
+            limiter.acquire('foo-bar')
+        except TooManyRequests as e:
+            assert_equal(e.retry_after, 4)
+        else:
+            raise AssertionError("Request wasn't limited")
+
+    def test_throttled_requests_are_not_counted_as_in_progress(self):
+        limiter = RateLimiter(rate=1, burst=1, concurrency=1)
+        limiter.release(limiter.acquire('foo-bar'))
+        assert_raises(TooManyRequests, limiter.acquire, 'foo-bar')
+        assert_equal(limiter._in_flight, {})
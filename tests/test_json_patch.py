@@ -0,0 +1,125 @@
+from __future__ import absolute_import
+
+from nose.tools import assert_equal, assert_raises, assert_true
+
+from app.json_patch import apply_patch, JsonPatchError
+
+
+def test_add_an_object_member():
+    assert_equal(
+        apply_patch({'foo': 'bar'},
+                    [{'op': 'add', 'path': '/baz', 'value': 'qux'}]),
+        {'foo': 'bar', 'baz': 'qux'})
+
+
+def test_add_an_array_element():
+    assert_equal(
+        apply_patch({'foo': ['bar', 'baz']},
+                    [{'op': 'add', 'path': '/foo/1', 'value': 'qux'}]),
+        {'foo': ['bar', 'qux', 'baz']})
+
+
+def test_add_to_the_end_of_an_array():
+    assert_equal(
+        apply_patch({'foo': ['bar']},
+                    [{'op': 'add', 'path': '/foo/-', 'value': 'qux'}]),
+        {'foo': ['bar', 'qux']})
+
+
+def test_remove_an_object_member():
+    assert_equal(
+        apply_patch({'baz': 'qux', 'foo': 'bar'},
+                    [{'op': 'remove', 'path': '/baz'}]),
+        {'foo': 'bar'})
+
+
+def test_remove_an_array_element():
+    assert_equal(
+        apply_patch({'foo': ['bar', 'qux', 'baz']},
+                    [{'op': 'remove', 'path': '/foo/1'}]),
+        {'foo': ['bar', 'baz']})
+
+
+def test_replace_a_value():
+    assert_equal(
+        apply_patch({'baz': 'qux', 'foo': 'bar'},
+                    [{'op': 'replace', 'path': '/baz', 'value': 'boo'}]),
+        {'baz': 'boo', 'foo': 'bar'})
+
+
+def test_move_a_value():
+    assert_equal(
+        apply_patch({'foo': {'bar': 'baz', 'waldo': 'fred'},
+                     'qux': {'corge': 'grault'}},
+                    [{'op': 'move', 'from': '/foo/waldo',
+                      'path': '/qux/thud'}]),
+        {'foo': {'bar': 'baz'},
+         'qux': {'corge': 'grault', 'thud': 'fred'}})
+
+
+def test_move_an_array_element():
+    assert_equal(
+        apply_patch({'foo': ['all', 'grass', 'cows', 'eat']},
+                    [{'op': 'move', 'from': '/foo/1', 'path': '/foo/3'}]),
+        {'foo': ['all', 'cows', 'eat', 'grass']})
+
+
+def test_copy_a_value():
+    assert_equal(
+        apply_patch({'foo': {'bar': 1}},
+                    [{'op': 'copy', 'from': '/foo', 'path': '/baz'}]),
+        {'foo': {'bar': 1}, 'baz': {'bar': 1}})
+
+
+def test_escaped_pointers():
+    assert_equal(
+        apply_patch({'a/b': 1, 'm~n': 2},
+                    [{'op': 'test', 'path': '/a~1b', 'value': 1},
+                     {'op': 'replace', 'path': '/m~0n', 'value': 3}]),
+        {'a/b': 1, 'm~n': 3})
+
+
+def test_the_original_document_is_not_changed():
+    document = {'foo': {'bar': [1, 2]}, 'baz': [3]}
+    patched = apply_patch(document, [
+        {'op': 'add', 'path': '/foo/bar/-', 'value': 3},
+        {'op': 'remove', 'path': '/baz/0'},
+    ])
+
+    assert_equal(document, {'foo': {'bar': [1, 2]}, 'baz': [3]})
+    assert_equal(patched, {'foo': {'bar': [1, 2, 3]}, 'baz': []})
+
+
+def test_unchanged_values_are_shared():
+    document = {'foo': {'bar': 1}, 'baz': ['big', 'list']}
+    patched = apply_patch(document,
+                          [{'op': 'replace', 'path': '/foo/bar', 'value': 2}])
+
+    assert_true(patched['baz'] is document['baz'])
+
+
+def assert_patch_error(document, operations):
+    assert_raises(JsonPatchError, apply_patch, document, operations)
+
+
+def test_invalid_patches_are_rejected():
+    document = {'foo': ['bar'], 'baz': 'qux'}
+    for operations in [
+        {'op': 'remove', 'path': '/baz'},
+        [{'op': 'remove'}],
+        [{'op': 'frobnicate', 'path': '/baz'}],
+        [{'op': 'add', 'path': '/quux'}],
+        [{'op': 'move', 'path': '/quux'}],
+        [{'op': 'remove', 'path': 'baz'}],
+        [{'op': 'remove', 'path': '/quux'}],
+        [{'op': 'replace', 'path': '/quux', 'value': 1}],
+        [{'op': 'add', 'path': '/quux/corge', 'value': 1}],
+        [{'op': 'add', 'path': '/foo/2', 'value': 1}],
+        [{'op': 'add', 'path': '/foo/01', 'value': 1}],
+        [{'op': 'remove', 'path': '/foo/-'}],
+        [{'op': 'remove', 'path': '/foo/1'}],
+        [{'op': 'move', 'from': '/foo', 'path': '/foo/0'}],
+        [{'op': 'test', 'path': '/baz', 'value': 'quux'}],
+        [{'op': 'remove', 'path': ''}],
+    ]:
+        yield assert_patch_error, document, operations
@@ -0,0 +1,89 @@
+from __future__ import absolute_import
+
+import os
+import json
+
+from nose.tools import assert_equal, assert_true, assert_false
+from jsonschema import Draft4Validator, ValidationError
+from jsonschema.validators import validator_for
+
+from app.schema_compiler import compile_schema
+from app.validation import _SCHEMAS, FORMAT_CHECKER, get_validator
+
+
+EXAMPLE_LISTING_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                    '..', 'example_listings'))
+
+EXAMPLE_SCHEMAS = [
+    ('G4', 'services-g4'),
+    ('G5', 'services-g5'),
+    ('G6-SCS', 'services-g6-scs'),
+    ('G6-SaaS', 'services-g6-saas'),
+    ('G6-PaaS', 'services-g6-paas'),
+    ('G6-IaaS', 'services-g6-iaas'),
+]
+
+_JSONSCHEMA_VALIDATORS = {}
+
+
+def load_example_listing(name):
+    with open(os.path.join(EXAMPLE_LISTING_PATH, '{}.json'.format(name))) as f:
+        return json.load(f)
+
+
+def first_error_message(validator, instance):
+    try:
+        validator.validate(instance)
+    except ValidationError as e:
+        return e.message
+
+
+def assert_same_result(schema_name, instance):
+    schema = _SCHEMAS[schema_name]
+    expected = validator_for(schema)(schema, format_checker=FORMAT_CHECKER)
+    compiled = compile_schema(schema, FORMAT_CHECKER)
+
+    assert_equal(first_error_message(compiled, instance),
+                 first_error_message(expected, instance))
+
+
+def mutations(listing):
+    yield listing
+    yield dict(listing, unexpectedField=True)
+    for key in sorted(listing):
+        yield dict((k, v) for k, v in listing.items() if k != key)
+        yield dict(listing, **{key: None})
+        yield dict(listing, **{key: ''})
+        yield dict(listing, **{key: []})
+        yield dict(listing, **{key: [u'', u'']})
+
+
+def test_compiled_validators_raise_the_same_errors_as_jsonschema():
+    for example, schema_name in EXAMPLE_SCHEMAS:
+        for instance in mutations(load_example_listing(example)):
+            yield assert_same_result, schema_name, instance
+
+
+def test_compiled_validators_check_formats():
+    for email in ['this@that.com', 'thisthat.com', 'this@t@hat.com', '']:
+        instance = {'emailAddress': email, 'password': 'password'}
+        yield assert_same_result, 'users-auth', instance
+
+
+def test_unsupported_keywords_fall_back_to_jsonschema():
+    schema = {
+        'definitions': {'positive': {'type': 'integer', 'minimum': 1}},
+        'type': 'object',
+        'properties': {'count': {'$ref': '#/definitions/positive'}},
+    }
+    validator = compile_schema(schema)
+
+    assert_true(validator.is_valid({'count': 1}))
+    assert_false(validator.is_valid({'count': 0}))
+    assert_equal(first_error_message(validator, {'count': 0}),
+                 first_error_message(Draft4Validator(schema), {'count': 0}))
+
+
+def test_get_validator_compiles_each_schema_once():
+    assert_true(get_validator('services-g6-iaas') is
+                get_validator('services-g6-iaas'))
@@ -3,11 +3,14 @@ from __future__ import absolute_import
 import os
 import json
 
+import mock
 from nose.tools import assert_equal
 from jsonschema import validate, SchemaError, ValidationError
 
 from app.validation import detect_framework, \
-    validates_against_schema, is_valid_service_id
+    validates_against_schema, is_valid_service_id, \
+    candidate_framework_schema, detect_framework_with_errors, \
+    reason_for_failure, schema_error, FRAMEWORK_SCHEMA_LABELS
 
 
 EXAMPLE_LISTING_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__),
@@ -204,6 +207,73 @@ def test_additional_fields_are_not_allowed():
         yield assert_example, example, detect_framework(data), expected
 
 
+def test_candidate_framework_schema():
+    cases = [
+        ("G4", "services-g4"),
+        ("G5", "services-g5"),
+        ("G6-SCS", "services-g6-scs"),
+        ("G6-SaaS", "services-g6-saas"),
+        ("G6-PaaS", "services-g6-paas"),
+        ("G6-IaaS", "services-g6-iaas"),
+    ]
+
+    for example, expected in cases:
+        data = load_example_listing(example)
+        yield assert_example, example, candidate_framework_schema(data), \
+            expected
+
+
+def test_no_candidate_framework_schema_for_unknown_services():
+    assert_equal(candidate_framework_schema({}), None)
+    assert_equal(candidate_framework_schema({'id': '6-G2-0123-456'}), None)
+    assert_equal(candidate_framework_schema(
+        {'lastUpdated': '2015-06-01', 'lot': 'DaaS'}), None)
+
+
+def test_detect_framework_only_validates_the_candidate_schema():
+    data = load_example_listing("G6-IaaS")
+    with mock.patch('app.validation.schema_error',
+                    wraps=schema_error) as validates:
+        assert_equal(detect_framework(data), "G-Cloud 6")
+
+    validates.assert_called_once_with('services-g6-iaas', data)
+
+
+def test_detect_framework_falls_back_to_every_schema():
+    data = load_example_listing("G6-IaaS")
+    data['lot'] = 'SaaS'
+    with mock.patch('app.validation.schema_error',
+                    wraps=schema_error) as validates:
+        assert_equal(detect_framework(data), False)
+
+    assert_equal(validates.call_count, 6)
+
+
+def test_detect_framework_with_errors_records_every_failure():
+    data = load_example_listing("G6-IaaS")
+    data['lot'] = 'SaaS'
+    framework, errors = detect_framework_with_errors(data)
+
+    assert_equal(framework, False)
+    assert_equal(sorted(errors), sorted(FRAMEWORK_SCHEMA_LABELS))
+    assert_equal(errors['services-g6-saas'],
+                 schema_error('services-g6-saas', data))
+
+
+def test_reason_for_failure_reuses_recorded_errors():
+    data = load_example_listing("G6-IaaS")
+    data['lot'] = 'SaaS'
+    framework, errors = detect_framework_with_errors(data)
+    with mock.patch('app.validation.schema_error',
+                    wraps=schema_error) as validates:
+        reason = reason_for_failure(data, errors)
+
+    assert_equal(validates.call_count, 0)
+    assert_equal(reason, reason_for_failure(data))
+    assert reason.startswith('Not G4: ')
+    assert 'Not SaaS: {}'.format(errors['services-g6-saas']) in reason
+
+
 def assert_example(name, result, expected):
     assert_equal(result, expected)
 